@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Admission control for video generation
+"""
+
+import math
+import logging
+import threading
+from typing import Dict, Optional
+
+class AdmissionController:
+    """Bound how much generation work this process accepts.
+
+    A request first ``try_enter``s, which fails fast once ``max_concurrent``
+    running plus ``max_queue`` waiting requests are in the system. Admitted
+    requests then ``wait_for_slot`` before running and ``finish`` afterwards.
+    Finished jobs feed an EWMA of service time; with the concurrency limit
+    that gives the drain rate ``retry_after`` uses to estimate how long the
+    current backlog takes to clear.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 8,
+                 initial_service_seconds: float = 30.0, smoothing: float = 0.2):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.smoothing = smoothing
+        self.logger = logging.getLogger(__name__)
+        self._condition = threading.Condition()
+        self._in_system = 0
+        self._running = 0
+        self._service_seconds = initial_service_seconds
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_concurrent + self.max_queue
+
+    def try_enter(self) -> bool:
+        """Reserve a place in the queue, or return False if it is full"""
+        with self._condition:
+            if self._in_system >= self.capacity:
+                self.rejected += 1
+                return False
+            self._in_system += 1
+            self.admitted += 1
+            return True
+
+    def wait_for_slot(self, timeout: Optional[float] = None) -> bool:
+        """Block until a run slot is free; on timeout the queue place is given up"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._running < self.max_concurrent, timeout):
+                self.timed_out += 1
+                self._in_system -= 1
+                self._condition.notify_all()
+                return False
+            self._running += 1
+            return True
+
+    def leave(self):
+        """Give up a queue place that never got to run"""
+        with self._condition:
+            self._in_system -= 1
+            self._condition.notify_all()
+
+    def finish(self, service_seconds: Optional[float] = None):
+        """Release the run slot taken by wait_for_slot"""
+        with self._condition:
+            self._running -= 1
+            self._in_system -= 1
+            self.completed += 1
+            if service_seconds is not None:
+                self._service_seconds += self.smoothing * (service_seconds - self._service_seconds)
+            self._condition.notify_all()
+
+    def retry_after(self) -> int:
+        """Seconds until a place in the queue is likely to open up"""
+        with self._condition:
+            # A retry lands behind everything already waiting
+            waiting = self._in_system - self._running
+            seconds = (waiting + 1) * self._service_seconds / self.max_concurrent
+        return min(max(math.ceil(seconds), 1), 300)
+
+    def get_stats(self) -> Dict:
+        with self._condition:
+            return {
+                'running': self._running,
+                'queued': self._in_system - self._running,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'avg_service_seconds': self._service_seconds,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'completed': self.completed
+            }
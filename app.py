@@ -1,14 +1,20 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, url_for, redirect, stream_with_context
 import os
+import time
+import uuid
 import logging
 from datetime import datetime
 from werkzeug.utils import secure_filename
+from werkzeug.http import parse_range_header
 from config import config
-from voice_providers import get_voice_provider
-from video_generator import VideoGenerator
-from utils import validate_input, cleanup_old_files
+from voice_providers import get_provider_registry
+from video_generator import VideoGenerator, background_cache
+from utils import validate_input
 from monitoring import time_request, UsageTracker
 from storage_manager import StorageManager
+from jobs import JobStore, JobManager, job_event_stream, JOB_ID_PATTERN, FINISHED_STATUSES
+from result_cache import ResultCache, request_fingerprint
+from admission import AdmissionController
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +23,51 @@ logger = logging.getLogger(__name__)
 # Global usage tracker
 usage_tracker = UsageTracker()
 
+def extract_generation_data(form):
+    """Build the generation request from submitted form fields"""
+    return {
+        'text': form.get('text', '').strip(),
+        'title': form.get('title', '').strip(),
+        'color_template': form.get('colorTemplate', 'purple_blue'),
+        'title_font': form.get('titleFont', 'msyh'),
+        'body_font': form.get('bodyFont', 'msyh'),
+        'voice_provider': form.get('voiceProvider', 'openai'),
+        'voice': form.get('voice', 'alloy'),
+        'voice_speed': float(form.get('voiceSpeed', '1.0')),
+        'voice_stability': float(form.get('voiceStability', '0.5'))
+    }
+
+def make_base_filename(title):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Cached re-muxes finish well within a second, so the timestamp alone can collide
+    return secure_filename(f"{title}_{timestamp}_{uuid.uuid4().hex[:8]}")
+
+def output_download_response(backend, key, range_header=None):
+    """Serve an output from a storage backend: redirect to it, or proxy it with range support"""
+    url = backend.download_url(key)
+    if url:
+        return redirect(url, 302)
+    stat = backend.stat(key)
+    if stat is None:
+        return jsonify({'error': 'Video not found'}), 404
+    size = stat[0]
+    
+    requested = parse_range_header(range_header) if range_header else None
+    byte_range = requested.range_for_length(size) if requested else None
+    if requested and byte_range is None:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+    start, stop = byte_range or (0, size)
+    
+    response = Response(backend.read_range(key, start, stop - 1), status=206 if byte_range else 200,
+                        mimetype='video/mp4', direct_passthrough=True)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Length'] = str(stop - start)
+    if byte_range:
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    return response
+
 def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
@@ -27,38 +78,82 @@ def create_app(config_name='default'):
     
     # Initialize video generator
     video_gen = VideoGenerator(app.config)
+    # Once per web process: drop scratch and staged files left by dead processes
+    video_gen.workspaces.sweep_stale()
+    video_gen.output_store.sweep_staging()
+    
+    # Voice providers are built once per process and reused across requests
+    provider_registry = get_provider_registry(app.config)
     
     # Initialize storage manager
     storage_manager = StorageManager(
         output_folder=app.config['UPLOAD_FOLDER'],
-        max_age_hours=24,
-        max_storage_gb=5.0
+        max_age_hours=app.config['STORAGE_MAX_AGE_HOURS'],
+        max_storage_gb=app.config['STORAGE_MAX_GB'],
+        catalog_path=app.config['STORAGE_CATALOG_PATH'],
+        eviction_policy=app.config['STORAGE_EVICTION_POLICY'],
+        backend=video_gen.output_store.backend
     )
     
-    # Start scheduled cleanup (every 6 hours)
-    storage_manager.start_scheduled_cleanup(interval_hours=6)
+    # Start scheduled cleanup; only the worker holding the lock runs it
+    if app.config['SCHEDULED_CLEANUP']:
+        storage_manager.start_scheduled_cleanup(
+            interval_hours=app.config['CLEANUP_INTERVAL_HOURS'],
+            lock_path=app.config['CLEANUP_LOCK_PATH']
+        )
+    
+    @app.after_request
+    def record_output_access(response):
+        # Downloads and plays feed the eviction policy; a player's follow-up
+        # range requests within the same file count only once
+        if request.method == 'GET' and response.status_code in (200, 206, 302, 304):
+            path = video_gen.output_store.path_from_url(request.path)
+            range_header = request.headers.get('Range', '')
+            if path and (not range_header or range_header.startswith('bytes=0-')):
+                storage_manager.record_access(path)
+        return response
+    
+    @app.route('/outputs/<path:key>')
+    def download_output(key):
+        # Outputs in a remote backend; local ones are plain static files
+        if video_gen.output_store.path_from_key(key) is None:
+            return jsonify({'error': 'Video not found'}), 404
+        return output_download_response(video_gen.output_store.backend, key, request.headers.get('Range'))
     
     @app.route('/')
     def index():
         # Check provider availability
         available_providers = {}
         for provider_name in ['openai', 'elevenlabs', 'google', 'azure']:
-            provider = get_voice_provider(provider_name, app.config)
-            available_providers[provider_name] = provider.is_available() if provider else False
+            available_providers[provider_name] = provider_registry.is_available(provider_name)
         
         return render_template('index.html', available_providers=available_providers)
     
     @app.route('/api/voices/<provider>')
     def get_voices(provider):
-        voice_provider = get_voice_provider(provider, app.config)
-        if not voice_provider:
+        voices = provider_registry.get_voice_list(provider)
+        if voices is None:
             return jsonify({'error': 'Provider not found'}), 404
         
-        return jsonify({'voices': voice_provider.get_voice_list()})
+        return jsonify({'voices': voices})
     
     @app.route('/api/stats')
     def get_stats():
-        return jsonify(usage_tracker.get_stats())
+        stats = usage_tracker.get_stats()
+        stats['background_cache'] = background_cache.get_stats()
+        if video_gen.tts_cache:
+            stats['tts_cache'] = video_gen.tts_cache.get_stats()
+        if video_gen.card_cache:
+            stats['card_cache'] = video_gen.card_cache.get_stats()
+        if video_gen.track_cache:
+            stats['video_track_cache'] = video_gen.track_cache.get_stats()
+        stats['admission'] = admission.get_stats()
+        stats['result_cache'] = result_cache.get_stats()
+        stats['resources'] = video_gen.scheduler.get_stats()
+        stats['workspaces'] = video_gen.workspaces.get_stats()
+        if video_gen.worker_pool:
+            stats['encode_workers'] = video_gen.worker_pool.get_stats()
+        return jsonify(stats)
     
     @app.route('/api/storage')
     def get_storage_stats():
@@ -72,11 +167,65 @@ def create_app(config_name='default'):
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
     
+    # Bounded concurrency and queue depth for generation in this process
+    admission = AdmissionController(
+        max_concurrent=app.config['GENERATION_MAX_CONCURRENT'],
+        max_queue=app.config['GENERATION_MAX_QUEUE']
+    )
+    
+    # Identical requests share one finished (or in-flight) video
+    result_cache = ResultCache(app.config['RESULT_CACHE_DIR'], exists=video_gen.output_store.exists)
+    
+    def busy_response():
+        retry_after = admission.retry_after()
+        usage_tracker.track_rejection()
+        response = jsonify({'error': 'Server is busy, please try again shortly', 'retry_after': retry_after})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+    
+    def run_generation(data, base_filename, report=None):
+        """Generate one video and record usage; shared by /generate and background jobs.
+
+        The caller must already hold a run slot from ``admission``.
+        """
+        start_time = time.time()
+        try:
+            result = video_gen.generate_video(data, base_filename, report)
+        finally:
+            admission.finish(time.time() - start_time)
+        
+        # Track usage
+        usage_tracker.track_request(success=result['success'], generation_time=time.time() - start_time)
+        usage_tracker.track_stage_timings(result.get('timings'))
+        
+        if result['success']:
+            # Catalog the new output; this only evicts when over the byte budget
+            storage_manager.record_output(result['video_path'])
+            if not result['new_output']:
+                # The same bytes were already stored; count this as a use of
+                # them, since a bucket object keeps its original date
+                storage_manager.record_access(result['video_path'])
+            storage_manager.enforce_budget(keep=[result['video_path']])
+            result['video_url'] = video_gen.output_store.url_for(result['video_path'])
+            result_cache.store(request_fingerprint(data), result['video_path'], result['video_url'])
+        return result
+    
+    # Background jobs run on a bounded pool so HTTP workers stay free;
+    # each waits for a run slot while still reported as queued
+    def release_job_claim(job_id, data):
+        result_cache.release(request_fingerprint(data), job_id)
+    
+    job_manager = JobManager(
+        JobStore(app.config['JOB_STATE_DIR']),
+        run_generation,
+        max_workers=app.config['GENERATION_WORKERS'],
+        on_finished=release_job_claim,
+        before_run=admission.wait_for_slot
+    )
+    
     @app.route('/generate', methods=['POST'])
     @time_request
     def generate_video():
-        start_time = datetime.now()
-        
         try:
             # Validate input
             validation_error = validate_input(request.form, app.config)
@@ -84,37 +233,38 @@ def create_app(config_name='default'):
                 usage_tracker.track_request(success=False)
                 return jsonify({'error': validation_error}), 400
             
-            # Extract form data
-            data = {
-                'text': request.form.get('text', '').strip(),
-                'title': request.form.get('title', '').strip(),
-                'color_template': request.form.get('colorTemplate', 'purple_blue'),
-                'title_font': request.form.get('titleFont', 'msyh'),
-                'body_font': request.form.get('bodyFont', 'msyh'),
-                'voice_provider': request.form.get('voiceProvider', 'openai'),
-                'voice': request.form.get('voice', 'alloy'),
-                'voice_speed': float(request.form.get('voiceSpeed', '1.0')),
-                'voice_stability': float(request.form.get('voiceStability', '0.5'))
-            }
+            data = extract_generation_data(request.form)
+            base_filename = make_base_filename(data['title'])
             
-            # Generate unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_filename = secure_filename(f"{data['title']}_{timestamp}")
+            # Identical requests reuse the finished video, or wait for the one in flight
+            fingerprint = request_fingerprint(data)
+            video_url = result_cache.lookup(fingerprint)
+            owner = f"request-{uuid.uuid4().hex}"
+            if not video_url and result_cache.claim(fingerprint, owner) is not None:
+                video_url = result_cache.wait(fingerprint, app.config['RESULT_WAIT_SECONDS'])
+                # The owner failed or is still going: render only if the work is now ours
+                if not video_url and result_cache.claim(fingerprint, owner) is not None:
+                    return busy_response()
+            if video_url:
+                usage_tracker.track_request(success=True)
+                return jsonify({'success': True, 'video_url': video_url})
             
-            # Generate video
-            result = video_gen.generate_video(data, base_filename)
-            
-            # Track usage
-            generation_time = (datetime.now() - start_time).total_seconds()
-            usage_tracker.track_request(success=result['success'], generation_time=generation_time)
+            try:
+                # Fail fast when the queue is full instead of timing out later
+                if not admission.try_enter():
+                    return busy_response()
+                if not admission.wait_for_slot(timeout=app.config['GENERATION_QUEUE_TIMEOUT']):
+                    return busy_response()
+                
+                # Generate video
+                result = run_generation(data, base_filename)
+            finally:
+                result_cache.release(fingerprint, owner)
             
             if result['success']:
-                # Cleanup old files (keep last 10)
-                cleanup_old_files(app.config['UPLOAD_FOLDER'], keep_count=10)
-                
                 return jsonify({
                     'success': True,
-                    'video_url': f'/static/outputs/{base_filename}.mp4'
+                    'video_url': result['video_url']
                 })
             else:
                 return jsonify({'error': result['error']}), 500
@@ -124,6 +274,102 @@ def create_app(config_name='default'):
             usage_tracker.track_request(success=False)
             return jsonify({'error': 'Internal server error'}), 500
     
+    def job_accepted_response(job_id, status):
+        status_url = url_for('get_job', job_id=job_id)
+        response = jsonify({
+            'job_id': job_id,
+            'status': status,
+            'status_url': status_url,
+            'events_url': url_for('job_events', job_id=job_id),
+            'result_url': url_for('get_job_result', job_id=job_id)
+        })
+        response.headers['Location'] = status_url
+        return response, 202
+    
+    @app.route('/api/jobs', methods=['POST'])
+    def submit_job():
+        try:
+            validation_error = validate_input(request.form, app.config)
+            if validation_error:
+                usage_tracker.track_request(success=False)
+                return jsonify({'error': validation_error}), 400
+            
+            data = extract_generation_data(request.form)
+            fingerprint = request_fingerprint(data)
+            
+            # A finished identical request becomes an already-succeeded job
+            video_url = result_cache.lookup(fingerprint)
+            if video_url:
+                usage_tracker.track_request(success=True)
+                return job_accepted_response(job_manager.add_completed(video_url), 'succeeded')
+            
+            # An identical job in flight is shared rather than started again
+            job_id = uuid.uuid4().hex
+            current = result_cache.claim(fingerprint, job_id)
+            if current is not None and JOB_ID_PATTERN.match(current):
+                existing = job_manager.get(current)
+                if existing and existing['status'] in FINISHED_STATUSES:
+                    # Its owner finished without releasing the claim
+                    result_cache.release(fingerprint, current)
+                    current = result_cache.claim(fingerprint, job_id)
+                elif existing:
+                    return job_accepted_response(current, existing['status'])
+            if current is not None:
+                # Held by a /generate request, or by a job not recorded yet:
+                # follow its result rather than render the same video twice
+                follower = job_manager.add_follower(
+                    lambda: result_cache.wait(fingerprint, app.config['RESULT_WAIT_SECONDS']))
+                return job_accepted_response(follower, 'queued')
+            
+            if not admission.try_enter():
+                result_cache.release(fingerprint, job_id)
+                return busy_response()
+            try:
+                job_manager.submit(data, make_base_filename(data['title']), job_id=job_id)
+            except Exception:
+                admission.leave()
+                result_cache.release(fingerprint, job_id)
+                raise
+        except Exception as e:
+            logger.error(f"Job submission error: {str(e)}")
+            return jsonify({'error': 'Internal server error'}), 500
+        
+        return job_accepted_response(job_id, 'queued')
+    
+    @app.route('/api/jobs/<job_id>')
+    def get_job(job_id):
+        job = job_manager.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+    
+    @app.route('/api/jobs/<job_id>/result')
+    def get_job_result(job_id):
+        job = job_manager.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        if job['status'] == 'succeeded':
+            return jsonify({'success': True, 'video_url': job['video_url']})
+        if job['status'] == 'failed':
+            return jsonify({'error': job['error']}), 500
+        return jsonify({'status': job['status']}), 202
+    
+    @app.route('/api/jobs/<job_id>/events')
+    def job_events(job_id):
+        if not job_manager.get(job_id):
+            return jsonify({'error': 'Job not found'}), 404
+        
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        stream = job_event_stream(
+            job_manager.store, job_id,
+            last_event_id=int(last_event_id) if last_event_id.isdigit() else None,
+            max_seconds=app.config['JOB_EVENTS_MAX_SECONDS']
+        )
+        response = Response(stream_with_context(stream), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer events
+        return response
+    
     @app.errorhandler(413)
     def too_large(e):
         return jsonify({'error': 'File too large'}), 413
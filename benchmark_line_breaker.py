@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the line breaker against the previous wrap_text
+Usage: python benchmark_line_breaker.py
+"""
+
+import time
+from video_generator import VideoGenerator, FontMetrics
+from line_breaker import break_lines
+
+ENGLISH_QUOTE = ("The only way to do great work is to love what you do. If you haven't found it yet, "
+                 "keep looking. Don't settle. As with all matters of the heart, you'll know when you find it. ")
+CHINESE_QUOTE = "千里之行，始于足下。合抱之木，生于毫末；九层之台，起于累土。知人者智，自知者明。胜人者有力，自胜者强。"
+
+def legacy_wrap_text(text, font, max_width):
+    """wrap_text as it was before the prefix-sum line breaker"""
+    if not text.strip():
+        return ['']
+    
+    words = text.split()
+    lines = []
+    current_line = []
+    
+    for word in words:
+        test_line = current_line + [word]
+        test_text = ' '.join(test_line)
+        test_width = font.getbbox(test_text)[2]
+        
+        if test_width <= max_width:
+            current_line.append(word)
+        else:
+            if current_line:
+                lines.append(' '.join(current_line))
+                current_line = [word]
+            else:
+                if font.getbbox(word)[2] > max_width:
+                    chars = list(word)
+                    current_chars = []
+                    for char in chars:
+                        test_chars = current_chars + [char]
+                        test_text = ''.join(test_chars)
+                        if font.getbbox(test_text)[2] <= max_width:
+                            current_chars.append(char)
+                        else:
+                            if current_chars:
+                                lines.append(''.join(current_chars))
+                            current_chars = [char]
+                    if current_chars:
+                        current_line = [''.join(current_chars)]
+                else:
+                    current_line = [word]
+    
+    if current_line:
+        lines.append(' '.join(current_line))
+    
+    return lines if lines else ['']
+
+def time_call(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    video_gen = VideoGenerator({'UPLOAD_FOLDER': 'static/outputs'})
+    max_width = 880
+    cases = [
+        ('English, 2000 chars', (ENGLISH_QUOTE * 20)[:2000], 'roboto'),
+        ('Chinese, 2000 chars', (CHINESE_QUOTE * 40)[:2000], 'msyh')
+    ]
+    
+    print("📏 Line breaker benchmark (best of 3, cold measurement cache)")
+    for name, text, font_key in cases:
+        for size in (60, 30):
+            font = video_gen.get_font(font_key, size)
+            
+            legacy_time, legacy_lines = time_call(lambda: legacy_wrap_text(text, font, max_width))
+            
+            def run_new():
+                # Fresh metrics so the new path gets no head start from caching
+                metrics = FontMetrics(font)
+                return break_lines(text, metrics.char_width, max_width, metrics.text_width)
+            new_time, new_lines = time_call(run_new)
+            
+            print(f"   {name} @ {size}pt: legacy {legacy_time * 1000:.1f}ms ({len(legacy_lines)} lines), "
+                  f"new {new_time * 1000:.1f}ms ({len(new_lines)} lines), "
+                  f"speedup {legacy_time / max(new_time, 1e-9):.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Parallel sentence-chunked speech synthesis for long quotes
+"""
+
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from voice_providers import VoiceProvider
+
+# Formats whose streams can be joined by concatenating frames
+CONCAT_FORMATS = ('mp3', 'aac')
+
+SENTENCE_END = re.compile(r'(?<=[.!?;。！？；…])\s*')
+CLAUSE_END = re.compile(r'(?<=[,:，、：])\s*')
+
+logger = logging.getLogger(__name__)
+
+def _pack(pieces: List[str], max_chars: int, joiner: str) -> List[str]:
+    """Greedily pack pieces into chunks of at most max_chars"""
+    chunks = []
+    current = ''
+    for piece in pieces:
+        candidate = f"{current}{joiner}{piece}" if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+        else:
+            if current:
+                chunks.append(current)
+            current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _split_oversized(sentence: str, max_chars: int) -> List[str]:
+    """Split a single sentence longer than max_chars at clauses, then words, then characters"""
+    pieces = []
+    for clause in (part for part in CLAUSE_END.split(sentence) if part):
+        if len(clause) <= max_chars:
+            pieces.append(clause)
+            continue
+        for word in _pack(clause.split(' '), max_chars, ' '):
+            pieces.extend(word[i:i + max_chars] for i in range(0, len(word), max_chars))
+    return _pack(pieces, max_chars, ' ')
+
+def split_into_chunks(text: str, max_chars: int) -> List[str]:
+    """Split text at sentence boundaries into chunks of at most max_chars"""
+    text = ' '.join(text.split())
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    sentences = []
+    for sentence in (part for part in SENTENCE_END.split(text) if part):
+        if len(sentence) <= max_chars:
+            sentences.append(sentence)
+        else:
+            sentences.extend(_split_oversized(sentence, max_chars))
+    return _pack(sentences, max_chars, ' ')
+
+# Bitrates (kbps) for MPEG-1 and MPEG-2/2.5 Layer III, indexed by the header's bitrate field
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+}
+MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],   # MPEG-1
+    2: [22050, 24000, 16000],   # MPEG-2
+    0: [11025, 12000, 8000]     # MPEG-2.5
+}
+
+def mp3_frame_length(header: bytes) -> Optional[int]:
+    """Length in bytes of the Layer III frame starting with this 4-byte header"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    samples_factor = 144 if version == 3 else 72
+    return samples_factor * bitrate // sample_rate + padding
+
+def mp3_info_offset(header: bytes) -> int:
+    """Where a Xing/Info tag sits in a frame: after the header, any CRC and the side info"""
+    version = (header[1] >> 3) & 0x03
+    mono = (header[3] >> 6) == 3
+    crc = 0 if header[1] & 0x01 else 2
+    if version == 3:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    return 4 + crc + side_info
+
+def strip_audio_container(data: bytes, audio_format: str) -> bytes:
+    """Drop ID3 tags (and the MP3 Xing/Info/VBRI header frame) so streams can be joined"""
+    # ID3v2 tag: 10-byte header with a syncsafe size, plus optional footer
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    # ID3v1 tag at the end
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+
+    if audio_format == 'mp3':
+        frame_length = mp3_frame_length(data[:4])
+        if frame_length:
+            first_frame = data[:frame_length]
+            offset = mp3_info_offset(first_frame)
+            # The info frame describes only its own chunk, so it must go
+            if first_frame[offset:offset + 4] in (b'Xing', b'Info') or first_frame[36:40] == b'VBRI':
+                data = data[frame_length:]
+    return data
+
+def concatenate_audio(chunk_paths: List[str], output_path: str, audio_format: str):
+    """Join MP3 or ADTS AAC chunk files frame-accurately, without re-encoding"""
+    with open(output_path, 'wb') as out:
+        for path in chunk_paths:
+            with open(path, 'rb') as f:
+                out.write(strip_audio_container(f.read(), audio_format))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_synthesis_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Process-wide bounded pool for chunk synthesis requests"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tts-chunk')
+        return _executor
+
+class ChunkedVoiceProvider(VoiceProvider):
+    """Wrap a VoiceProvider so long text is synthesized as concurrent sentence chunks.
+
+    Text longer than ``chunk_chars`` (or the provider's per-request limit) is
+    split at sentence boundaries, the chunks are synthesized in parallel on a
+    bounded pool, and the results are concatenated losslessly.
+    """
+
+    def __init__(self, provider: VoiceProvider, chunk_chars: int = 400, max_workers: int = 4):
+        self.provider = provider
+        self.model = provider.model
+        self.max_workers = max_workers
+        self.chunk_chars = min(chunk_chars, provider.MAX_REQUEST_CHARS)
+
+    def generate_speech(self, text: str, voice: str, output_path: str, **kwargs) -> bool:
+        audio_format = kwargs.get('audio_format', 'mp3')
+        chunks = split_into_chunks(text, self.chunk_chars)
+        if len(chunks) <= 1 or audio_format not in CONCAT_FORMATS:
+            return self.provider.generate_speech(text, voice, output_path, **kwargs)
+
+        executor = get_synthesis_executor(self.max_workers)
+        root, extension = os.path.splitext(output_path)
+        chunk_paths = [f"{root}.part{i}{extension}" for i in range(len(chunks))]
+        try:
+            futures = [
+                executor.submit(self.provider.generate_speech, chunk, voice, path, **kwargs)
+                for chunk, path in zip(chunks, chunk_paths)
+            ]
+            results = [future.result() for future in futures]
+            if not all(results):
+                logger.error(f"Chunked synthesis failed for {results.count(False)} of {len(chunks)} chunks")
+                return False
+
+            concatenate_audio(chunk_paths, output_path, audio_format)
+            return True
+        finally:
+            for path in chunk_paths:
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def supported_formats(self) -> list:
+        return self.provider.supported_formats()
+
+    def is_available(self) -> bool:
+        return self.provider.is_available()
+
+    def get_voice_list(self) -> list:
+        return self.provider.get_voice_list()
@@ -17,9 +17,100 @@ class Config:
     AZURE_SPEECH_KEY = os.environ.get('AZURE_SPEECH_KEY')
     AZURE_SPEECH_REGION = os.environ.get('AZURE_SPEECH_REGION', 'eastus')
     
+    # Keep-alive connections per TTS provider host
+    TTS_HTTP_POOL_SIZE = int(os.environ.get('TTS_HTTP_POOL_SIZE', 10))
+    
     # Text limits
     MAX_TEXT_LENGTH = int(os.environ.get('MAX_TEXT_LENGTH', 2000))
     MAX_TITLE_LENGTH = int(os.environ.get('MAX_TITLE_LENGTH', 100))
+    
+    # Background generation jobs
+    GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', 2))
+    JOB_STATE_DIR = os.environ.get('JOB_STATE_DIR', os.path.join(os.path.dirname(__file__), 'cache', 'jobs'))
+    # Progress streams close after this long and the browser reconnects,
+    # so a watcher holds a gthread thread briefly rather than for the whole job
+    JOB_EVENTS_MAX_SECONDS = int(os.environ.get('JOB_EVENTS_MAX_SECONDS', 25))
+    
+    # Admission control, per worker process: beyond this many running plus
+    # queued generations requests get 429 with a Retry-After estimate
+    GENERATION_MAX_CONCURRENT = int(os.environ.get('GENERATION_MAX_CONCURRENT', 2))
+    GENERATION_MAX_QUEUE = int(os.environ.get('GENERATION_MAX_QUEUE', 8))
+    # Longest a synchronous /generate request waits in the queue before a 429
+    GENERATION_QUEUE_TIMEOUT = int(os.environ.get('GENERATION_QUEUE_TIMEOUT', 30))
+    
+    # Index of generated outputs with running size totals, shared by all workers
+    STORAGE_CATALOG_PATH = os.environ.get('STORAGE_CATALOG_PATH', os.path.join(os.path.dirname(__file__), 'cache', 'storage_catalog.db'))
+    # Output byte budget, evicted in policy order: lru, lfu or gdsf (GreedyDual-Size-Frequency),
+    # using recorded downloads and plays; outputs unused for STORAGE_MAX_AGE_HOURS always go
+    STORAGE_MAX_GB = float(os.environ.get('STORAGE_MAX_GB', 5.0))
+    STORAGE_MAX_AGE_HOURS = int(os.environ.get('STORAGE_MAX_AGE_HOURS', 24))
+    STORAGE_EVICTION_POLICY = os.environ.get('STORAGE_EVICTION_POLICY', 'gdsf')
+    # Scheduled cleanup runs in whichever worker holds this file lock; set
+    # SCHEDULED_CLEANUP=false to leave it to cron (python storage_manager.py cleanup)
+    SCHEDULED_CLEANUP = os.environ.get('SCHEDULED_CLEANUP', 'true').lower() == 'true'
+    CLEANUP_INTERVAL_HOURS = int(os.environ.get('CLEANUP_INTERVAL_HOURS', 6))
+    CLEANUP_LOCK_PATH = os.environ.get('CLEANUP_LOCK_PATH', os.path.join(os.path.dirname(__file__), 'cache', 'cleanup.lock'))
+    
+    # Where finished videos are kept: 'local' (UPLOAD_FOLDER) or 's3', any S3-compatible
+    # store (needs boto3; credentials come from the usual AWS_* variables). S3 outputs
+    # are uploaded while they encode and served from /outputs by redirecting to a
+    # presigned URL, or proxied through the app when S3_REDIRECT_DOWNLOADS=false
+    OUTPUT_STORAGE_BACKEND = os.environ.get('OUTPUT_STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET', '')
+    S3_PREFIX = os.environ.get('S3_PREFIX', 'outputs')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', '')
+    S3_REGION = os.environ.get('S3_REGION', '')
+    S3_PART_SIZE_MB = int(os.environ.get('S3_PART_SIZE_MB', 8))
+    S3_REDIRECT_DOWNLOADS = os.environ.get('S3_REDIRECT_DOWNLOADS', 'true').lower() == 'true'
+    S3_URL_EXPIRES = int(os.environ.get('S3_URL_EXPIRES', 3600))
+    
+    # Finished videos keyed by request fingerprint; duplicates in flight wait this long
+    RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'cache', 'results'))
+    RESULT_WAIT_SECONDS = int(os.environ.get('RESULT_WAIT_SECONDS', 120))
+    
+    # Video encoding
+    STILL_IMAGE_FPS = int(os.environ.get('STILL_IMAGE_FPS', 1))
+    RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 2))
+    # Spawned processes that render cards and drive ffmpeg, each replaced after this
+    # many tasks or once its RSS passes the ceiling. Off by default: every web worker
+    # starts its own pool, so enabling it adds up to ENCODE_WORKERS x
+    # ENCODE_WORKER_MAX_RSS_MB per web worker on top of ENCODE_MEMORY_BUDGET_MB
+    ENCODE_WORKERS = int(os.environ.get('ENCODE_WORKERS', 0))
+    ENCODE_WORKER_MAX_JOBS = int(os.environ.get('ENCODE_WORKER_MAX_JOBS', 50))
+    ENCODE_WORKER_MAX_RSS_MB = int(os.environ.get('ENCODE_WORKER_MAX_RSS_MB', 400))
+    ENCODE_WORKER_TIMEOUT = int(os.environ.get('ENCODE_WORKER_TIMEOUT', 300))
+    # Pipe the rendered card to ffmpeg as raw RGB instead of writing a PNG
+    DISKLESS_PIPELINE = os.environ.get('DISKLESS_PIPELINE', 'true').lower() == 'true'
+    # Every job gets its own scratch directory here (default /dev/shm/quote-speak/<host>),
+    # falling back to the system temp directory's quote-speak/<host> when less than
+    # WORKSPACE_MIN_FREE_MB is free. A directory set here is swept, so give the app its own
+    PIPELINE_SCRATCH_DIR = os.environ.get('PIPELINE_SCRATCH_DIR')
+    WORKSPACE_MIN_FREE_MB = int(os.environ.get('WORKSPACE_MIN_FREE_MB', 32))
+    # Gunicorn worker processes (gunicorn reads WEB_CONCURRENCY too); each has its
+    # own encode scheduler, so the memory budget below is per worker
+    WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+    # Memory each worker's scheduler reserves for encodes from the cost model;
+    # 0 means half of the container's memory limit (or RAM) split across WEB_WORKERS
+    ENCODE_MEMORY_BUDGET_MB = int(os.environ.get('ENCODE_MEMORY_BUDGET_MB', 0))
+    # CPU work allowed in flight, in seconds per core
+    ENCODE_CPU_HORIZON_SECONDS = int(os.environ.get('ENCODE_CPU_HORIZON_SECONDS', 10))
+    # Longest a job waits for its encode budget (taken after speech is synthesized) before failing
+    RESOURCE_WAIT_SECONDS = int(os.environ.get('RESOURCE_WAIT_SECONDS', 60))
+    
+    # Synthesized speech cache (set TTS_CACHE_MAX_MB=0 to disable)
+    TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'cache', 'tts'))
+    TTS_CACHE_MAX_MB = int(os.environ.get('TTS_CACHE_MAX_MB', 500))
+    
+    # Rendered cards and video-only tracks, so a voice-only change just re-muxes audio
+    CARD_CACHE_DIR = os.environ.get('CARD_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'cache', 'cards'))
+    CARD_CACHE_MAX_MB = int(os.environ.get('CARD_CACHE_MAX_MB', 200))
+    VIDEO_TRACK_CACHE_DIR = os.environ.get('VIDEO_TRACK_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'cache', 'tracks'))
+    VIDEO_TRACK_CACHE_MAX_MB = int(os.environ.get('VIDEO_TRACK_CACHE_MAX_MB', 500))
+    TRACK_DURATION_BUCKET_SECONDS = int(os.environ.get('TRACK_DURATION_BUCKET_SECONDS', 10))
+    
+    # Long text is synthesized as concurrent sentence chunks of about this size
+    TTS_CHUNK_CHARS = int(os.environ.get('TTS_CHUNK_CHARS', 400))
+    TTS_MAX_PARALLEL = int(os.environ.get('TTS_MAX_PARALLEL', 4))
 
 class ProductionConfig(Config):
     DEBUG = False
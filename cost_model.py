@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Per-job resource cost model and budget-aware scheduling
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Dict, NamedTuple, Optional
+from encoder import MAX_VIDEO_DURATION
+from line_breaker import is_ideographic
+from memory_monitor import VIDEO_PROFILES
+
+# Speaking rates at speed 1.0, in characters per second
+ALPHABETIC_CHARS_PER_SECOND = 14.0
+IDEOGRAPHIC_CHARS_PER_SECOND = 4.5
+
+# Starting points for each profile's ffmpeg child, measured on a 1-core node:
+# (peak RSS MB, fixed CPU seconds, CPU seconds per second of audio)
+PROFILE_PRIORS = {
+    '1080p': (200.0, 0.10, 0.018),
+    '720p': (75.0, 0.06, 0.008),
+    '480p': (30.0, 0.04, 0.0015)
+}
+
+# Card rendering runs in-process: fixed CPU seconds and seconds per 1000 characters
+RENDER_CPU_PRIOR = (0.15, 0.05)
+# Card, gradient and PNG buffers held by the web process while rendering
+RENDER_RSS_MB = 50.0
+# Profile name of render reservations, counted beside the encode profiles
+RENDER_PROFILE = 'render'
+
+# A job's workspace holds its speech twice (synthesized chunks, then the joined
+# file) at up to 192 kbps, plus the card PNG unless the pipeline is diskless
+SPEECH_MB_PER_SECOND = 2 * 192 / 8 / 1024
+CARD_PNG_MB = 1.0
+
+logger = logging.getLogger(__name__)
+
+def estimate_audio_seconds(text: str, speed: float = 1.0) -> float:
+    """Rough spoken duration of text, before any speech has been synthesized"""
+    ideographic = sum(1 for char in text if is_ideographic(char))
+    other = len(text) - ideographic
+    seconds = ideographic / IDEOGRAPHIC_CHARS_PER_SECOND + other / ALPHABETIC_CHARS_PER_SECOND
+    return min(seconds / max(speed, 0.25) + 1.0, MAX_VIDEO_DURATION)
+
+def estimate_workspace_mb(text: str, speed: float = 1.0, card_file: bool = True) -> float:
+    """Rough size of the intermediates a job writes to its workspace"""
+    return estimate_audio_seconds(text, speed) * SPEECH_MB_PER_SECOND + (CARD_PNG_MB if card_file else 0.0)
+
+class JobCost(NamedTuple):
+    peak_rss_mb: float
+    cpu_seconds: float
+
+class DecayedLinearFit:
+    """Least-squares line y = a + b*x where older observations fade out.
+
+    The prior line enters as two weighted pseudo-observations, so predictions
+    are sensible before any data and drift to the measurements as they come in.
+    """
+
+    def __init__(self, intercept: float, slope: float, prior_x: float, forgetting: float = 0.9,
+                 prior_weight: float = 2.0):
+        self.forgetting = forgetting
+        self.count = 0
+        self._w = self._x = self._y = self._xx = self._xy = 0.0
+        for x in (0.0, prior_x):
+            self._add(x, intercept + slope * x, prior_weight)
+
+    def _add(self, x: float, y: float, weight: float = 1.0):
+        self._w += weight
+        self._x += weight * x
+        self._y += weight * y
+        self._xx += weight * x * x
+        self._xy += weight * x * y
+
+    def observe(self, x: float, y: float):
+        f = self.forgetting
+        self._w, self._x, self._y, self._xx, self._xy = (
+            f * self._w, f * self._x, f * self._y, f * self._xx, f * self._xy)
+        self._add(x, y)
+        self.count += 1
+
+    def coefficients(self):
+        denominator = self._w * self._xx - self._x * self._x
+        if abs(denominator) < 1e-9:
+            return self._y / self._w, 0.0
+        slope = max((self._w * self._xy - self._x * self._y) / denominator, 0.0)
+        return (self._y - slope * self._x) / self._w, slope
+
+    def predict(self, x: float) -> float:
+        intercept, slope = self.coefficients()
+        return max(intercept + slope * x, 0.0)
+
+class PeakEstimate:
+    """EWMA of a peak measurement plus its mean deviation, for a safety margin"""
+
+    def __init__(self, prior: float, smoothing: float = 0.2, margin: float = 2.0):
+        self.mean = prior
+        self.deviation = prior * 0.1
+        self.smoothing = smoothing
+        self.margin = margin
+
+    def observe(self, value: float):
+        error = value - self.mean
+        self.mean += self.smoothing * error
+        self.deviation += self.smoothing * (abs(error) - self.deviation)
+
+    def predict(self) -> float:
+        return self.mean + self.margin * self.deviation
+
+class CostModel:
+    """Predict a job's peak RSS and CPU-seconds, calibrated from completed jobs.
+
+    Encode cost depends on the profile (resolution and preset) and audio
+    duration; render cost on text length. Each profile keeps its own
+    estimates, since a 480p ultrafast encode looks nothing like 1080p medium.
+    """
+
+    def __init__(self, smoothing: float = 0.2, forgetting: float = 0.9):
+        self._lock = threading.Lock()
+        self._encode_rss = {}
+        self._encode_cpu = {}
+        for profile, (rss_mb, cpu_fixed, cpu_per_second) in PROFILE_PRIORS.items():
+            self._encode_rss[profile] = PeakEstimate(rss_mb, smoothing)
+            self._encode_cpu[profile] = DecayedLinearFit(cpu_fixed, cpu_per_second, 60.0, forgetting)
+        self._render_cpu = DecayedLinearFit(*RENDER_CPU_PRIOR, 2.0, forgetting)
+
+    def predict(self, profile: str, audio_seconds: float) -> JobCost:
+        """Cost of encoding audio_seconds of video at a profile"""
+        with self._lock:
+            return JobCost(self._encode_rss[profile].predict(), self._encode_cpu[profile].predict(audio_seconds))
+
+    def predict_render(self, text_chars: int) -> JobCost:
+        """Cost of rendering a card for text_chars of text"""
+        with self._lock:
+            return JobCost(RENDER_RSS_MB, self._render_cpu.predict(text_chars / 1000))
+
+    def observe_encode(self, profile: str, audio_seconds: float, peak_rss_mb: float, cpu_seconds: float):
+        with self._lock:
+            self._encode_rss[profile].observe(peak_rss_mb)
+            self._encode_cpu[profile].observe(audio_seconds, cpu_seconds)
+
+    def observe_render(self, text_chars: int, cpu_seconds: float):
+        with self._lock:
+            self._render_cpu.observe(text_chars / 1000, cpu_seconds)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = {}
+            for profile in PROFILE_PRIORS:
+                cpu_fixed, cpu_per_second = self._encode_cpu[profile].coefficients()
+                stats[profile] = {
+                    'peak_rss_mb': self._encode_rss[profile].predict(),
+                    'cpu_fixed_seconds': cpu_fixed,
+                    'cpu_per_audio_second': cpu_per_second,
+                    'samples': self._encode_cpu[profile].count
+                }
+            render_fixed, render_per_kchar = self._render_cpu.coefficients()
+            stats['render'] = {'cpu_fixed_seconds': render_fixed, 'cpu_per_1000_chars': render_per_kchar}
+            return stats
+
+class Reservation(NamedTuple):
+    profile: str
+    settings: Dict
+    cost: JobCost
+    text_chars: int
+    audio_seconds: float
+
+class ResourceScheduler:
+    """Reserve each job's predicted memory and CPU before it starts.
+
+    ``memory_budget_mb`` caps the summed peak RSS of running jobs and
+    ``cpu_budget_seconds`` the CPU work in flight (cores times how many
+    seconds of backlog we accept). A job gets the best profile that fits in
+    what is left, waits when even the smallest doesn't, and always runs
+    when nothing else is reserved so an oversized job can't starve. Card
+    renders are reserved separately with ``reserve_render``, so each stage
+    holds budget only while it runs.
+    """
+
+    def __init__(self, model: CostModel, memory_budget_mb: float, cpu_budget_seconds: float):
+        self.model = model
+        self.memory_budget_mb = memory_budget_mb
+        self.cpu_budget_seconds = cpu_budget_seconds
+        self.logger = logging.getLogger(__name__)
+        self._condition = threading.Condition()
+        self._reserved_mb = 0.0
+        self._reserved_cpu = 0.0
+        self._active = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.profile_counts = {profile: 0 for profile in list(VIDEO_PROFILES) + [RENDER_PROFILE]}
+
+    def _fits(self, cost: JobCost) -> bool:
+        return (self._reserved_mb + cost.peak_rss_mb <= self.memory_budget_mb
+                and self._reserved_cpu + cost.cpu_seconds <= self.cpu_budget_seconds)
+
+    def _choose(self, text_chars: int, audio_seconds: float) -> Optional[Reservation]:
+        for profile, settings in VIDEO_PROFILES.items():
+            cost = self.model.predict(profile, audio_seconds)
+            if self._fits(cost) or (self._active == 0 and profile == '480p'):
+                return Reservation(profile, dict(settings), cost, text_chars, audio_seconds)
+        return None
+
+    def _choose_render(self, text_chars: int) -> Optional[Reservation]:
+        cost = self.model.predict_render(text_chars)
+        if self._fits(cost) or self._active == 0:
+            return Reservation(RENDER_PROFILE, {}, cost, text_chars, 0.0)
+        return None
+
+    def _take(self, choose: Callable[[], Optional[Reservation]], timeout: Optional[float]) -> Optional[Reservation]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            reservation = choose()
+            if reservation is None:
+                self.waits += 1
+            while reservation is None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.timeouts += 1
+                    return None
+                self._condition.wait(remaining)
+                reservation = choose()
+
+            self._reserved_mb += reservation.cost.peak_rss_mb
+            self._reserved_cpu += reservation.cost.cpu_seconds
+            self._active += 1
+            self.profile_counts[reservation.profile] += 1
+            return reservation
+
+    def reserve(self, text: str, speed: float = 1.0, timeout: Optional[float] = None) -> Optional[Reservation]:
+        """Pick an encode profile and hold its predicted cost; None if nothing fit within timeout"""
+        text_chars = len(text)
+        audio_seconds = estimate_audio_seconds(text, speed)
+        return self._take(lambda: self._choose(text_chars, audio_seconds), timeout)
+
+    def reserve_render(self, text: str, timeout: Optional[float] = None) -> Optional[Reservation]:
+        """Hold a card render's predicted cost; release it once the card is drawn"""
+        return self._take(lambda: self._choose_render(len(text)), timeout)
+
+    def release(self, reservation: Reservation):
+        with self._condition:
+            self._reserved_mb -= reservation.cost.peak_rss_mb
+            self._reserved_cpu -= reservation.cost.cpu_seconds
+            self._active -= 1
+            if self._active == 0:
+                # Drop float drift once idle
+                self._reserved_mb = self._reserved_cpu = 0.0
+            self._condition.notify_all()
+
+    def observe(self, reservation: Reservation, encode_usage: Optional[Dict] = None,
+                render_cpu_seconds: Optional[float] = None):
+        """Calibrate the model with what a finished job actually used"""
+        if encode_usage and 'peak_rss_mb' in encode_usage:
+            self.model.observe_encode(reservation.profile, encode_usage['duration'],
+                                      encode_usage['peak_rss_mb'], encode_usage['cpu_seconds'])
+        if render_cpu_seconds is not None:
+            self.model.observe_render(reservation.text_chars, render_cpu_seconds)
+
+    def get_stats(self) -> Dict:
+        with self._condition:
+            return {
+                'active': self._active,
+                'reserved_mb': self._reserved_mb,
+                'memory_budget_mb': self.memory_budget_mb,
+                'reserved_cpu_seconds': self._reserved_cpu,
+                'cpu_budget_seconds': self.cpu_budget_seconds,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'profiles': dict(self.profile_counts),
+                'model': self.model.get_stats()
+            }
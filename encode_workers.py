@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Isolated worker processes for card rendering and video encoding
+"""
+
+import os
+import time
+import signal
+import logging
+import threading
+import multiprocessing
+from typing import Callable, Dict, Optional
+import psutil
+
+logger = logging.getLogger(__name__)
+
+class WorkerCrashed(RuntimeError):
+    """The worker process died or timed out while running a task"""
+
+def _worker_main(conn, config: Dict):
+    """Entry point of a spawned worker: run tasks until told to stop or the parent goes away"""
+    # Lead a process group so killing the worker also takes its ffmpeg children
+    os.setpgrp()
+    # Imported here because video_generator itself imports this module
+    from video_generator import VideoGenerator
+    generator = VideoGenerator(config)
+    process = psutil.Process(os.getpid())
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        task, args = message
+
+        def report(stage, state, progress=None):
+            conn.send(('report', (stage, state, progress)))
+
+        cpu_start = time.process_time()
+        try:
+            if task == 'render':
+                generator.create_text_image(*args, report=report)
+                result = {'value': args[2]}
+            elif task == 'frame':
+                result = {'value': generator.create_card_frame(*args, report=report)}
+            elif task == 'encode':
+                image, audio_path, output_path, audio_format, settings, card_key = args
+                usage = {}
+                value = generator.create_video(image, audio_path, output_path, audio_format,
+                                               report, settings, usage, card_key)
+                result = {'value': value, 'usage': usage}
+            else:
+                raise ValueError(f"Unknown task {task}")
+        except Exception as e:
+            conn.send(('error', str(e)))
+            continue
+
+        result['cpu_seconds'] = time.process_time() - cpu_start
+        result['rss_mb'] = process.memory_info().rss / (1024 ** 2)
+        conn.send(('result', result))
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.jobs = 0
+
+    def stop(self, timeout: float = 5):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+            self.process.join()
+        self.conn.close()
+
+    def kill(self):
+        """Kill the worker and anything it started, e.g. an ffmpeg mid-encode"""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            # Not leading its group yet; nothing else was started
+            self.process.kill()
+
+class EncodeWorkerPool:
+    """A small pool of spawned processes that render cards and drive ffmpeg.
+
+    Workers are started with the spawn method, so they never inherit the web
+    process's heap. Each is retired after ``max_jobs`` tasks or once its RSS
+    passes ``max_rss_mb``, and a worker that crashes or exceeds
+    ``task_timeout`` fails only its own task. Results come back as file paths
+    or in-memory card frames plus small dicts; stage reports are forwarded as
+    they arrive.
+    """
+
+    def __init__(self, size: int, config: Dict, max_jobs: int = 50, max_rss_mb: float = 400,
+                 task_timeout: float = 300):
+        self.size = size
+        self.config = config
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.task_timeout = task_timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._condition = threading.Condition()
+        self._idle = []
+        self._total = 0
+        self._closed = False
+        self.tasks = 0
+        self.crashes = 0
+        self.recycled = 0
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child_conn, self.config),
+            name='encode-worker', daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def _acquire(self) -> _Worker:
+        with self._condition:
+            self._condition.wait_for(lambda: self._closed or self._idle or self._total < self.size)
+            if self._closed:
+                raise RuntimeError("Encode worker pool is closed")
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                # Died while idle (e.g. the OOM killer); replace it
+                worker.conn.close()
+                self._total -= 1
+                self.crashes += 1
+            self._total += 1
+
+        # Spawning imports the app modules, so do it outside the lock
+        try:
+            return self._spawn()
+        except Exception:
+            with self._condition:
+                self._total -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, worker: _Worker, retire: bool):
+        if retire:
+            worker.stop()
+        with self._condition:
+            if retire:
+                self._total -= 1
+            else:
+                self._idle.append(worker)
+            self._condition.notify()
+
+    def run(self, task: str, args: tuple, report: Optional[Callable] = None) -> Dict:
+        """Run one task on a worker and return its result dict"""
+        worker = self._acquire()
+        deadline = time.monotonic() + self.task_timeout
+        retire = True
+        try:
+            try:
+                worker.conn.send((task, args))
+            except OSError:
+                raise WorkerCrashed(f"Encode worker exited with code {worker.process.exitcode} before {task}")
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not worker.conn.poll(remaining):
+                    worker.kill()
+                    raise WorkerCrashed(f"Encode worker timed out after {self.task_timeout}s on {task}")
+                try:
+                    kind, payload = worker.conn.recv()
+                except (EOFError, OSError):
+                    raise WorkerCrashed(f"Encode worker exited with code {worker.process.exitcode} during {task}")
+
+                if kind == 'report':
+                    if report is not None:
+                        report(*payload)
+                elif kind == 'error':
+                    retire = False
+                    raise RuntimeError(payload)
+                else:
+                    worker.jobs += 1
+                    retire = worker.jobs >= self.max_jobs or payload['rss_mb'] >= self.max_rss_mb
+                    with self._condition:
+                        self.tasks += 1
+                        self.recycled += retire
+                    return payload
+        except WorkerCrashed as e:
+            logger.error(str(e))
+            with self._condition:
+                self.crashes += 1
+            raise
+        finally:
+            self._release(worker, retire)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            workers, self._idle = self._idle, []
+            self._condition.notify_all()
+        for worker in workers:
+            worker.stop()
+
+    def get_stats(self) -> Dict:
+        with self._condition:
+            return {
+                'size': self.size,
+                'workers': self._total,
+                'idle': len(self._idle),
+                'tasks': self.tasks,
+                'crashes': self.crashes,
+                'recycled': self.recycled
+            }
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Still-image video encoding with ffmpeg
+"""
+
+import os
+import re
+import stat
+import shutil
+import signal
+import logging
+import subprocess
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Union
+
+# Preferred H.264 encoders, best first; mpeg4 is the last resort every build has
+VIDEO_CODEC_PREFERENCE = ['libx264', 'libopenh264', 'h264_v4l2m2m', 'mpeg4']
+
+# Audio formats the MP4 muxer can take with -c:a copy, most preferred first
+MP4_COPY_AUDIO_FORMATS = ['aac', 'mp3']
+
+# Longest audio we will encode, in seconds
+MAX_VIDEO_DURATION = 300
+
+# Sample rates indexed by an ADTS header's sampling_frequency_index
+ADTS_SAMPLE_RATES = [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350]
+
+logger = logging.getLogger(__name__)
+
+class EncoderCapabilities(NamedTuple):
+    ffmpeg_path: str
+    video_codec: str
+    audio_encoders: tuple
+
+def find_ffmpeg() -> Optional[str]:
+    """Locate an ffmpeg binary: FFMPEG_BINARY, then PATH, then imageio-ffmpeg"""
+    candidates = [os.environ.get('FFMPEG_BINARY'), shutil.which('ffmpeg')]
+    try:
+        import imageio_ffmpeg
+        candidates.append(imageio_ffmpeg.get_ffmpeg_exe())
+    except Exception:
+        pass
+
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return None
+
+def probe_encoder_capabilities() -> Optional[EncoderCapabilities]:
+    """Find ffmpeg and the encoders it was built with"""
+    ffmpeg_path = find_ffmpeg()
+    if not ffmpeg_path:
+        logger.error("ffmpeg not found; video encoding is unavailable")
+        return None
+
+    try:
+        result = subprocess.run(
+            [ffmpeg_path, '-hide_banner', '-encoders'],
+            capture_output=True, text=True, timeout=15
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error(f"ffmpeg capability probe failed: {e}")
+        return None
+
+    encoders = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # Encoder lines look like " V....D libx264   description"
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'VAS':
+            encoders.add(parts[1])
+
+    video_codec = next((codec for codec in VIDEO_CODEC_PREFERENCE if codec in encoders), None)
+    if not video_codec:
+        logger.error("ffmpeg has no usable video encoder")
+        return None
+
+    audio_encoders = tuple(sorted(name for name in encoders if name in ('aac', 'libfdk_aac', 'libmp3lame', 'libopus')))
+    logger.info(f"Encoder probe: {ffmpeg_path} ({video_codec})")
+    return EncoderCapabilities(ffmpeg_path, video_codec, audio_encoders)
+
+def negotiate_audio_format(supported_formats: List[str]) -> str:
+    """Pick the provider format that can be muxed into MP4 without re-encoding"""
+    for audio_format in MP4_COPY_AUDIO_FORMATS:
+        if audio_format in supported_formats:
+            return audio_format
+    return 'mp3' if 'mp3' in supported_formats or not supported_formats else supported_formats[0]
+
+def adts_duration(media_path: str) -> Optional[float]:
+    """Exact duration of a raw ADTS AAC file, counted from its frame headers.
+
+    ffmpeg only estimates an ADTS stream's duration from its bitrate, which
+    is not good enough to cut a copied track to. Returns None if the file is
+    not a clean run of ADTS frames.
+    """
+    try:
+        with open(media_path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # Skip an ID3v2 tag: 10-byte header with a syncsafe size, plus optional footer
+    offset = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    samples = 0
+    sample_rate = None
+    while offset + 7 <= len(data):
+        header = data[offset:offset + 7]
+        # 12-bit syncword and a layer field of 00 (MP3 frames share the syncword)
+        if header[0] != 0xFF or (header[1] & 0xF6) != 0xF0:
+            break
+        rate_index = (header[2] >> 2) & 0x0F
+        frame_length = ((header[3] & 0x03) << 11) | (header[4] << 3) | (header[5] >> 5)
+        if rate_index >= len(ADTS_SAMPLE_RATES) or frame_length < 7 or offset + frame_length > len(data):
+            break
+        sample_rate = ADTS_SAMPLE_RATES[rate_index]
+        # Each raw data block in the frame decodes to 1024 samples
+        samples += ((header[6] & 0x03) + 1) * 1024
+        offset += frame_length
+
+    # Anything left over besides a trailing ID3v1 tag means this is not (only) ADTS
+    rest = data[offset:]
+    if not sample_rate or (rest and not (len(rest) == 128 and rest[:3] == b'TAG')):
+        return None
+    return samples / sample_rate
+
+def probe_duration(ffmpeg_path: str, media_path: str) -> Optional[float]:
+    """Read a media file's duration in seconds from ffmpeg's input summary"""
+    try:
+        result = subprocess.run(
+            [ffmpeg_path, '-hide_banner', '-i', media_path],
+            capture_output=True, text=True, timeout=30
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+class StillImageEncoder:
+    """Encode one still image plus an audio track into an MP4 by calling ffmpeg directly.
+
+    The image is decoded once and looped by ffmpeg's loop filter at a very low
+    frame rate with long GOPs, so the cost is a frame or two per second of
+    audio instead of full-rate frames produced in Python, and memory stays
+    flat regardless of audio length. An ffmpeg still running after
+    ``timeout_base`` plus ``timeout_per_second`` per second of audio is killed.
+    """
+
+    def __init__(self, capabilities: EncoderCapabilities, fps: int = 1, keyframe_seconds: int = 10,
+                 timeout_base: float = 60, timeout_per_second: float = 2):
+        self.capabilities = capabilities
+        self.fps = fps
+        self.keyframe_seconds = keyframe_seconds
+        self.timeout_base = timeout_base
+        self.timeout_per_second = timeout_per_second
+
+    @property
+    def name(self) -> str:
+        return f"ffmpeg-{self.capabilities.video_codec}"
+
+    def _video_options(self, settings: Dict[str, Any]) -> List[str]:
+        codec = self.capabilities.video_codec
+        target_height = settings['resolution'][1]
+        if target_height < 1080:  # Only resize if we need to reduce resolution
+            scale = f"scale=-2:{target_height}"
+        else:
+            # yuv420p needs even dimensions
+            scale = "scale=trunc(iw/2)*2:trunc(ih/2)*2"
+
+        cmd = ['-vf', f"{scale},loop=loop=-1:size=1:start=0", '-c:v', codec]
+        if codec == 'libx264':
+            cmd += ['-tune', 'stillimage', '-preset', settings['preset'], '-crf', '23',
+                    '-maxrate', settings['video_bitrate'], '-bufsize', settings['video_bitrate']]
+        else:
+            cmd += ['-b:v', settings['video_bitrate']]
+        cmd += [
+            '-r', str(self.fps),
+            '-g', str(self.fps * self.keyframe_seconds),
+            '-pix_fmt', 'yuv420p',
+            '-threads', str(settings['threads']),
+        ]
+        return cmd
+
+    def _audio_options(self, settings: Dict[str, Any], audio_format: Optional[str]) -> List[str]:
+        if audio_format in MP4_COPY_AUDIO_FORMATS:
+            # Stream-copy the TTS audio; ADTS AAC needs its headers rewritten for MP4
+            cmd = ['-c:a', 'copy']
+            if audio_format == 'aac':
+                cmd += ['-bsf:a', 'aac_adtstoasc']
+            return cmd
+        return ['-c:a', 'aac', '-b:a', settings['audio_bitrate']]
+
+    def _output_options(self, output_path: str) -> List[str]:
+        # Identical inputs must give identical files: no encoder version
+        # strings, wall-clock creation times or copied input metadata
+        cmd = ['-map_metadata', '-1', '-map_chapters', '-1',
+               '-fflags', '+bitexact', '-flags:v', '+bitexact', '-flags:a', '+bitexact']
+        if _is_pipe(output_path):
+            # Nothing can seek back into a pipe to move the index to the front:
+            # write a fragmented MP4 that is playable as it streams instead
+            return cmd + ['-movflags', '+frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', output_path]
+        return cmd + ['-movflags', '+faststart', output_path]
+
+    def _image_input(self, image: Union[str, bytes]) -> List[str]:
+        """Input options for the card: a file path, or an in-memory PPM frame fed on stdin"""
+        if isinstance(image, bytes):
+            return ['-f', 'image2pipe', '-c:v', 'ppm', '-framerate', str(self.fps), '-i', 'pipe:0']
+        return ['-framerate', str(self.fps), '-i', image]
+
+    def build_command(self, image: Union[str, bytes], audio_path: str, output_path: str,
+                      settings: Dict[str, Any], duration: float,
+                      audio_format: Optional[str] = None) -> List[str]:
+        cmd = [self.capabilities.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error']
+        cmd += self._image_input(image)
+        cmd += [
+            '-i', audio_path,
+            '-map', '0:v:0', '-map', '1:a:0',
+            # -shortest overshoots by the encoder's lookahead, so cut explicitly
+            '-t', f"{duration:.3f}"
+        ]
+        cmd += self._video_options(settings)
+        cmd += self._audio_options(settings, audio_format)
+        cmd += self._output_options(output_path)
+        return cmd
+
+    def build_track_command(self, image: Union[str, bytes], output_path: str,
+                            settings: Dict[str, Any], duration: float) -> List[str]:
+        """Encode just the looped card, with no audio, for later muxing"""
+        cmd = [self.capabilities.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error']
+        cmd += self._image_input(image)
+        cmd += ['-map', '0:v:0', '-t', f"{duration:.3f}"]
+        cmd += self._video_options(settings)
+        # Without B-frames every packet is in presentation order, so a
+        # stream-copy mux can cut the track at any frame
+        cmd += ['-bf', '0', '-an']
+        cmd += self._output_options(output_path)
+        return cmd
+
+    def build_mux_command(self, track_path: str, audio_path: str, output_path: str,
+                          settings: Dict[str, Any], duration: float,
+                          audio_format: Optional[str] = None) -> List[str]:
+        """Stream-copy a video-only track (at least duration long) under new audio.
+
+        The copied video ends on a frame boundary, so it can run up to one
+        frame (1/fps seconds) past the audio.
+        """
+        cmd = [
+            self.capabilities.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error',
+            '-i', track_path, '-i', audio_path,
+            '-map', '0:v:0', '-map', '1:a:0',
+            '-t', f"{duration:.3f}",
+            '-c:v', 'copy'
+        ]
+        cmd += self._audio_options(settings, audio_format)
+        cmd += self._output_options(output_path)
+        return cmd
+
+    def audio_duration(self, audio_path: str) -> Optional[float]:
+        """Duration the video will have for this audio, or None if unreadable"""
+        duration = adts_duration(audio_path) or probe_duration(self.capabilities.ffmpeg_path, audio_path)
+        if not duration:
+            print(f"FFmpeg error: could not read audio duration of {audio_path}")
+            return None
+        # Limit audio duration to prevent runaway encodes
+        return min(duration, MAX_VIDEO_DURATION)
+
+    def encode(self, image: Union[str, bytes], audio_path: str, output_path: str,
+               settings: Dict[str, Any], audio_format: Optional[str] = None,
+               report: Optional[Callable] = None, usage: Optional[Dict] = None) -> bool:
+        """Encode the card and audio; audio_format names the audio file's codec when known.
+
+        ``image`` is a card image path or the card as PPM bytes (raw RGB with
+        a short header); bytes are written to ffmpeg's stdin, so the card
+        never touches disk.
+
+        ``report(stage, state, progress=None)``, when given, receives 'encode'
+        progress parsed from ffmpeg's -progress output, then the 'mux' stage
+        while ffmpeg finalizes the file. ``usage``, when given, is filled with
+        the encode's ``duration``, ``peak_rss_mb`` and ``cpu_seconds``.
+        """
+        duration = self.audio_duration(audio_path)
+        if not duration:
+            return False
+
+        cmd = self.build_command(image, audio_path, output_path, settings, duration, audio_format)
+        if not self._execute(cmd, output_path, duration, report, usage, self._frame_input(image)):
+            return False
+        if report is not None:
+            report('mux', 'done')
+        return True
+
+    def encode_video_track(self, image: Union[str, bytes], output_path: str, settings: Dict[str, Any],
+                           duration: float, report: Optional[Callable] = None,
+                           usage: Optional[Dict] = None) -> bool:
+        """Encode a video-only track of the card; image, report and usage as in encode"""
+        cmd = self.build_track_command(image, output_path, settings, duration)
+        return self._execute(cmd, output_path, duration, report, usage, self._frame_input(image))
+
+    @staticmethod
+    def _frame_input(image: Union[str, bytes]) -> Optional[bytes]:
+        return image if isinstance(image, bytes) else None
+
+    def mux(self, track_path: str, audio_path: str, output_path: str, settings: Dict[str, Any],
+            duration: float, audio_format: Optional[str] = None, report: Optional[Callable] = None) -> bool:
+        """Combine a cached video track with new audio without re-encoding the video"""
+        if report is not None:
+            report('mux', 'running')
+        cmd = self.build_mux_command(track_path, audio_path, output_path, settings, duration, audio_format)
+        if not self._execute(cmd, output_path, duration, None, None):
+            return False
+        if report is not None:
+            report('mux', 'done')
+        return True
+
+    def _execute(self, cmd: List[str], output_path: str, duration: float,
+                 report: Optional[Callable], usage: Optional[Dict], stdin_data: Optional[bytes] = None) -> bool:
+        try:
+            returncode, stderr, rusage = self._run(cmd, duration, report, stdin_data)
+        except OSError as e:
+            print(f"FFmpeg launch error: {e}")
+            return False
+
+        if usage is not None:
+            usage['duration'] = duration
+            # ru_maxrss is in kilobytes on Linux
+            usage['peak_rss_mb'] = rusage.ru_maxrss / 1024
+            usage['cpu_seconds'] = rusage.ru_utime + rusage.ru_stime
+
+        if returncode == 0 and os.path.exists(output_path):
+            return True
+
+        print(f"FFmpeg error: {stderr}")
+        return False
+
+    def _run(self, cmd: List[str], duration: float, report: Optional[Callable],
+             stdin_data: Optional[bytes] = None):
+        """Run ffmpeg, reporting -progress output if asked, and return its exit code, stderr and rusage"""
+        if report is not None:
+            # Global options may go anywhere; keep the output path last
+            cmd = cmd[:-1] + ['-progress', 'pipe:1', '-nostats', cmd[-1]]
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE if stdin_data is not None else subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE if report else subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, text=True)
+
+        # Kill an ffmpeg that hangs (e.g. on an output nobody reads); the lock
+        # keeps the kill from reaching a pid that was reaped and reused
+        timeout = self.timeout_base + duration * self.timeout_per_second
+        kill_lock = threading.Lock()
+        timed_out = []
+
+        def kill():
+            with kill_lock:
+                if process.returncode is None:
+                    timed_out.append(True)
+                    os.kill(process.pid, signal.SIGKILL)
+
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+
+        # Drain stderr on the side so a chatty error can't block the progress pipe
+        stderr_chunks = []
+        stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        stderr_thread.start()
+
+        stdin_thread = None
+        if stdin_data is not None:
+            # Feed the frame on the side too; EOF tells ffmpeg the input is complete
+            stdin_thread = threading.Thread(target=_feed_stdin, args=(process.stdin, stdin_data), daemon=True)
+            stdin_thread.start()
+
+        if report is not None:
+            report('encode', 'running', 0.0)
+            out_seconds = 0.0
+            for line in process.stdout:
+                key, _, value = line.strip().partition('=')
+                # out_time_ms is in microseconds too (a long-standing ffmpeg quirk)
+                if key in ('out_time_us', 'out_time_ms') and value.isdigit():
+                    out_seconds = int(value) / 1_000_000
+                elif key == 'progress':
+                    if value == 'end':
+                        report('encode', 'done', 1.0)
+                        report('mux', 'running')
+                    else:
+                        report('encode', 'running', min(out_seconds / duration, 1.0))
+            process.stdout.close()
+
+        # Reap the child ourselves to get its peak RSS and CPU time
+        _, status, rusage = os.wait4(process.pid, 0)
+        with kill_lock:
+            process.returncode = os.waitstatus_to_exitcode(status)
+        timer.cancel()
+        if stdin_thread is not None:
+            stdin_thread.join()
+        stderr_thread.join()
+        process.stderr.close()
+        if timed_out:
+            stderr_chunks.append(f"\nKilled after running for {timeout:.0f}s")
+        return process.returncode, ''.join(stderr_chunks), rusage
+
+def _is_pipe(path: str) -> bool:
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+def _feed_stdin(stdin, data: bytes):
+    try:
+        stdin.buffer.write(data)
+    except OSError:
+        pass  # ffmpeg exited early; its stderr says why
+    finally:
+        try:
+            stdin.close()
+        except OSError:
+            pass
+
+_encoder = None
+_encoder_probed = False
+_encoder_lock = threading.Lock()
+
+def get_encoder(fps: int = 1) -> Optional[StillImageEncoder]:
+    """Return the process-wide encoder, probing ffmpeg on first use"""
+    global _encoder, _encoder_probed
+    with _encoder_lock:
+        if not _encoder_probed:
+            capabilities = probe_encoder_capabilities()
+            _encoder = StillImageEncoder(capabilities, fps=fps) if capabilities else None
+            _encoder_probed = True
+        return _encoder
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Eviction policies for generated outputs
+"""
+
+from typing import Dict
+
+class EvictionPolicy:
+    """Turn an output's size and access history into an eviction priority.
+
+    The catalog stores the priority next to each output and evicts the
+    lowest first. ``inflation`` is the GreedyDual clock: policies that use
+    it (``inflates``) see it rise to each evicted entry's priority, so new
+    and recently used entries outrank ones that haven't been touched since.
+    """
+
+    name = ''
+    inflates = False
+
+    def priority(self, hits: int, size: int, last_access: float, inflation: float) -> float:
+        raise NotImplementedError
+
+class LRUPolicy(EvictionPolicy):
+    """Least recently used: the longest unwatched output goes first"""
+
+    name = 'lru'
+
+    def priority(self, hits, size, last_access, inflation):
+        return last_access
+
+class LFUPolicy(EvictionPolicy):
+    """Least frequently used, ties broken by recency"""
+
+    name = 'lfu'
+
+    def priority(self, hits, size, last_access, inflation):
+        return float(hits)
+
+class GDSFPolicy(EvictionPolicy):
+    """GreedyDual-Size-Frequency: L + frequency * cost / size.
+
+    With a uniform cost per output, many small popular videos are kept
+    ahead of one large rarely watched one, which maximizes hits per byte.
+    Sizes are in MB only to keep the numbers readable.
+    """
+
+    name = 'gdsf'
+    inflates = True
+
+    def __init__(self, cost: float = 1.0):
+        self.cost = cost
+
+    def priority(self, hits, size, last_access, inflation):
+        size_mb = max(size / (1024 ** 2), 1e-3)
+        return inflation + (hits + 1) * self.cost / size_mb
+
+EVICTION_POLICIES: Dict[str, type] = {
+    LRUPolicy.name: LRUPolicy,
+    LFUPolicy.name: LFUPolicy,
+    GDSFPolicy.name: GDSFPolicy
+}
+
+def get_eviction_policy(name: str) -> EvictionPolicy:
+    try:
+        return EVICTION_POLICIES[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown eviction policy {name!r}; choose from {', '.join(EVICTION_POLICIES)}")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk file cache shared by worker processes
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import threading
+from typing import Callable, Dict, Optional
+
+class FileCache:
+    """Files keyed by a content hash, kept under a byte budget.
+
+    Entries are written atomically (temp file + rename in the cache directory),
+    so several gunicorn workers can share one directory. Reads refresh the
+    file's mtime, which eviction uses as the LRU order.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, rescan_interval: int = 50):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._approx_bytes = None
+        self._stores_since_scan = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, key: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{extension}")
+
+    def fetch(self, key: str, extension: str, output_path: str) -> bool:
+        """Copy a cached entry to output_path; returns False on a miss"""
+        path = self.entry_path(key, extension)
+        try:
+            shutil.copyfile(path, output_path)
+            os.utime(path)  # Refresh LRU position
+        except (OSError, FileNotFoundError):
+            # Missing, or evicted by another worker between lookup and copy
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def read(self, key: str, extension: str) -> Optional[bytes]:
+        """Return a cached entry's contents, or None on a miss"""
+        path = self.entry_path(key, extension)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Refresh LRU position
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def store(self, key: str, extension: str, source_path: str):
+        """Atomically add a synthesized file to the cache"""
+        try:
+            size = os.path.getsize(source_path)
+        except OSError as e:
+            self.logger.error(f"Cache store failed in {self.cache_dir}: {e}")
+            return
+
+        def write(dst):
+            with open(source_path, 'rb') as src:
+                shutil.copyfileobj(src, dst)
+        self._store(key, extension, size, write)
+
+    def store_bytes(self, key: str, extension: str, data: bytes):
+        """Atomically add an in-memory entry to the cache"""
+        self._store(key, extension, len(data), lambda dst: dst.write(data))
+
+    def _store(self, key: str, extension: str, size: int, write: Callable):
+        if size > self.max_bytes:
+            return
+        path = self.entry_path(key, extension)
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as dst:
+                    write(dst)
+                os.replace(temp_path, path)
+            except Exception:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+        except Exception as e:
+            self.logger.error(f"Cache store failed in {self.cache_dir}: {e}")
+            return
+
+        with self._lock:
+            self.stores += 1
+            self._stores_since_scan += 1
+            if self._approx_bytes is not None:
+                self._approx_bytes += size
+            needs_scan = (self._approx_bytes is None or self._approx_bytes > self.max_bytes
+                          or self._stores_since_scan >= self.rescan_interval)
+        if needs_scan:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its byte budget"""
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.is_file() or entry.name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except (OSError, FileNotFoundError):
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except OSError as e:
+            self.logger.error(f"Cache scan failed in {self.cache_dir}: {e}")
+            return
+
+        evicted = 0
+        if total > self.max_bytes:
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    evicted += 1
+                except FileNotFoundError:
+                    pass  # Another worker got there first
+                except OSError:
+                    continue
+                total -= size
+
+        with self._lock:
+            self._approx_bytes = total
+            self._stores_since_scan = 0
+            self.evictions += evicted
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / max(lookups, 1),
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'approx_size_mb': (self._approx_bytes or 0) / (1024 ** 2),
+                'max_size_mb': self.max_bytes / (1024 ** 2)
+            }
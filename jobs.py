@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Background generation jobs
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import socket
+import logging
+import tempfile
+import threading
+import psutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Optional
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+FINISHED_STATUSES = ('succeeded', 'failed')
+
+class JobStore:
+    """Job state kept as one small JSON file per job.
+
+    Files are replaced atomically, so any gunicorn worker can answer status
+    requests for a job running in another worker. Each job records the
+    process that runs it, so one left unfinished by a worker that died can
+    be recognized.
+    """
+
+    def __init__(self, state_dir: str, max_age_hours: int = 24):
+        self.state_dir = state_dir
+        self.max_age_hours = max_age_hours
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _write(self, job: Dict):
+        fd, temp_path = tempfile.mkstemp(dir=self.state_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(job, f)
+            os.replace(temp_path, self._path(job['id']))
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        if not JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def version(self, job_id: str) -> Optional[tuple]:
+        """Cheap change marker for a job's state file.
+
+        Every write replaces the file, so the inode changes even when two
+        writes land within one mtime tick.
+        """
+        if not JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        try:
+            stat = os.stat(self._path(job_id))
+            return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def create(self, job_id: str) -> Dict:
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'video_url': None,
+            'error': None,
+            'timings': None,
+            'stage': None,
+            'stages': {},
+            'progress': None,
+            'seq': 0,
+            'owner_pid': os.getpid(),
+            'owner_host': socket.gethostname()
+        }
+        self._write(job)
+        return job
+
+    def is_orphaned(self, job: Dict) -> bool:
+        """Whether an unfinished job's owning process on this host has exited"""
+        if job['status'] in FINISHED_STATUSES or job.get('owner_host') != socket.gethostname():
+            return False
+        pid = job.get('owner_pid')
+        return pid is not None and pid != os.getpid() and not psutil.pid_exists(pid)
+
+    def update(self, job_id: str, **fields) -> Optional[Dict]:
+        # Render and TTS report from different threads of the same job
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            job['seq'] = job.get('seq', 0) + 1
+            self._write(job)
+            return job
+
+    def record_stage(self, job_id: str, stage: str, state: str,
+                     progress: Optional[float] = None) -> Optional[Dict]:
+        """Record a stage transition ('running'/'done') and optional 0-1 progress"""
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                return None
+            job['stages'][stage] = state
+            job['stage'] = stage
+            job['progress'] = round(progress, 3) if progress is not None else None
+            job['seq'] = job.get('seq', 0) + 1
+            self._write(job)
+            return job
+
+    def cleanup(self) -> int:
+        """Remove state files for jobs older than max_age_hours"""
+        cutoff = time.time() - self.max_age_hours * 3600
+        removed = 0
+        for filename in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+class JobManager:
+    """Run generation jobs on a bounded background worker pool.
+
+    ``run_job(data, base_filename, report)`` does the work and returns the
+    same result dict as ``VideoGenerator.generate_video`` plus a
+    ``video_url``. ``report(stage, state, progress=None)`` records stage
+    transitions in the job's state file for progress streams.
+    ``before_run()`` blocks until the job may start (e.g. for a free
+    admission slot); the job stays ``queued`` until it returns.
+    """
+
+    def __init__(self, store: JobStore, run_job: Callable[[Dict, str, Callable], Dict], max_workers: int = 2,
+                 cleanup_every: int = 100, on_finished: Optional[Callable[[str, Dict], None]] = None,
+                 before_run: Optional[Callable[[], None]] = None):
+        self.store = store
+        self.run_job = run_job
+        self.before_run = before_run
+        self.on_finished = on_finished
+        self.max_workers = max_workers
+        self.cleanup_every = cleanup_every
+        self.logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._submitted = 0
+
+    @property
+    def pending(self) -> int:
+        """Jobs accepted by this process that have not finished yet"""
+        return self._pending
+
+    def submit(self, data: Dict, base_filename: str, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        self.store.create(job_id)
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+            run_cleanup = self._submitted % self.cleanup_every == 0
+        self._executor.submit(self._run, job_id, data, base_filename)
+        
+        if run_cleanup:
+            self.store.cleanup()
+        return job_id
+
+    def add_completed(self, video_url: str) -> str:
+        """Record a job whose result already exists, e.g. a result cache hit"""
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id)
+        now = time.time()
+        self.store.update(job_id, status='succeeded', started_at=now, finished_at=now, video_url=video_url)
+        return job_id
+
+    def add_follower(self, wait: Callable[[], Optional[str]]) -> str:
+        """Record a job that tracks identical work owned elsewhere.
+
+        ``wait`` blocks until that work ends and returns its video URL, or
+        None if it failed or timed out. It runs on its own thread, not a
+        pool worker, since following takes no generation capacity.
+        """
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id)
+        threading.Thread(target=self._follow, args=(job_id, wait), daemon=True,
+                         name=f"job-follow-{job_id[:8]}").start()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """The job's state; one whose worker died unfinished is marked failed"""
+        job = self.store.get(job_id)
+        if job is not None and self.store.is_orphaned(job):
+            self.logger.warning(f"Job {job_id} lost its worker (pid {job['owner_pid']})")
+            job = self.store.update(job_id, status='failed', finished_at=time.time(),
+                                    error='The worker running this job stopped') or job
+        return job
+
+    def _follow(self, job_id: str, wait: Callable[[], Optional[str]]):
+        try:
+            video_url = wait()
+        except Exception as e:
+            self.logger.error(f"Job {job_id} stopped following: {e}")
+            video_url = None
+        if video_url:
+            self.store.update(job_id, status='succeeded', finished_at=time.time(), video_url=video_url)
+        else:
+            self.store.update(job_id, status='failed', finished_at=time.time(),
+                              error='The identical request this job waited for did not finish')
+
+    def _run(self, job_id: str, data: Dict, base_filename: str):
+        try:
+            if self.before_run is not None:
+                self.before_run()
+            try:
+                self.store.update(job_id, status='running', started_at=time.time())
+            except Exception as e:
+                # Run it anyway: run_job gives back what before_run took
+                self.logger.error(f"Job {job_id} start update failed: {e}")
+            
+            def report(stage, state, progress=None):
+                try:
+                    self.store.record_stage(job_id, stage, state, progress)
+                except Exception as e:
+                    self.logger.error(f"Job {job_id} progress update failed: {e}")
+            
+            try:
+                result = self.run_job(data, base_filename, report)
+            except Exception as e:
+                self.logger.error(f"Job {job_id} crashed: {e}")
+                result = {'success': False, 'error': 'Internal server error'}
+
+            if result['success']:
+                self.store.update(job_id, status='succeeded', finished_at=time.time(),
+                                  video_url=result['video_url'], timings=result.get('timings'))
+            else:
+                self.store.update(job_id, status='failed', finished_at=time.time(),
+                                  error=result['error'], timings=result.get('timings'))
+        finally:
+            with self._lock:
+                self._pending -= 1
+            if self.on_finished:
+                try:
+                    self.on_finished(job_id, data)
+                except Exception as e:
+                    self.logger.error(f"Job {job_id} completion hook failed: {e}")
+
+def format_event(event: str, data: Dict, event_id: Optional[int] = None) -> str:
+    """Serialize one Server-Sent Event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+def progress_snapshot(job: Dict) -> Dict:
+    return {
+        'status': job['status'],
+        'stage': job.get('stage'),
+        'stages': job.get('stages', {}),
+        'progress': job.get('progress')
+    }
+
+def job_event_stream(store: JobStore, job_id: str, last_event_id: Optional[int] = None,
+                     max_seconds: float = 25, poll_interval: float = 0.25,
+                     retry_ms: int = 1000) -> Iterator[str]:
+    """Server-Sent Events for one job's progress.
+
+    Emits a ``progress`` event (id = the job's ``seq``) whenever its state
+    file changes and a final ``done`` event with the result. Polling only
+    stats the file until it changes, and the stream ends after
+    ``max_seconds`` so a watcher never pins a server thread; EventSource
+    reconnects after ``retry_ms`` and resumes from ``Last-Event-ID``.
+    """
+    yield f"retry: {retry_ms}\n\n"
+    deadline = time.monotonic() + max_seconds
+    last_version = None
+    last_keepalive = time.monotonic()
+    
+    while True:
+        version = store.version(job_id)
+        if version is None:
+            yield format_event('error', {'error': 'Job not found'})
+            return
+        
+        if version != last_version:
+            last_version = version
+            job = store.get(job_id)
+            if job is not None:
+                if last_event_id is None or job.get('seq', 0) > last_event_id:
+                    last_event_id = job.get('seq', 0)
+                    yield format_event('progress', progress_snapshot(job), last_event_id)
+                if job['status'] in FINISHED_STATUSES:
+                    yield format_event('done', {
+                        'status': job['status'],
+                        'video_url': job.get('video_url'),
+                        'error': job.get('error'),
+                        'timings': job.get('timings')
+                    }, last_event_id)
+                    return
+        
+        now = time.monotonic()
+        if now >= deadline:
+            return
+        if now - last_keepalive >= 10:
+            # Comment line keeps proxies from timing out an idle stream
+            last_keepalive = now
+            yield ": keepalive\n\n"
+        time.sleep(poll_interval)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+File-lock leader election between processes on one node
+"""
+
+import os
+import time
+import fcntl
+import logging
+import threading
+from typing import Optional
+
+class FileLeaderLock:
+    """Exclusive flock on a lock file; whoever holds it is the leader.
+
+    The kernel drops the lock when its holder exits or crashes, so another
+    process can take over on its next ``try_acquire`` with no lease to
+    expire. The holder's pid is written into the file for operators.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._file = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def is_leader(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        """Take leadership if nobody holds it; True if this process leads"""
+        with self._lock:
+            if self._file is not None:
+                return True
+            lock_file = open(self.path, 'a+')
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(f"{os.getpid()}\n")
+            lock_file.flush()
+            self._file = lock_file
+        self.logger.info(f"Process {os.getpid()} is now leader for {self.path}")
+        return True
+
+    def acquire(self, timeout: Optional[float] = None, poll_interval: float = 0.5) -> bool:
+        """Wait up to timeout (forever if None) for leadership"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def holder(self) -> Optional[int]:
+        """Pid of the last process to take leadership, if any"""
+        try:
+            with open(self.path) as f:
+                pid = f.read().strip()
+        except OSError:
+            return None
+        return int(pid) if pid.isdigit() else None
+
+    def release(self):
+        with self._lock:
+            if self._file is None:
+                return
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
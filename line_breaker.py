@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Line breaking for card text
+
+Breaks text into lines using prefix sums of per-character advance widths and
+bisection, so each line costs O(log n) instead of re-measuring every candidate
+line. Break opportunities follow a simplified UAX #14: after spaces and
+hyphens, and between CJK ideographs/kana, while keeping closing punctuation
+off the start of a line and opening punctuation off the end of a line.
+"""
+
+import re
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Callable, List, Optional
+
+# Closing punctuation that must not start a line (UAX #14 CL/CP/EX/IS/NS)
+NO_BREAK_BEFORE = set(
+    ',.!?;:)]}%'
+    '，。、！？；：）］｝」』】〉》〕〗〙〛’”…‥・ー々'
+    'ぁぃぅぇぉっゃゅょゎァィゥェォッャュョヮヵヶ'
+    '｡､｣ｰ'
+)
+
+# Opening punctuation that must not end a line (UAX #14 OP/QU)
+NO_BREAK_AFTER = set(
+    '([{'
+    '（［｛「『【〈《〔〖〘〚‘“'
+    '｢'
+)
+
+def is_ideographic(char: str) -> bool:
+    """Check if a character breaks like an ideograph (UAX #14 ID class)"""
+    code = ord(char)
+    return (
+        0x2E80 <= code <= 0x9FFF or    # CJK radicals, kana, CJK symbols, unified ideographs
+        0xAC00 <= code <= 0xD7AF or    # Hangul syllables
+        0xF900 <= code <= 0xFAFF or    # CJK compatibility ideographs
+        0xFF00 <= code <= 0xFFEF or    # Halfwidth and fullwidth forms
+        0x20000 <= code <= 0x3FFFF     # CJK extension planes
+    )
+
+def find_break_opportunities(text: str) -> List[bool]:
+    """Return a list where entry k is True if a line may break before text[k]"""
+    n = len(text)
+    breaks = [False] * (n + 1)
+    breaks[n] = True
+
+    for k in range(1, n):
+        before = text[k - 1]
+        after = text[k]
+
+        if after == ' ':
+            continue
+        if before == ' ':
+            breaks[k] = True
+        elif after in NO_BREAK_BEFORE or before in NO_BREAK_AFTER:
+            continue
+        elif is_ideographic(before) or is_ideographic(after):
+            breaks[k] = True
+        elif before == '-' and k >= 2 and text[k - 2] != ' ':
+            breaks[k] = True
+
+    return breaks
+
+def break_lines(text: str, char_width: Callable[[str], float], max_width: float,
+                line_width: Optional[Callable[[str], float]] = None) -> List[str]:
+    """Break text into lines no wider than max_width.
+
+    ``char_width`` returns the advance width of a single character and is
+    summed into prefix sums. ``line_width``, when given, is the exact width of
+    a finished line (including kerning); a line that overflows by that measure
+    is pulled back to the previous break opportunity.
+    """
+    # Collapse whitespace like str.split() so spacing never drives layout
+    text = re.sub(r'\s+', ' ', text).strip()
+    if not text:
+        return ['']
+
+    n = len(text)
+    prefix = [0.0]
+    prefix.extend(accumulate(char_width(char) for char in text))
+
+    # last_break[k] is the latest break opportunity at or before k
+    breaks = find_break_opportunities(text)
+    last_break = [0] * (n + 1)
+    latest = 0
+    for k in range(n + 1):
+        if breaks[k]:
+            latest = k
+        last_break[k] = latest
+
+    lines = []
+    start = 0
+    while start < n:
+        # Furthest end index whose advance sum still fits
+        end = bisect_right(prefix, prefix[start] + max_width, start) - 1
+
+        if end >= n:
+            brk = n
+        else:
+            # A space right at the limit is dropped, so breaking after it is free
+            limit = end + 1 if text[end] == ' ' else end
+            brk = last_break[limit]
+            if brk <= start:
+                # No opportunity on this line: break inside the word
+                brk = max(end, start + 1)
+
+        line = text[start:brk].rstrip(' ')
+
+        # Advance sums ignore kerning, so check the finished line exactly
+        if line_width is not None:
+            while line_width(line) > max_width and brk - start > 1:
+                earlier = last_break[brk - 1]
+                brk = earlier if earlier > start else brk - 1
+                line = text[start:brk].rstrip(' ')
+
+        lines.append(line)
+        start = brk
+        while start < n and text[start] == ' ':
+            start += 1
+
+    return lines if lines else ['']
@@ -80,6 +80,24 @@ def monitor_memory(func):
     """Decorator to monitor memory usage"""
     return memory_monitor.memory_limit_decorator(func)
 
+# Memory limits of the container, cgroup v2 then v1; an unlimited v1 cgroup
+# reports a huge number, so the smaller of this and physical RAM wins
+CGROUP_MEMORY_LIMIT_FILES = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+def total_memory_mb() -> float:
+    """RAM this process may use: the container's cgroup limit if it has one, else physical RAM"""
+    total = psutil.virtual_memory().total
+    for path in CGROUP_MEMORY_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            total = min(total, int(value))
+        break
+    return total / (1024 ** 2)
+
 def check_available_memory(min_required_mb: int = 500) -> bool:
     """Check if enough memory is available for video generation"""
     memory_usage = memory_monitor.get_memory_usage()
@@ -103,35 +121,42 @@ def optimize_for_low_memory() -> Dict[str, Any]:
         'temp_cleanup': True      # Clean temp files immediately
     }
 
+# Encode profiles, best quality first
+VIDEO_PROFILES = {
+    '1080p': {
+        'resolution': (1920, 1080),
+        'fps': 24,
+        'video_bitrate': '800k',
+        'audio_bitrate': '128k',
+        'threads': 2,
+        'preset': 'medium'
+    },
+    '720p': {
+        'resolution': (1280, 720),
+        'fps': 24,
+        'video_bitrate': '500k',
+        'audio_bitrate': '64k',
+        'threads': 2,
+        'preset': 'fast'
+    },
+    '480p': {
+        'resolution': (854, 480),
+        'fps': 20,
+        'video_bitrate': '300k',
+        'audio_bitrate': '48k',
+        'threads': 1,
+        'preset': 'ultrafast'
+    }
+}
+
 def get_memory_safe_settings(available_memory_mb: float) -> Dict[str, Any]:
     """Get video settings based on available memory"""
     if available_memory_mb < 512:  # Less than 512MB
-        return {
-            'resolution': (854, 480),   # 480p
-            'fps': 20,
-            'video_bitrate': '300k',
-            'audio_bitrate': '48k',
-            'threads': 1,
-            'preset': 'ultrafast'
-        }
+        return dict(VIDEO_PROFILES['480p'])
     elif available_memory_mb < 1024:  # Less than 1GB
-        return {
-            'resolution': (1280, 720),  # 720p
-            'fps': 24,
-            'video_bitrate': '500k',
-            'audio_bitrate': '64k',
-            'threads': 2,
-            'preset': 'fast'
-        }
+        return dict(VIDEO_PROFILES['720p'])
     else:  # 1GB or more
-        return {
-            'resolution': (1920, 1080), # 1080p
-            'fps': 24,
-            'video_bitrate': '800k',
-            'audio_bitrate': '128k',
-            'threads': 2,
-            'preset': 'medium'
-        }
+        return dict(VIDEO_PROFILES['1080p'])
 
 # Example usage
 if __name__ == '__main__':
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Move flat outputs (static/outputs/<title>_<timestamp>.mp4) into the
+content-addressed shard layout, updating the storage catalog and the
+result cache so nothing is forgotten or re-rendered. Safe to run while
+the app serves: new outputs already go to shards, and a file cleanup
+removes mid-migration is just reported.
+
+    python migrate_outputs.py --dry-run
+    python migrate_outputs.py --link     # keep old URLs working via symlinks
+"""
+
+import os
+import sys
+import logging
+import argparse
+from typing import Dict, Optional, Tuple
+from output_store import OutputStore, create_output_store, hash_file
+from storage_catalog import StorageCatalog
+from eviction_policies import get_eviction_policy
+from result_cache import ResultCache
+
+def flat_outputs(folder: str, extensions: tuple = ('.mp4',)):
+    """Regular files directly in the output folder, i.e. the old layout"""
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and entry.name.endswith(extensions):
+                yield entry.path
+
+def migrate(store: OutputStore, catalog: Optional[StorageCatalog] = None,
+            result_cache: Optional[ResultCache] = None, link: bool = False,
+            dry_run: bool = False) -> Dict:
+    """Publish every flat output into its shard; returns counts of what happened"""
+    moves: Dict[str, Tuple[str, str]] = {}
+    result = {'moved': 0, 'deduplicated': 0, 'linked': 0, 'cataloged': 0, 'result_entries': 0, 'errors': []}
+
+    for old_path in sorted(flat_outputs(store.root)):
+        try:
+            if dry_run:
+                new_path = store.path_for(hash_file(old_path))
+                print(f"   {os.path.basename(old_path)} -> {store.url_for(new_path)}")
+                result['moved'] += 1
+                continue
+
+            new_path, is_new = store.publish(old_path)
+            result['moved' if is_new else 'deduplicated'] += 1
+            moves[old_path] = (new_path, store.url_for(new_path))
+            if catalog and catalog.move(old_path, new_path):
+                result['cataloged'] += 1
+            if link:
+                os.symlink(os.path.relpath(new_path, store.root), old_path)
+                result['linked'] += 1
+        except OSError as e:
+            result['errors'].append(f"{old_path}: {e}")
+
+    if result_cache and moves:
+        result['result_entries'] = result_cache.relocate(moves)
+    return result
+
+def main(argv=None) -> int:
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Move flat outputs into the hash-sharded layout")
+    parser.add_argument('--folder', default=Config.UPLOAD_FOLDER, help="output folder")
+    parser.add_argument('--catalog', default=Config.STORAGE_CATALOG_PATH, help="storage catalog database")
+    parser.add_argument('--result-cache', default=Config.RESULT_CACHE_DIR, help="result cache directory")
+    parser.add_argument('--link', action='store_true', help="leave a symlink at each old path")
+    parser.add_argument('--dry-run', action='store_true', help="only print where files would go")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Outputs go wherever OUTPUT_STORAGE_BACKEND points, e.g. straight into the bucket
+    store_config = {name: getattr(Config, name) for name in dir(Config) if name.isupper()}
+    store_config['UPLOAD_FOLDER'] = args.folder
+    store = create_output_store(store_config)
+    if args.link and store.backend.name != 'local':
+        parser.error("--link needs the local storage backend")
+    if args.dry_run:
+        result = migrate(store, dry_run=True)
+        print(f"🔍 {result['moved']} outputs would be moved")
+        return 0
+
+    catalog = None
+    if os.path.exists(args.catalog):
+        catalog = StorageCatalog(args.catalog, get_eviction_policy(Config.STORAGE_EVICTION_POLICY))
+    try:
+        result = migrate(store, catalog, ResultCache(args.result_cache), link=args.link)
+    finally:
+        if catalog:
+            catalog.close()
+
+    print(f"📦 Moved {result['moved']} outputs, {result['deduplicated']} were duplicates")
+    print(f"   Catalog entries moved: {result['cataloged']}")
+    print(f"   Result cache entries updated: {result['result_entries']}")
+    if args.link:
+        print(f"   Symlinks left at old paths: {result['linked']}")
+    for error in result['errors']:
+        print(f"   ⚠️  {error}")
+    return 1 if result['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
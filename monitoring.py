@@ -18,8 +18,16 @@ class UsageTracker:
     def __init__(self):
         self.requests = 0
         self.errors = 0
+        self.rejected = 0
         self.total_generation_time = 0
         self.provider_usage = {}
+        self.stage_totals = {}
+        self.stage_counts = {}
+    
+    def track_stage_timings(self, timings):
+        for stage, seconds in (timings or {}).items():
+            self.stage_totals[stage] = self.stage_totals.get(stage, 0) + seconds
+            self.stage_counts[stage] = self.stage_counts.get(stage, 0) + 1
     
     def track_request(self, success=True, generation_time=0, provider=None):
         self.requests += 1
@@ -32,11 +40,20 @@ class UsageTracker:
                 self.provider_usage[provider] = 0
             self.provider_usage[provider] += 1
     
+    def track_rejection(self):
+        # Turned away while busy; not a failed generation
+        self.rejected += 1
+    
     def get_stats(self):
         return {
             'requests': self.requests,
             'errors': self.errors,
             'error_rate': self.errors / max(self.requests, 1),
+            'rejected': self.rejected,
             'avg_generation_time': self.total_generation_time / max(self.requests, 1),
-            'provider_usage': self.provider_usage
+            'provider_usage': self.provider_usage,
+            'avg_stage_times': {
+                stage: total / self.stage_counts[stage]
+                for stage, total in self.stage_totals.items()
+            }
         }
\ No newline at end of file
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Content-addressed, hash-sharded layout for finished videos
+"""
+
+import os
+import re
+import hashlib
+import logging
+import secrets
+import threading
+import psutil
+from typing import Iterator, Optional, Tuple
+from storage_backends import StorageBackend, LocalStorageBackend, create_storage_backend
+
+STAGING_DIR = '.staging'
+
+logger = logging.getLogger(__name__)
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class OutputStore:
+    """Finished videos named by the SHA-256 of their bytes, under prefix shards.
+
+    A video with digest ``h`` lives at ``<root>/h[0:2]/h[2:4]/h.mp4``, so no
+    directory holds more than a few entries even at millions of outputs,
+    names can't collide, and identical videos are stored once. Videos are
+    encoded into ``<root>/.staging`` and renamed into place by ``publish``,
+    so a half-written file never appears under its final name.
+
+    Paths under ``root`` name outputs everywhere (catalog, result cache);
+    the ``backend`` decides where their bytes are kept. With a streaming
+    backend, ``start_upload`` sends a video there while it is encoded.
+    """
+
+    def __init__(self, root: str, url_prefix: str = '/static/outputs', levels: int = 2, width: int = 2,
+                 backend: Optional[StorageBackend] = None):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.levels = levels
+        self.width = width
+        self.backend = backend or LocalStorageBackend(root)
+        self.staging_dir = os.path.join(root, STAGING_DIR)
+        shard = r'[0-9a-f]{%d}/' % width
+        self._relative_pattern = re.compile(r'^(?:%s){%d}([0-9a-f]{64})\.(\w+)$' % (shard, levels))
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def staging_path(self, filename: str) -> str:
+        """A fresh path to encode into; concurrent jobs with one filename get their own"""
+        stem, ext = os.path.splitext(os.path.basename(filename))
+        return os.path.join(self.staging_dir, f"{stem}-{os.getpid()}-{secrets.token_hex(4)}{ext}")
+
+    def relative_path(self, digest: str, extension: str = 'mp4') -> str:
+        shards = [digest[i * self.width:(i + 1) * self.width] for i in range(self.levels)]
+        return '/'.join(shards + [f"{digest}.{extension}"])
+
+    def path_for(self, digest: str, extension: str = 'mp4') -> str:
+        return os.path.join(self.root, *self.relative_path(digest, extension).split('/'))
+
+    def key_for(self, path: str) -> str:
+        """The backend key of an output path"""
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def url_for(self, path: str) -> str:
+        return f"{self.url_prefix}/{self.key_for(path)}"
+
+    def path_from_url(self, url: str) -> Optional[str]:
+        """Map a video URL back to its file; None unless it names a sharded output"""
+        if not url.startswith(self.url_prefix + '/'):
+            return None
+        return self.path_from_key(url[len(self.url_prefix) + 1:])
+
+    def path_from_key(self, key: str) -> Optional[str]:
+        if not self._relative_pattern.match(key):
+            return None
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, path: str) -> bool:
+        return self.backend.exists(self.key_for(path))
+
+    def publish(self, source_path: str, extension: str = 'mp4') -> Tuple[str, bool]:
+        """Move a finished file to its content address.
+
+        Returns (final path, whether it was new). When the same bytes are
+        already stored the source is dropped and the existing file reused.
+        """
+        digest = hash_file(source_path)
+        target = self.path_for(digest, extension)
+        key = self.key_for(target)
+        if self.backend.exists(key):
+            # Touch before dropping the source: if cleanup evicts the stored
+            # copy meanwhile, the source is stored again below
+            try:
+                self.backend.touch(key)
+            except FileNotFoundError:
+                pass
+            else:
+                os.remove(source_path)
+                return target, False
+        self.backend.put_file(source_path, key)
+        return target, True
+
+    def start_upload(self, pipe_path: str, extension: str = 'mp4') -> 'StreamingUpload':
+        """Stream a video to the backend as it is written to ``pipe_path``, which is made a FIFO"""
+        staging_key = f"{STAGING_DIR}/{secrets.token_hex(16)}.{extension}"
+        return StreamingUpload(self, pipe_path, staging_key, extension)
+
+    def sweep_staging(self) -> int:
+        """Remove staged files whose encoding process no longer exists"""
+        removed = 0
+        try:
+            names = os.listdir(self.staging_dir)
+        except OSError:
+            return 0
+        for name in names:
+            # Named <stem>-<pid>-<token><ext> by staging_path
+            parts = name.rsplit('-', 2)
+            if len(parts) != 3 or not parts[1].isdigit() or psutil.pid_exists(int(parts[1])):
+                continue
+            try:
+                os.remove(os.path.join(self.staging_dir, name))
+                removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"Removed {removed} stale staged outputs")
+        return removed
+
+    def iter_outputs(self) -> Iterator[str]:
+        """Every published output"""
+        for key, _, _ in self.backend.iter_objects():
+            path = self.path_from_key(key)
+            if path:
+                yield path
+
+class StreamingUpload:
+    """Upload a video while the encoder writes it into a FIFO.
+
+    A thread reads the FIFO, hashing the bytes and handing them to a
+    backend writer, so parts leave the host as the encoder produces them.
+    The content address is only known at the end: ``finish`` completes the
+    upload under a staging key and moves it to its final key, or drops it
+    when those bytes are already stored. ``abort`` discards the upload and
+    does nothing after ``finish``.
+    """
+
+    def __init__(self, store: OutputStore, pipe_path: str, staging_key: str, extension: str):
+        self.store = store
+        self.path = pipe_path
+        self.staging_key = staging_key
+        self.extension = extension
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._writer = store.backend.open_writer(staging_key)
+        self._error = None
+        self._done = False
+        os.mkfifo(pipe_path)
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+
+    def _pump(self):
+        try:
+            with open(self.path, 'rb') as pipe:
+                for chunk in iter(lambda: pipe.read(256 * 1024), b''):
+                    if self._error is not None:
+                        continue  # Keep draining so the encoder isn't blocked on a full pipe
+                    try:
+                        self._digest.update(chunk)
+                        self._writer.write(chunk)
+                        self.size += len(chunk)
+                    except Exception as e:
+                        self._error = e
+        except OSError as e:
+            self._error = e
+
+    def _wait(self):
+        # A reader still blocked opening the FIFO (the encoder never opened
+        # it) gets end-of-file from a writer that connects and leaves
+        while self._thread.is_alive():
+            try:
+                os.close(os.open(self.path, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+            self._thread.join(timeout=0.1)
+
+    def finish(self) -> Tuple[str, bool]:
+        """Complete the upload; returns (output path, whether it was new) like publish"""
+        self._wait()
+        if self._error is not None:
+            raise self._error
+        if not self.size:
+            raise IOError(f"Encoder wrote nothing to {self.path}")
+        self._writer.close()
+        self._done = True
+
+        target = self.store.path_for(self._digest.hexdigest(), self.extension)
+        key = self.store.key_for(target)
+        backend = self.store.backend
+        if backend.exists(key):
+            try:
+                backend.touch(key)
+            except FileNotFoundError:
+                pass  # Evicted meanwhile; move this upload into its place
+            else:
+                backend.delete(self.staging_key)
+                return target, False
+        try:
+            backend.move(self.staging_key, key)
+        except Exception:
+            # The upload is complete, so abort has nothing left to drop
+            try:
+                backend.delete(self.staging_key)
+            except Exception:
+                pass
+            raise
+        return target, True
+
+    def abort(self):
+        if self._done:
+            return
+        self._done = True
+        self._wait()
+        self._writer.abort()
+
+def create_output_store(config) -> OutputStore:
+    """The store for UPLOAD_FOLDER and OUTPUT_STORAGE_BACKEND.
+
+    Local outputs are static files; outputs elsewhere are served by the
+    app's /outputs route.
+    """
+    backend = create_storage_backend(config)
+    url_prefix = '/static/outputs' if backend.name == 'local' else '/outputs'
+    return OutputStore(config['UPLOAD_FOLDER'], url_prefix, backend=backend)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Whole-output cache: identical generation requests share one MP4
+"""
+
+import os
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import secrets
+import tempfile
+import threading
+from typing import Callable, Dict, Optional, Tuple
+from tts_cache import normalize_text, normalize_paragraphs
+
+# Bump when rendering or encoding changes so old outputs stop matching
+RESULT_CACHE_VERSION = 2
+
+def request_fingerprint(data: Dict) -> str:
+    """Hash of the normalized request fields that determine the output video"""
+    fields = {
+        'version': RESULT_CACHE_VERSION,
+        'text': normalize_paragraphs(data['text']),
+        'title': normalize_text(data['title']),
+        'color_template': data['color_template'],
+        'title_font': data['title_font'],
+        'body_font': data['body_font'],
+        'voice_provider': data['voice_provider'],
+        'voice': data['voice'],
+        'voice_speed': round(float(data['voice_speed']), 3),
+        'voice_stability': round(float(data['voice_stability']), 3)
+    }
+    payload = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """Map request fingerprints to finished videos, and collapse duplicate work.
+
+    Entries are small JSON files written atomically; a request that starts
+    generating takes an O_EXCL claim file, so identical requests in any
+    gunicorn worker wait for its result instead of starting their own.
+    A background thread touches the claims this process holds, so only
+    the claim of a dead or wedged owner goes ``claim_timeout`` without an
+    update and may be broken. ``exists`` checks that a stored video is
+    still there (a local file by default; outputs in a bucket need the
+    store's check).
+    """
+
+    def __init__(self, cache_dir: str, claim_timeout: float = 600,
+                 exists: Optional[Callable[[str], bool]] = None):
+        self.cache_dir = cache_dir
+        self.claim_timeout = claim_timeout
+        self.exists = exists or os.path.exists
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._held: Dict[str, str] = {}
+        self._heartbeat = None
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, f"{fingerprint}.json")
+
+    def _claim_path(self, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, f"{fingerprint}.claim")
+
+    def _is_stale(self, path: str) -> bool:
+        return time.time() - os.path.getmtime(path) > self.claim_timeout
+
+    def lookup(self, fingerprint: str) -> Optional[str]:
+        """Return the stored video URL if its file still exists"""
+        path = self._entry_path(fingerprint)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if not self.exists(entry['video_path']):
+            # Removed by storage cleanup; forget it
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return entry['video_url']
+
+    def store(self, fingerprint: str, video_path: str, video_url: str):
+        entry = {'video_path': video_path, 'video_url': video_url, 'created_at': time.time()}
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, self._entry_path(fingerprint))
+        except Exception as e:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            self.logger.error(f"Result cache store failed: {e}")
+
+    def claim(self, fingerprint: str, owner: str) -> Optional[str]:
+        """Claim the work for a fingerprint; returns None on success, else the current owner"""
+        path = self._claim_path(fingerprint)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                current = self.owner(fingerprint)
+                try:
+                    stale = self._is_stale(path)
+                except OSError:
+                    continue  # Released meanwhile; try again
+                if not stale:
+                    return current or ''
+                # The owner died without releasing; take over
+                self._break_stale(fingerprint, current)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(owner)
+            self._hold(fingerprint, owner)
+            return None
+        return self.owner(fingerprint) or ''
+
+    def _break_stale(self, fingerprint: str, current: Optional[str]):
+        """Remove a stale claim without ever removing a fresh one.
+
+        Breakers take turns under an flock (freed by the kernel if a
+        breaker dies), and move the claim aside before looking at it: if
+        what was moved turns out to be a new claim, made after the stale
+        one was released, it is linked back into place.
+        """
+        path = self._claim_path(fingerprint)
+        with open(os.path.join(self.cache_dir, '.claims.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            aside = f"{path}.{secrets.token_hex(8)}.stale"
+            try:
+                os.rename(path, aside)
+            except OSError:
+                return  # Already broken or released
+            try:
+                if self._is_stale(aside):
+                    self.logger.warning(f"Breaking stale claim on {fingerprint} held by {current}")
+                else:
+                    try:
+                        os.link(aside, path)
+                    except FileExistsError:
+                        pass
+            finally:
+                os.remove(aside)
+
+    def _hold(self, fingerprint: str, owner: str):
+        with self._lock:
+            self._held[fingerprint] = owner
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, daemon=True, name='result-claims')
+                self._heartbeat.start()
+
+    def _beat(self):
+        while True:
+            time.sleep(max(self.claim_timeout / 4, 0.05))
+            self.refresh()
+
+    def refresh(self):
+        """Touch every claim this process holds, so waiters know its owner is alive"""
+        with self._lock:
+            held = list(self._held.items())
+        for fingerprint, owner in held:
+            if self.owner(fingerprint) == owner:
+                try:
+                    os.utime(self._claim_path(fingerprint))
+                except OSError:
+                    pass
+
+    def owner(self, fingerprint: str) -> Optional[str]:
+        try:
+            with open(self._claim_path(fingerprint)) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def release(self, fingerprint: str, owner: str):
+        with self._lock:
+            if self._held.get(fingerprint) == owner:
+                del self._held[fingerprint]
+        if self.owner(fingerprint) == owner:
+            try:
+                os.remove(self._claim_path(fingerprint))
+            except OSError:
+                pass
+
+    def wait(self, fingerprint: str, timeout: float, poll_interval: float = 0.25) -> Optional[str]:
+        """Wait for another request's in-flight result; None if it failed or took too long"""
+        with self._lock:
+            self.collapsed += 1
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not os.path.exists(self._claim_path(fingerprint)):
+                return self.lookup(fingerprint)
+            time.sleep(poll_interval)
+        return None
+
+    def relocate(self, moves: Dict[str, Tuple[str, str]]) -> int:
+        """Point entries at moved videos; ``moves`` maps old path to (new path, new URL)"""
+        updated = 0
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if entry.get('video_path') not in moves:
+                continue
+            entry['video_path'], entry['video_url'] = moves[entry['video_path']]
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+            updated += 1
+        return updated
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / max(lookups, 1),
+                'collapsed': self.collapsed
+            }
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Where finished outputs are kept: the local output folder or an S3-compatible bucket
+"""
+
+import os
+import stat
+import errno
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# S3 rejects multipart parts under 5MB, except the last
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+class StorageBackend:
+    """Object storage for outputs, addressed by '/'-separated keys such as 'ab/cd/<sha256>.mp4'.
+
+    ``streams`` backends take an output while it is still being written
+    (``open_writer``), so it never has to be kept whole on the encode host.
+    Downloads are either served from ``local_path`` by the web server, or
+    redirected to ``download_url`` or proxied from ``read_range``.
+    """
+
+    name = ''
+    streams = False
+
+    def put_file(self, source_path: str, key: str):
+        """Store a finished local file under key; the source is consumed"""
+        raise NotImplementedError
+
+    def open_writer(self, key: str):
+        """A writer (write/close/abort) that stores what is written under key on close"""
+        raise NotImplementedError
+
+    def move(self, source_key: str, key: str):
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        """(size, mtime) of a stored object, or None if there is none"""
+        raise NotImplementedError
+
+    def touch(self, key: str):
+        """Mark an object as just written; used when a duplicate is stored again"""
+
+    def delete(self, key: str):
+        """Delete an object; raises FileNotFoundError if the backend can tell it was already gone"""
+        raise NotImplementedError
+
+    def iter_objects(self) -> Iterator[Tuple[str, int, float]]:
+        """(key, size, mtime) of every stored object"""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """A file the web server can serve directly, if objects live on this host"""
+        return None
+
+    def download_url(self, key: str) -> Optional[str]:
+        """A URL clients can fetch the object from directly, if downloads are redirected"""
+        return None
+
+    def read_range(self, key: str, start: int, end: int, chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+        """Bytes start..end (inclusive) of an object, for proxied downloads"""
+        raise NotImplementedError
+
+class LocalStorageBackend(StorageBackend):
+    """Objects are files under ``root``; keys are their relative paths"""
+
+    name = 'local'
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def put_file(self, source_path: str, key: str):
+        target = self.local_path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(source_path, target)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        # Different filesystem: copy next to the target, then rename atomically
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as dst, open(source_path, 'rb') as src:
+                shutil.copyfileobj(src, dst)
+            os.replace(temp_path, target)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.remove(source_path)
+
+    def move(self, source_key: str, key: str):
+        self.put_file(self.local_path(source_key), key)
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        try:
+            st = os.stat(self.local_path(key))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime
+
+    def touch(self, key: str):
+        os.utime(self.local_path(key))
+
+    def delete(self, key: str):
+        os.remove(self.local_path(key))
+
+    def iter_objects(self) -> Iterator[Tuple[str, int, float]]:
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            # Skip staging areas, and links left at old locations by a migration
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            relative_dir = os.path.relpath(dirpath, self.root).replace(os.sep, '/')
+            for filename in filenames:
+                try:
+                    st = os.lstat(os.path.join(dirpath, filename))
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                key = filename if relative_dir == '.' else f"{relative_dir}/{filename}"
+                yield key, st.st_size, st.st_mtime
+
+    def read_range(self, key, start, end, chunk_size=256 * 1024):
+        with open(self.local_path(key), 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+class S3MultipartWriter:
+    """Upload to S3 as bytes arrive: every ``part_size`` bytes go out as a multipart part.
+
+    At most one part is held in memory. Outputs smaller than one part are
+    sent with a single PUT on close; ``abort`` discards any uploaded parts.
+    """
+
+    def __init__(self, client, bucket: str, key: str, part_size: int, content_type: str = 'video/mp4'):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.content_type = content_type
+        self.upload_id = None
+        self.parts: List[Dict] = []
+        self.size = 0
+        self._buffer = bytearray()
+
+    def write(self, data: bytes):
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+
+    def _upload_part(self, body: bytes):
+        if self.upload_id is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key,
+                                                           ContentType=self.content_type)
+            self.upload_id = response['UploadId']
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=body)
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': number})
+
+    def close(self):
+        if self.upload_id is None:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer),
+                                   ContentType=self.content_type)
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                  MultipartUpload={'Parts': self.parts})
+        self._buffer = bytearray()
+
+    def abort(self):
+        self._buffer = bytearray()
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+
+def _is_missing(error: Exception) -> bool:
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+class S3StorageBackend(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS, MinIO, R2...) under ``prefix``.
+
+    ``client`` is a boto3 S3 client or anything with the same methods.
+    Downloads are redirected to presigned URLs when ``redirect_downloads``
+    is set, otherwise the app proxies them, ranges included.
+    """
+
+    name = 's3'
+    streams = True
+
+    def __init__(self, client, bucket: str, prefix: str = '', part_size: int = 8 * 1024 * 1024,
+                 redirect_downloads: bool = True, url_expires: int = 3600):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.part_size = part_size
+        self.redirect_downloads = redirect_downloads
+        self.url_expires = url_expires
+
+    def _object_key(self, key: str) -> str:
+        return self.prefix + key
+
+    def open_writer(self, key: str) -> S3MultipartWriter:
+        return S3MultipartWriter(self.client, self.bucket, self._object_key(key), self.part_size)
+
+    def put_file(self, source_path: str, key: str):
+        writer = self.open_writer(key)
+        try:
+            with open(source_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.part_size), b''):
+                    writer.write(chunk)
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        os.remove(source_path)
+
+    def move(self, source_key: str, key: str):
+        # A server-side copy; the bytes don't come back through this host
+        self.client.copy_object(Bucket=self.bucket, Key=self._object_key(key),
+                                CopySource={'Bucket': self.bucket, 'Key': self._object_key(source_key)})
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(source_key))
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if _is_missing(e):
+                return None
+            raise
+        return response['ContentLength'], _timestamp(response['LastModified'])
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def iter_objects(self) -> Iterator[Tuple[str, int, float]]:
+        kwargs = {'Bucket': self.bucket, 'Prefix': self.prefix}
+        while True:
+            response = self.client.list_objects_v2(**kwargs)
+            for item in response.get('Contents', []):
+                key = item['Key'][len(self.prefix):]
+                # Skip staging uploads, like the dot-directories of a local folder
+                if key.startswith('.') or '/.' in key:
+                    continue
+                yield key, item['Size'], _timestamp(item['LastModified'])
+            if not response.get('IsTruncated'):
+                return
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+    def download_url(self, key: str) -> Optional[str]:
+        if not self.redirect_downloads:
+            return None
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._object_key(key)}, ExpiresIn=self.url_expires
+        )
+
+    def read_range(self, key, start, end, chunk_size=256 * 1024):
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key), Range=f"bytes={start}-{end}")
+        body = response['Body']
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+def _timestamp(value) -> float:
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+def create_storage_backend(config, client=None) -> StorageBackend:
+    """The backend named by OUTPUT_STORAGE_BACKEND ('local' or 's3')"""
+    name = config.get('OUTPUT_STORAGE_BACKEND', 'local')
+    if name == 'local':
+        return LocalStorageBackend(config['UPLOAD_FOLDER'])
+    if name != 's3':
+        raise ValueError(f"Unknown output storage backend {name!r}; choose local or s3")
+
+    if client is None:
+        try:
+            import boto3
+        except ImportError:
+            raise ImportError("OUTPUT_STORAGE_BACKEND=s3 needs boto3 (pip install boto3)")
+        client = boto3.client(
+            's3',
+            endpoint_url=config.get('S3_ENDPOINT_URL') or None,
+            region_name=config.get('S3_REGION') or None
+        )
+    return S3StorageBackend(
+        client,
+        config['S3_BUCKET'],
+        prefix=config.get('S3_PREFIX', ''),
+        part_size=max(int(config.get('S3_PART_SIZE_MB', 8)) * 1024 * 1024, MIN_PART_SIZE),
+        redirect_downloads=config.get('S3_REDIRECT_DOWNLOADS', True),
+        url_expires=config.get('S3_URL_EXPIRES', 3600)
+    )
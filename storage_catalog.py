@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Persistent catalog of generated outputs with running totals
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from eviction_policies import EvictionPolicy, LRUPolicy
+from storage_backends import StorageBackend, LocalStorageBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    last_access REAL NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    priority REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    files INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, files, bytes) VALUES (1, 0, 0);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS outputs_insert AFTER INSERT ON outputs BEGIN
+    UPDATE totals SET files = files + 1, bytes = bytes + NEW.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS outputs_delete AFTER DELETE ON outputs BEGIN
+    UPDATE totals SET files = files - 1, bytes = bytes - OLD.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS outputs_update AFTER UPDATE OF size ON outputs BEGIN
+    UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE id = 1;
+END;
+"""
+
+# Columns added after the first catalog version, with their defaults
+ACCESS_COLUMNS = {
+    'last_access': 'REAL NOT NULL DEFAULT 0',
+    'hits': 'INTEGER NOT NULL DEFAULT 0',
+    'priority': 'REAL NOT NULL DEFAULT 0'
+}
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS outputs_by_mtime ON outputs (mtime);
+CREATE INDEX IF NOT EXISTS outputs_by_access ON outputs (last_access);
+CREATE INDEX IF NOT EXISTS outputs_by_priority ON outputs (priority, last_access);
+"""
+
+COLUMNS = 'path, size, mtime, last_access, hits, priority'
+
+class CatalogEntry(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    last_access: float
+    hits: int
+    priority: float
+
+class StorageCatalog:
+    """SQLite index of output files, updated as they are written, watched and deleted.
+
+    Triggers keep a one-row running total of files and bytes, so totals are
+    O(1). Each output also carries its access count, last access time and
+    an eviction priority from the ``policy`` (LRU by default); the priority
+    index hands out eviction candidates in order, so evicting k files costs
+    O(k log n) instead of a directory walk. The database runs in WAL mode
+    and is shared by every gunicorn worker.
+    """
+
+    def __init__(self, db_path: str, policy: Optional[EvictionPolicy] = None, timeout: float = 30):
+        self.db_path = db_path
+        self.policy = policy or LRUPolicy()
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.executescript(INDEXES)
+        if self._get_meta('policy') != self.policy.name:
+            self._reprioritize()
+
+    def _migrate(self):
+        """Add the access columns to a catalog created before they existed"""
+        existing = {row[1] for row in self._conn.execute('PRAGMA table_info(outputs)')}
+        missing = [column for column in ACCESS_COLUMNS if column not in existing]
+        for column in missing:
+            self._conn.execute(f'ALTER TABLE outputs ADD COLUMN {column} {ACCESS_COLUMNS[column]}')
+        if missing:
+            self._conn.execute('UPDATE outputs SET last_access = mtime WHERE last_access = 0')
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def _inflation(self) -> float:
+        return float(self._get_meta('inflation') or 0.0)
+
+    def _reprioritize(self):
+        """Recompute every priority after the policy changed; a one-off O(n) pass"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute('SELECT path, size, last_access, hits FROM outputs').fetchall()
+                for path, size, last_access, hits in rows:
+                    self._conn.execute('UPDATE outputs SET priority = ? WHERE path = ?',
+                                       (self.policy.priority(hits, size, last_access, 0.0), path))
+                self._set_meta('inflation', 0.0)
+                self._set_meta('policy', self.policy.name)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        if rows:
+            self.logger.info(f"Storage catalog switched to {self.policy.name} eviction ({len(rows)} outputs)")
+
+    def _upsert(self, path: str, size: int, mtime: float):
+        # A rewritten output keeps its access count, and the write counts as a use
+        row = self._conn.execute('SELECT hits, last_access FROM outputs WHERE path = ?', (path,)).fetchone()
+        hits, last_access = (row[0], max(row[1], mtime)) if row else (0, mtime)
+        priority = self.policy.priority(hits, size, last_access, self._inflation())
+        self._conn.execute(
+            'INSERT INTO outputs (path, size, mtime, last_access, hits, priority) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, '
+            'last_access = excluded.last_access, priority = excluded.priority',
+            (path, size, mtime, last_access, hits, priority)
+        )
+
+    def add(self, path: str, size: int, mtime: Optional[float] = None):
+        """Record a new or rewritten output"""
+        mtime = time.time() if mtime is None else mtime
+        with self._lock:
+            self._upsert(path, size, mtime)
+
+    def add_file(self, path: str) -> bool:
+        """Record an output from its stat; False if it doesn't exist"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        self.add(path, stat.st_size, stat.st_mtime)
+        return True
+
+    def record_access(self, path: str, when: Optional[float] = None) -> bool:
+        """Count a download or play of an output; False if it isn't cataloged"""
+        when = time.time() if when is None else when
+        with self._lock:
+            row = self._conn.execute('SELECT size, hits FROM outputs WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                return False
+            size, hits = row
+            priority = self.policy.priority(hits + 1, size, when, self._inflation())
+            self._conn.execute('UPDATE outputs SET hits = hits + 1, last_access = ?, priority = ? WHERE path = ?',
+                               (when, priority, path))
+        return True
+
+    def remove(self, path: str, evicted: bool = False):
+        """Forget an output; ``evicted`` advances the GreedyDual clock to its priority"""
+        with self._lock:
+            if evicted and self.policy.inflates:
+                row = self._conn.execute('SELECT priority FROM outputs WHERE path = ?', (path,)).fetchone()
+                if row and row[0] > self._inflation():
+                    self._set_meta('inflation', row[0])
+            self._conn.execute('DELETE FROM outputs WHERE path = ?', (path,))
+
+    def move(self, old_path: str, new_path: str) -> bool:
+        """Re-key an output that moved, keeping its history; False if old_path isn't cataloged.
+
+        If new_path is already cataloged (the same bytes were stored twice)
+        the two entries merge: hits add up and the later access wins.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                old = self._conn.execute(f'SELECT {COLUMNS} FROM outputs WHERE path = ?', (old_path,)).fetchone()
+                if old is None or old_path == new_path:
+                    self._conn.execute('COMMIT')
+                    return old is not None
+                old = CatalogEntry(*old)
+                new = self._conn.execute(f'SELECT {COLUMNS} FROM outputs WHERE path = ?', (new_path,)).fetchone()
+                size, mtime, last_access, hits = old.size, old.mtime, old.last_access, old.hits
+                if new:
+                    new = CatalogEntry(*new)
+                    size, mtime = new.size, new.mtime
+                    last_access, hits = max(last_access, new.last_access), hits + new.hits
+                self._conn.execute('DELETE FROM outputs WHERE path IN (?, ?)', (old_path, new_path))
+                self._conn.execute(
+                    f'INSERT INTO outputs ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)',
+                    (new_path, size, mtime, last_access, hits,
+                     self.policy.priority(hits, size, last_access, self._inflation()))
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return True
+
+    def get(self, path: str) -> Optional[CatalogEntry]:
+        with self._lock:
+            row = self._conn.execute(f'SELECT {COLUMNS} FROM outputs WHERE path = ?', (path,)).fetchone()
+        return CatalogEntry(*row) if row else None
+
+    def totals(self):
+        """(file count, total bytes)"""
+        with self._lock:
+            return self._conn.execute('SELECT files, bytes FROM totals WHERE id = 1').fetchone()
+
+    def eviction_order(self, batch_size: int = 100) -> Iterator[CatalogEntry]:
+        """Entries from the lowest priority up, fetched a batch at a time along the index"""
+        last = (float('-inf'), float('-inf'), '')
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT {COLUMNS} FROM outputs WHERE (priority, last_access, path) > (?, ?, ?) '
+                    'ORDER BY priority, last_access, path LIMIT ?',
+                    last + (batch_size,)
+                ).fetchall()
+            for row in rows:
+                yield CatalogEntry(*row)
+            if len(rows) < batch_size:
+                return
+            last = (rows[-1][5], rows[-1][3], rows[-1][0])
+
+    def idle_since(self, cutoff: float) -> List[CatalogEntry]:
+        """Entries not written or accessed since cutoff"""
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {COLUMNS} FROM outputs WHERE last_access < ? ORDER BY last_access', (cutoff,)
+            ).fetchall()
+        return [CatalogEntry(*row) for row in rows]
+
+    def entries(self) -> List[CatalogEntry]:
+        with self._lock:
+            rows = self._conn.execute(f'SELECT {COLUMNS} FROM outputs').fetchall()
+        return [CatalogEntry(*row) for row in rows]
+
+    def stats(self, now: Optional[float] = None, old_after_hours: float = 24) -> Dict:
+        """Totals plus age bounds, answered from the running total and the indexes"""
+        now = time.time() if now is None else now
+        with self._lock:
+            files, total_bytes = self._conn.execute('SELECT files, bytes FROM totals WHERE id = 1').fetchone()
+            oldest, newest = self._conn.execute('SELECT MIN(mtime), MAX(mtime) FROM outputs').fetchone()
+            old_files = self._conn.execute(
+                'SELECT COUNT(*) FROM outputs WHERE mtime < ?', (now - old_after_hours * 3600,)
+            ).fetchone()[0]
+            inflation = self._inflation()
+        return {
+            'files': files,
+            'bytes': total_bytes,
+            'oldest_mtime': oldest,
+            'newest_mtime': newest,
+            'old_files': old_files,
+            'policy': self.policy.name,
+            'inflation': inflation
+        }
+
+    def reconcile(self, folder: str, extensions: Optional[tuple] = None,
+                  backend: Optional[StorageBackend] = None) -> Dict:
+        """Bring the catalog in line with the folder after files changed behind its back.
+
+        This is the one full scan; it runs when a catalog is first created
+        and from scheduled cleanup, never on the request path. Outputs kept
+        in another ``backend`` are listed from there but cataloged under
+        their paths in ``folder``.
+        """
+        backend = backend or LocalStorageBackend(folder)
+        on_disk = {}
+        for key, size, mtime in backend.iter_objects():
+            if extensions and not key.endswith(extensions):
+                continue
+            on_disk[os.path.join(folder, *key.split('/'))] = (size, mtime)
+
+        known = {entry.path: entry for entry in self.entries()}
+        added = removed = 0
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for path in known.keys() - on_disk.keys():
+                    self._conn.execute('DELETE FROM outputs WHERE path = ?', (path,))
+                    removed += 1
+                for path, (size, mtime) in on_disk.items():
+                    entry = known.get(path)
+                    if entry is None or entry.size != size or entry.mtime != mtime:
+                        self._upsert(path, size, mtime)
+                        added += entry is None
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        if added or removed:
+            self.logger.info(f"Storage catalog reconciled: {added} added, {removed} removed")
+        return {'added': added, 'removed': removed}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
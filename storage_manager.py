@@ -4,94 +4,146 @@ Storage Manager for automatic cleanup of generated videos
 """
 
 import os
+import sys
 import time
 import logging
+import argparse
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional
 import threading
 import schedule
+from storage_catalog import StorageCatalog, CatalogEntry
+from eviction_policies import get_eviction_policy, EVICTION_POLICIES
+from leader_election import FileLeaderLock
+from storage_backends import StorageBackend, LocalStorageBackend, create_storage_backend
 
 class StorageManager:
-    def __init__(self, output_folder: str, max_age_hours: int = 24, max_storage_gb: float = 5.0):
+    """Age- and size-based cleanup of generated outputs.
+
+    Sizes and ages come from a StorageCatalog that is updated as outputs are
+    written (``record_output``), served (``record_access``) and deleted
+    here, so stats and eviction never walk the folder. Over the byte budget,
+    outputs go in the order of ``eviction_policy`` ('lru', 'lfu' or 'gdsf');
+    past ``max_age_hours`` without being written or watched they go anyway.
+    A full scan only runs to build a new catalog and from scheduled cleanup,
+    to pick up changes made behind its back.
+    
+    The bytes live in ``backend`` (the output folder itself by default, or
+    e.g. an S3 bucket); outputs are still named by their paths under
+    ``output_folder``, which map to backend keys.
+    """
+    
+    def __init__(self, output_folder: str, max_age_hours: int = 24, max_storage_gb: float = 5.0,
+                 catalog_path: Optional[str] = None, eviction_policy: str = 'lru',
+                 backend: Optional[StorageBackend] = None):
         self.output_folder = output_folder
         self.max_age_hours = max_age_hours
         self.max_storage_gb = max_storage_gb
+        self.backend = backend or LocalStorageBackend(output_folder)
         self.logger = logging.getLogger(__name__)
         
         # Ensure output folder exists
         os.makedirs(output_folder, exist_ok=True)
         
-    def get_folder_size_gb(self) -> float:
-        """Calculate total size of output folder in GB"""
-        total_size = 0
-        try:
-            for dirpath, dirnames, filenames in os.walk(self.output_folder):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    try:
-                        total_size += os.path.getsize(filepath)
-                    except (OSError, FileNotFoundError):
-                        continue
-        except Exception as e:
-            self.logger.error(f"Error calculating folder size: {e}")
+        if catalog_path is None:
+            catalog_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'storage_catalog.db')
+        new_catalog = not os.path.exists(catalog_path)
+        self.catalog = StorageCatalog(catalog_path, get_eviction_policy(eviction_policy))
+        if new_catalog:
+            self.reconcile()
+    
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.output_folder).replace(os.sep, '/')
+    
+    def record_output(self, path: str):
+        """Add a newly written output to the catalog"""
+        stat = self.backend.stat(self._key(path))
+        if stat is None:
+            self.logger.warning(f"Output to record is missing: {path}")
+            return
+        self.catalog.add(path, *stat)
+    
+    def reconcile(self) -> Dict:
+        """Re-sync the catalog with what the backend actually holds; a full listing"""
+        return self.catalog.reconcile(self.output_folder, backend=self.backend)
+    
+    def record_access(self, path: str):
+        """Count a download or play of an output"""
+        self.catalog.record_access(path)
+    
+    def enforce_budget(self, keep: Iterable[str] = ()) -> Optional[Dict]:
+        """Evict by policy if outputs are over max_storage_gb; O(1) when they aren't.
+
+        Paths in ``keep`` are never evicted by this pass. Pass the output just
+        recorded: with no hits yet it would rank first under lfu and gdsf,
+        and be deleted before its URL reaches the client.
+        """
+        if self.get_folder_size_gb() <= self.max_storage_gb:
+            return None
+        return self.cleanup_by_size(keep=keep)
         
-        return total_size / (1024 ** 3)  # Convert to GB
+    def get_folder_size_gb(self) -> float:
+        """Total size of cataloged outputs in GB"""
+        return self.catalog.totals()[1] / (1024 ** 3)  # Convert to GB
     
     def get_file_info(self) -> List[Dict]:
-        """Get information about all files in output folder"""
-        files_info = []
-        
+        """Get information about all cataloged files"""
+        now = time.time()
+        return [self._file_info(entry, now) for entry in self.catalog.entries()]
+    
+    def _file_info(self, entry: CatalogEntry, now: float) -> Dict:
+        return {
+            'path': entry.path,
+            'name': os.path.basename(entry.path),
+            'size_mb': entry.size / (1024 ** 2),
+            'modified_time': entry.mtime,
+            'last_access_time': entry.last_access,
+            'hits': entry.hits,
+            'age_hours': (now - entry.mtime) / 3600
+        }
+    
+    def _delete(self, entry: CatalogEntry, errors: List[str], evicted: bool = False) -> bool:
+        """Delete one output and its catalog entry; False if it couldn't be removed"""
         try:
-            for filename in os.listdir(self.output_folder):
-                filepath = os.path.join(self.output_folder, filename)
-                
-                if os.path.isfile(filepath):
-                    try:
-                        stat = os.stat(filepath)
-                        files_info.append({
-                            'path': filepath,
-                            'name': filename,
-                            'size_mb': stat.st_size / (1024 ** 2),
-                            'created_time': stat.st_ctime,
-                            'modified_time': stat.st_mtime,
-                            'age_hours': (time.time() - stat.st_mtime) / 3600
-                        })
-                    except (OSError, FileNotFoundError):
-                        continue
+            self.backend.delete(self._key(entry.path))
+        except FileNotFoundError:
+            # Already gone; just forget it
+            self.catalog.remove(entry.path)
+            return False
         except Exception as e:
-            self.logger.error(f"Error getting file info: {e}")
-        
-        return files_info
+            error_msg = f"Failed to delete {os.path.basename(entry.path)}: {e}"
+            errors.append(error_msg)
+            self.logger.error(error_msg)
+            return False
+        self.catalog.remove(entry.path, evicted)
+        return True
     
     def cleanup_old_files(self) -> Dict:
-        """Remove files older than max_age_hours"""
-        files_info = self.get_file_info()
-        old_files = [f for f in files_info if f['age_hours'] > self.max_age_hours]
+        """Remove files neither written nor accessed in the last max_age_hours"""
+        now = time.time()
+        old_files = self.catalog.idle_since(now - self.max_age_hours * 3600)
         
         deleted_count = 0
         deleted_size_mb = 0
         errors = []
         
-        for file_info in old_files:
-            try:
-                os.remove(file_info['path'])
+        for entry in old_files:
+            if self._delete(entry, errors):
                 deleted_count += 1
-                deleted_size_mb += file_info['size_mb']
-                self.logger.info(f"Deleted old file: {file_info['name']} ({file_info['age_hours']:.1f}h old)")
-            except Exception as e:
-                error_msg = f"Failed to delete {file_info['name']}: {e}"
-                errors.append(error_msg)
-                self.logger.error(error_msg)
+                deleted_size_mb += entry.size / (1024 ** 2)
+                self.logger.info(f"Deleted old file: {os.path.basename(entry.path)} "
+                                 f"(unused for {(now - entry.last_access) / 3600:.1f}h)")
         
         return {
             'deleted_count': deleted_count,
             'deleted_size_mb': deleted_size_mb,
             'errors': errors,
-            'remaining_files': len(files_info) - deleted_count
+            'remaining_files': self.catalog.totals()[0]
         }
     
-    def cleanup_by_size(self, target_size_gb: float = None) -> Dict:
-        """Remove oldest files until folder size is under target"""
+    def cleanup_by_size(self, target_size_gb: float = None, keep: Iterable[str] = ()) -> Dict:
+        """Remove files in eviction policy order until folder size is under target, sparing ``keep``"""
+        keep = set(keep)
         if target_size_gb is None:
             target_size_gb = self.max_storage_gb
         
@@ -105,27 +157,25 @@ class StorageManager:
                 'cleanup_needed': False
             }
         
-        files_info = self.get_file_info()
-        # Sort by modification time (oldest first)
-        files_info.sort(key=lambda x: x['modified_time'])
-        
         deleted_count = 0
         deleted_size_mb = 0
         errors = []
         
-        for file_info in files_info:
-            if self.get_folder_size_gb() <= target_size_gb:
+        # Walk the priority index from the first candidate, tracking the total as we go
+        current_bytes = self.catalog.totals()[1]
+        target_bytes = target_size_gb * (1024 ** 3)
+        for entry in self.catalog.eviction_order():
+            if current_bytes <= target_bytes:
                 break
-                
-            try:
-                os.remove(file_info['path'])
+            if entry.path in keep:
+                continue
+            
+            if self._delete(entry, errors, evicted=True):
                 deleted_count += 1
-                deleted_size_mb += file_info['size_mb']
-                self.logger.info(f"Deleted for space: {file_info['name']} ({file_info['size_mb']:.1f}MB)")
-            except Exception as e:
-                error_msg = f"Failed to delete {file_info['name']}: {e}"
-                errors.append(error_msg)
-                self.logger.error(error_msg)
+                deleted_size_mb += entry.size / (1024 ** 2)
+                self.logger.info(f"Deleted for space: {os.path.basename(entry.path)} "
+                                 f"({entry.size / (1024 ** 2):.1f}MB)")
+            current_bytes = self.catalog.totals()[1]
         
         return {
             'deleted_count': deleted_count,
@@ -161,10 +211,11 @@ class StorageManager:
         return total_result
     
     def get_storage_stats(self) -> Dict:
-        """Get current storage statistics"""
-        files_info = self.get_file_info()
+        """Get current storage statistics from the catalog's running totals"""
+        now = time.time()
+        stats = self.catalog.stats(now, old_after_hours=24)
         
-        if not files_info:
+        if not stats['files']:
             return {
                 'total_files': 0,
                 'total_size_gb': 0,
@@ -173,36 +224,53 @@ class StorageManager:
                 'average_file_size_mb': 0
             }
         
-        total_size_gb = sum(f['size_mb'] for f in files_info) / 1024
-        oldest_age = max(f['age_hours'] for f in files_info)
-        newest_age = min(f['age_hours'] for f in files_info)
-        avg_size_mb = sum(f['size_mb'] for f in files_info) / len(files_info)
+        total_size_gb = stats['bytes'] / (1024 ** 3)
         
         return {
-            'total_files': len(files_info),
+            'total_files': stats['files'],
             'total_size_gb': total_size_gb,
-            'oldest_file_hours': oldest_age,
-            'newest_file_hours': newest_age,
-            'average_file_size_mb': avg_size_mb,
-            'files_over_24h': len([f for f in files_info if f['age_hours'] > 24]),
-            'storage_usage_percent': (total_size_gb / self.max_storage_gb) * 100 if self.max_storage_gb > 0 else 0
+            'oldest_file_hours': (now - stats['oldest_mtime']) / 3600,
+            'newest_file_hours': (now - stats['newest_mtime']) / 3600,
+            'average_file_size_mb': stats['bytes'] / stats['files'] / (1024 ** 2),
+            'files_over_24h': stats['old_files'],
+            'storage_usage_percent': (total_size_gb / self.max_storage_gb) * 100 if self.max_storage_gb > 0 else 0,
+            'eviction_policy': stats['policy']
         }
     
-    def start_scheduled_cleanup(self, interval_hours: int = 6):
-        """Start automatic cleanup on schedule"""
+    def run_cleanup(self) -> Dict:
+        """Reconcile the catalog with the folder, then run smart cleanup"""
+        # Pick up outputs added or removed outside this manager
+        self.reconcile()
+        return self.smart_cleanup()
+    
+    def start_scheduled_cleanup(self, interval_hours: int = 6, lock_path: Optional[str] = None):
+        """Start automatic cleanup on schedule.
+
+        With ``lock_path`` every process may call this, but only the holder
+        of that file lock (see FileLeaderLock) actually cleans up; the rest
+        try to take over at each interval, so a new leader emerges when the
+        old one exits.
+        """
+        leader = FileLeaderLock(lock_path) if lock_path else None
+        
         def run_cleanup():
+            if leader is not None and not leader.try_acquire():
+                self.logger.debug(f"Skipping scheduled cleanup; process {leader.holder()} leads")
+                return
             try:
-                result = self.smart_cleanup()
+                result = self.run_cleanup()
                 self.logger.info(f"Scheduled cleanup completed: {result}")
             except Exception as e:
                 self.logger.error(f"Scheduled cleanup failed: {e}")
         
-        # Schedule cleanup every N hours
-        schedule.every(interval_hours).hours.do(run_cleanup)
+        # Schedule cleanup every N hours, on a scheduler of our own so a second
+        # call (or another manager) doesn't share the module-level job list
+        scheduler = schedule.Scheduler()
+        scheduler.every(interval_hours).hours.do(run_cleanup)
         
         def run_scheduler():
             while True:
-                schedule.run_pending()
+                scheduler.run_pending()
                 time.sleep(60)  # Check every minute
         
         # Run scheduler in background thread
@@ -212,30 +280,70 @@ class StorageManager:
         self.logger.info(f"Scheduled cleanup started: every {interval_hours} hours")
         return scheduler_thread
 
-# Example usage and testing
-if __name__ == '__main__':
+def print_stats(stats: Dict):
+    print("📊 Current Storage Stats:")
+    print(f"   Files: {stats['total_files']}")
+    print(f"   Size: {stats['total_size_gb']:.2f} GB")
+    print(f"   Oldest file: {stats['oldest_file_hours']:.1f} hours")
+    if stats['total_files']:
+        print(f"   Files over 24h: {stats['files_over_24h']}")
+        print(f"   Storage usage: {stats['storage_usage_percent']:.1f}%")
+        print(f"   Eviction policy: {stats['eviction_policy']}")
+
+def main(argv=None) -> int:
+    """Command line entry point, e.g. for cron: python storage_manager.py cleanup"""
+    from config import Config
+    
+    parser = argparse.ArgumentParser(description="Inspect and clean up generated outputs")
+    parser.add_argument('command', nargs='?', default='cleanup', choices=['cleanup', 'reconcile', 'stats'])
+    parser.add_argument('--folder', default=Config.UPLOAD_FOLDER, help="output folder")
+    parser.add_argument('--catalog', default=Config.STORAGE_CATALOG_PATH, help="storage catalog database")
+    parser.add_argument('--max-age-hours', type=float, default=Config.STORAGE_MAX_AGE_HOURS)
+    parser.add_argument('--max-gb', type=float, default=Config.STORAGE_MAX_GB)
+    parser.add_argument('--policy', default=Config.STORAGE_EVICTION_POLICY, choices=sorted(EVICTION_POLICIES))
+    parser.add_argument('--lock-file', default=Config.CLEANUP_LOCK_PATH,
+                        help="leader lock shared with the web workers' scheduled cleanup")
+    parser.add_argument('--wait', type=float, default=0, help="seconds to wait for the lock")
+    args = parser.parse_args(argv)
+    
     # Setup logging
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     
-    # Create storage manager
+    # Outputs may live in a bucket (OUTPUT_STORAGE_BACKEND) rather than the folder
+    backend_config = {name: getattr(Config, name) for name in dir(Config) if name.isupper()}
+    backend_config['UPLOAD_FOLDER'] = args.folder
     storage_manager = StorageManager(
-        output_folder='static/outputs',
-        max_age_hours=24,
-        max_storage_gb=1.0  # 1GB limit for testing
+        output_folder=args.folder,
+        max_age_hours=args.max_age_hours,
+        max_storage_gb=args.max_gb,
+        catalog_path=args.catalog,
+        eviction_policy=args.policy,
+        backend=create_storage_backend(backend_config)
     )
     
-    # Get current stats
-    stats = storage_manager.get_storage_stats()
-    print("📊 Current Storage Stats:")
-    print(f"   Files: {stats['total_files']}")
-    print(f"   Size: {stats['total_size_gb']:.2f} GB")
-    print(f"   Oldest file: {stats['oldest_file_hours']:.1f} hours")
-    print(f"   Files over 24h: {stats['files_over_24h']}")
-    print(f"   Storage usage: {stats['storage_usage_percent']:.1f}%")
-    
-    # Run cleanup
-    print("\n🧹 Running smart cleanup...")
-    result = storage_manager.smart_cleanup()
-    print(f"   Deleted: {result['total_deleted']} files")
-    print(f"   Freed: {result['total_freed_mb']:.1f} MB")
-    print(f"   Final size: {result['final_size_gb']:.2f} GB")
\ No newline at end of file
+    if args.command == 'stats':
+        print_stats(storage_manager.get_storage_stats())
+        return 0
+    
+    # Never clean up alongside a web worker that currently leads cleanup
+    leader = FileLeaderLock(args.lock_file)
+    if not leader.acquire(timeout=args.wait):
+        print(f"⏭️  Cleanup is led by process {leader.holder()}; skipping")
+        return 0
+    try:
+        if args.command == 'reconcile':
+            result = storage_manager.reconcile()
+            print(f"🔄 Catalog reconciled: {result['added']} added, {result['removed']} removed")
+            return 0
+        
+        print("🧹 Running smart cleanup...")
+        result = storage_manager.run_cleanup()
+        print(f"   Deleted: {result['total_deleted']} files")
+        print(f"   Freed: {result['total_freed_mb']:.1f} MB")
+        print(f"   Final size: {result['final_size_gb']:.2f} GB")
+        return 0
+    finally:
+        leader.release()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test admission control and backpressure
+"""
+
+import time
+import threading
+from admission import AdmissionController
+
+def test_queue_bound_and_retry_after():
+    print("🧪 Testing admission limits...")
+    admission = AdmissionController(max_concurrent=2, max_queue=2, initial_service_seconds=10)
+
+    assert all(admission.try_enter() for _ in range(4))
+    assert not admission.try_enter()
+    assert admission.get_stats()['rejected'] == 1
+
+    assert admission.wait_for_slot(timeout=0.1)
+    assert admission.wait_for_slot(timeout=0.1)
+    # Two running, two waiting: a retry waits for three more to drain at 2 per 10s
+    assert admission.retry_after() == 15
+
+    # A queued request that can't get a slot gives up its place
+    start = time.time()
+    assert not admission.wait_for_slot(timeout=0.1)
+    assert time.time() - start < 0.5
+    assert admission.try_enter()
+
+    # Faster completions lower the estimate
+    admission.finish(service_seconds=2)
+    assert admission.get_stats()['avg_service_seconds'] < 10
+    print(f"   ✅ Retry-After now {admission.retry_after()}s")
+
+def test_burst_keeps_latency_bounded():
+    print("🧪 Testing a burst against a small queue...")
+    admission = AdmissionController(max_concurrent=2, max_queue=3, initial_service_seconds=0.05)
+    latencies = []
+    rejected = []
+    lock = threading.Lock()
+
+    def request():
+        start = time.time()
+        if not admission.try_enter():
+            with lock:
+                rejected.append(time.time() - start)
+            return
+        admission.wait_for_slot()
+        time.sleep(0.05)
+        admission.finish(0.05)
+        with lock:
+            latencies.append(time.time() - start)
+
+    threads = [threading.Thread(target=request) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(latencies) + len(rejected) == 20
+    assert len(latencies) >= 5 and rejected
+    # Admitted requests wait for at most the queue ahead of them
+    assert max(latencies) < 0.05 * 3 + 0.5, latencies
+    assert max(rejected) < 0.1
+
+    stats = admission.get_stats()
+    assert stats['running'] == 0 and stats['queued'] == 0
+    print(f"   ✅ {len(latencies)} served (max {max(latencies):.2f}s), {len(rejected)} rejected fast")
+
+if __name__ == '__main__':
+    test_queue_bound_and_retry_after()
+    test_burst_keeps_latency_bounded()
+    print("\n✅ Admission tests passed!")
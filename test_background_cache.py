@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test the vectorized gradient renderer and the background cache
+"""
+
+from PIL import Image, ImageDraw
+from video_generator import VideoGenerator, COLOR_TEMPLATES, BackgroundCache, background_cache
+
+def reference_gradient(width, height, color_template):
+    """Original per-pixel gradient, kept here to compare output"""
+    background = Image.new('RGB', (width, height))
+    draw = ImageDraw.Draw(background)
+    start_color = color_template.gradient_start
+    end_color = color_template.gradient_end
+    for x in range(width):
+        progress = x / width
+        r = int(start_color[0] + (end_color[0] - start_color[0]) * progress)
+        g = int(start_color[1] + (end_color[1] - start_color[1]) * progress)
+        b = int(start_color[2] + (end_color[2] - start_color[2]) * progress)
+        for y in range(height):
+            draw.point((x, y), (r, g, b))
+    return background
+
+def test_gradient_matches_reference():
+    print("🧪 Testing gradient output against per-pixel reference...")
+    video_gen = VideoGenerator({'UPLOAD_FOLDER': 'static/outputs'})
+    
+    for key, template in COLOR_TEMPLATES.items():
+        fast = video_gen.render_gradient(120, 37, template)
+        slow = reference_gradient(120, 37, template)
+        assert fast.tobytes() == slow.tobytes(), f"Gradient mismatch for {key}"
+        print(f"   ✅ {key}")
+
+def test_background_cache_hits():
+    print("🧪 Testing background cache hit/miss counters...")
+    video_gen = VideoGenerator({'UPLOAD_FOLDER': 'static/outputs'})
+    background_cache.clear()
+    template = COLOR_TEMPLATES['ocean']
+    
+    first = video_gen.create_gradient_background(200, 300, template, 'ocean')
+    # Same bucket, different height: served from cache and cropped
+    second = video_gen.create_gradient_background(200, 310, template, 'ocean')
+    
+    stats = background_cache.get_stats()
+    assert stats['misses'] == 1 and stats['hits'] == 1, stats
+    assert first.size == (200, 300) and second.size == (200, 310)
+    assert second.crop((0, 0, 200, 300)).tobytes() == first.tobytes()
+    
+    # Drawing on a returned image must not leak into the cache
+    first.paste((0, 0, 0), (0, 0, 200, 300))
+    third = video_gen.create_gradient_background(200, 300, template, 'ocean')
+    assert third.getpixel((0, 0)) == template.gradient_start
+    print(f"   ✅ Stats: {background_cache.get_stats()}")
+
+def test_background_cache_eviction():
+    cache = BackgroundCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+if __name__ == '__main__':
+    test_gradient_matches_reference()
+    test_background_cache_hits()
+    test_background_cache_eviction()
+    print("\n✅ Background cache tests passed!")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test sentence-chunked parallel synthesis
+"""
+
+import os
+import time
+import tempfile
+import threading
+import subprocess
+from voice_providers import VoiceProvider
+from chunked_synthesis import split_into_chunks, strip_audio_container, ChunkedVoiceProvider
+from encoder import get_encoder, probe_duration
+
+def test_split_at_sentence_boundaries():
+    text = 'First sentence here. Second one! Third? ' * 10
+    chunks = split_into_chunks(text, 60)
+    assert all(len(chunk) <= 60 for chunk in chunks)
+    assert all(chunk.endswith(('.', '!', '?')) for chunk in chunks)
+    assert ' '.join(chunks) == ' '.join(text.split())
+
+def test_split_cjk_and_oversized_sentences():
+    text = '千里之行，始于足下。' * 30
+    chunks = split_into_chunks(text, 50)
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert ''.join(chunks).replace(' ', '') == text
+    
+    # No punctuation at all still respects the limit
+    chunks = split_into_chunks('x' * 130, 50)
+    assert [len(chunk) for chunk in chunks] == [50, 50, 30]
+    assert split_into_chunks('short', 50) == ['short']
+
+class ToneVoiceProvider(VoiceProvider):
+    """Writes a real MP3 whose length follows the text, after a fixed delay"""
+    
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+    
+    def generate_speech(self, text, voice, output_path, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        seconds = max(len(text) / 50, 0.5)
+        subprocess.run([
+            get_encoder().capabilities.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+            '-c:a', 'libmp3lame', '-b:a', '64k', output_path
+        ], check=True)
+        with self.lock:
+            self.active -= 1
+        return True
+    
+    def is_available(self):
+        return True
+    
+    def get_voice_list(self):
+        return []
+
+def test_chunks_run_in_parallel_and_join_cleanly():
+    print("🧪 Testing parallel chunked synthesis...")
+    fake = ToneVoiceProvider(delay=0.5)
+    provider = ChunkedVoiceProvider(fake, chunk_chars=100, max_workers=4)
+    text = 'This sentence is exactly fifty characters long ok. ' * 8
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        output_path = os.path.join(workdir, 'speech.mp3')
+        start = time.time()
+        assert provider.generate_speech(text, 'alloy', output_path, audio_format='mp3')
+        elapsed = time.time() - start
+        
+        assert fake.peak > 1
+        assert elapsed < 4 * 0.5, elapsed
+        assert sorted(os.listdir(workdir)) == ['speech.mp3']
+        
+        ffmpeg_path = get_encoder().capabilities.ffmpeg_path
+        decode = subprocess.run([ffmpeg_path, '-v', 'error', '-i', output_path, '-f', 'null', '-'],
+                                capture_output=True, text=True)
+        assert decode.returncode == 0 and not decode.stderr.strip(), decode.stderr
+        
+        duration = probe_duration(ffmpeg_path, output_path)
+        expected = sum(len(chunk) / 50 for chunk in split_into_chunks(text, 100))
+        assert abs(duration - expected) < 0.5, (duration, expected)
+        print(f"   ✅ {elapsed:.2f}s wall clock, {duration:.2f}s of audio")
+
+def test_info_frame_found_at_side_info_offset():
+    # MPEG-1 Layer III, 128 kbps, 44.1 kHz: 417-byte frames
+    def frame(header_end, tag_offset=None, tag=b'Info'):
+        data = bytearray(b'\xff\xfb\x90' + bytes([header_end]) + bytes(413))
+        if tag_offset is not None:
+            data[tag_offset:tag_offset + 4] = tag
+        return bytes(data)
+    
+    audio = frame(0x00)
+    # Stereo frames carry 32 bytes of side info, mono ones 17
+    assert strip_audio_container(frame(0x00, 36) + audio, 'mp3') == audio
+    assert strip_audio_container(frame(0xC0, 21, b'Xing') + audio, 'mp3') == audio
+    # The same bytes inside audio data are just audio
+    lookalike = frame(0x00, 200) + audio
+    assert strip_audio_container(lookalike, 'mp3') == lookalike
+
+def test_short_text_is_not_chunked():
+    fake = ToneVoiceProvider()
+    provider = ChunkedVoiceProvider(fake, chunk_chars=100)
+    with tempfile.TemporaryDirectory() as workdir:
+        assert provider.generate_speech('Short quote.', 'alloy', os.path.join(workdir, 'a.mp3'))
+    assert fake.peak == 1
+
+if __name__ == '__main__':
+    test_split_at_sentence_boundaries()
+    test_split_cjk_and_oversized_sentences()
+    test_chunks_run_in_parallel_and_join_cleanly()
+    test_info_frame_found_at_side_info_offset()
+    test_short_text_is_not_chunked()
+    print("\n✅ Chunked synthesis tests passed!")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test the per-job resource cost model and scheduler
+"""
+
+import time
+import threading
+from cost_model import CostModel, ResourceScheduler, estimate_audio_seconds, estimate_workspace_mb
+
+def test_audio_estimate():
+    english = estimate_audio_seconds('word ' * 28)
+    assert 9 < english < 12, english
+    # Ideographs take longer to speak per character; faster voices are shorter
+    assert estimate_audio_seconds('天' * 45) > estimate_audio_seconds('a' * 45)
+    assert estimate_audio_seconds('word ' * 28, speed=2.0) < english
+    # Workspaces hold the speech plus a card PNG unless the card stays in memory
+    assert 0 < estimate_workspace_mb('word ' * 28, card_file=False) < estimate_workspace_mb('word ' * 28)
+
+def test_model_calibrates_from_jobs():
+    print("🧪 Testing cost model calibration...")
+    model = CostModel()
+    before = model.predict('1080p', 60)
+    # Longer audio costs more CPU but the encoder's memory stays flat
+    assert model.predict('1080p', 120).cpu_seconds > before.cpu_seconds
+    assert model.predict('480p', 60).peak_rss_mb < before.peak_rss_mb
+
+    # This node turns out to encode 1080p at 0.05 CPU-s per audio second in ~120MB
+    for seconds in (10, 30, 60, 90, 120) * 6:
+        model.observe_encode('1080p', seconds, 120.0, 0.2 + 0.05 * seconds)
+    after = model.predict('1080p', 60)
+    assert after.peak_rss_mb < before.peak_rss_mb
+    stats = model.get_stats()['1080p']
+    assert abs(stats['cpu_per_audio_second'] - 0.05) < 0.005, stats
+    assert abs(stats['peak_rss_mb'] - 120) < 10, stats
+    print(f"   ✅ 1080p/60s: {before.cpu_seconds:.2f} -> {after.cpu_seconds:.2f} CPU-s")
+
+def test_scheduler_packs_within_budget():
+    print("🧪 Testing budget reservation...")
+    model = CostModel()
+    full = model.predict('1080p', 10).peak_rss_mb
+    small = model.predict('480p', 10).peak_rss_mb
+    scheduler = ResourceScheduler(model, memory_budget_mb=full + small, cpu_budget_seconds=100)
+
+    first = scheduler.reserve('short quote')
+    second = scheduler.reserve('short quote')
+    assert first.profile == '1080p'
+    # What is left only fits the smallest profile
+    assert second.profile == '480p', second.profile
+
+    # Nothing fits now: the next job waits until budget is released
+    assert scheduler.reserve('short quote', timeout=0.05) is None
+    threading.Timer(0.1, scheduler.release, [first]).start()
+    start = time.time()
+    third = scheduler.reserve('short quote', timeout=2)
+    assert third is not None and time.time() - start >= 0.05
+
+    scheduler.release(second)
+    scheduler.release(third)
+    stats = scheduler.get_stats()
+    assert stats['active'] == 0 and stats['reserved_mb'] == 0 and stats['timeouts'] == 1
+
+    # A job bigger than the whole budget still runs when the node is idle
+    tiny = ResourceScheduler(model, memory_budget_mb=1, cpu_budget_seconds=0.01)
+    reservation = tiny.reserve('short quote', timeout=0)
+    assert reservation.profile == '480p'
+    
+    # Renders are budgeted on their own and wait like encodes do
+    assert tiny.reserve_render('short quote', timeout=0.05) is None
+    tiny.release(reservation)
+    render = tiny.reserve_render('short quote', timeout=0)
+    assert render.cost == model.predict_render(len('short quote')) and render.cost.peak_rss_mb > 0
+    tiny.release(render)
+    print("   ✅ Jobs packed into the budget and waited for release")
+
+if __name__ == '__main__':
+    test_audio_estimate()
+    test_model_calibrates_from_jobs()
+    test_scheduler_packs_within_budget()
+    print("\n✅ Cost model tests passed!")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test the isolated encode worker pool
+"""
+
+import os
+import tempfile
+import multiprocessing
+import psutil
+from encode_workers import EncodeWorkerPool, WorkerCrashed
+from encoder import get_encoder
+from memory_monitor import VIDEO_PROFILES
+from test_encoder import make_test_audio
+
+RENDER_ARGS = ('Words rendered in a separate process.', 'Worker Test', None, 'ocean', 'roboto', 'roboto')
+
+def render_args(path):
+    args = list(RENDER_ARGS)
+    args[2] = path
+    return tuple(args)
+
+def test_tasks_run_in_recycled_workers():
+    print("🧪 Testing encode worker pool...")
+    pool = EncodeWorkerPool(1, {'TTS_CACHE_MAX_MB': 0}, max_jobs=2)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            image_path = os.path.join(workdir, 'card.png')
+            audio_path = os.path.join(workdir, 'voice.mp3')
+            video_path = os.path.join(workdir, 'out.mp4')
+            make_test_audio(get_encoder().capabilities.ffmpeg_path, audio_path, 2)
+            
+            events = []
+            result = pool.run('render', render_args(image_path), lambda *event: events.append(event))
+            assert result['value'] == image_path and os.path.exists(image_path)
+            assert ('render', 'done', None) in events
+            first_pid = pool._idle[0].process.pid
+            assert first_pid != os.getpid()
+            
+            result = pool.run('encode', (image_path, audio_path, video_path, 'mp3', VIDEO_PROFILES['480p'], None),
+                              lambda *event: events.append(event))
+            assert result['value'] and os.path.exists(video_path)
+            assert result['usage']['peak_rss_mb'] > 0
+            assert ('encode', 'done', 1.0) in events
+            
+            # Two tasks reached max_jobs, so the next one gets a fresh process
+            pool.run('render', render_args(image_path))
+            assert pool._idle[0].process.pid != first_pid
+            assert pool.get_stats()['recycled'] == 1
+            
+            # In-memory cards come back as PPM bytes and encode without an image file
+            frame = pool.run('frame', RENDER_ARGS[:2] + RENDER_ARGS[3:])['value']
+            assert frame.startswith(b'P6')
+            frame_video_path = os.path.join(workdir, 'frame.mp4')
+            result = pool.run('encode', (frame, audio_path, frame_video_path, 'mp3', VIDEO_PROFILES['480p'], None))
+            assert result['value'] and os.path.exists(frame_video_path)
+            print("   ✅ Render and encode ran out of process; worker recycled")
+    finally:
+        pool.close()
+
+def test_crash_only_fails_its_task():
+    print("🧪 Testing worker crash isolation...")
+    pool = EncodeWorkerPool(1, {'TTS_CACHE_MAX_MB': 0})
+    
+    def kill_worker(*event):
+        for child in multiprocessing.active_children():
+            child.kill()
+    
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            image_path = os.path.join(workdir, 'card.png')
+            try:
+                pool.run('render', render_args(image_path), kill_worker)
+                raise AssertionError("Expected the crash to be reported")
+            except WorkerCrashed:
+                pass
+            
+            # The pool replaces the dead worker and keeps serving
+            assert pool.run('render', render_args(image_path))['value'] == image_path
+            assert pool.get_stats()['crashes'] == 1
+            print("   ✅ Crash failed one task; next task ran on a new worker")
+    finally:
+        pool.close()
+
+def test_timeout_kills_ffmpeg():
+    print("🧪 Testing encode timeouts...")
+    pool = EncodeWorkerPool(1, {'TTS_CACHE_MAX_MB': 0})
+    children = []
+    
+    def record_ffmpeg(stage, state, progress=None):
+        if stage == 'encode' and not children:
+            children.extend(psutil.Process(worker_pid).children())
+    
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            image_path = os.path.join(workdir, 'card.png')
+            audio_path = os.path.join(workdir, 'voice.mp3')
+            make_test_audio(get_encoder().capabilities.ffmpeg_path, audio_path, 2)
+            pool.run('render', render_args(image_path))
+            worker_pid = pool._idle[0].process.pid
+            
+            # Nothing reads this FIFO, so ffmpeg blocks opening its output
+            output_path = os.path.join(workdir, 'out.mp4')
+            os.mkfifo(output_path)
+            pool.task_timeout = 2
+            try:
+                pool.run('encode', (image_path, audio_path, output_path, 'mp3', VIDEO_PROFILES['480p'], None),
+                         record_ffmpeg)
+                raise AssertionError("Expected the timeout to be reported")
+            except WorkerCrashed:
+                pass
+            
+            assert children
+            _, alive = psutil.wait_procs(children, timeout=5)
+            for child in alive:
+                child.kill()
+            assert not alive, f"ffmpeg outlived its worker: {alive}"
+            print("   ✅ Timed-out worker took its ffmpeg with it")
+    finally:
+        pool.close()
+
+if __name__ == '__main__':
+    test_tasks_run_in_recycled_workers()
+    test_crash_only_fails_its_task()
+    test_timeout_kills_ffmpeg()
+    print("\n✅ Encode worker tests passed!")
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test the ffmpeg still-image encoder
+"""
+
+import io
+import os
+import re
+import time
+import hashlib
+import subprocess
+import tempfile
+from PIL import Image
+from encoder import StillImageEncoder, adts_duration, get_encoder, negotiate_audio_format
+from memory_monitor import get_memory_safe_settings
+
+def make_test_audio(ffmpeg_path, path, seconds, codec='libmp3lame'):
+    subprocess.run([
+        ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-c:a', codec, '-b:a', '64k', path
+    ], check=True)
+
+def media_duration(ffmpeg_path, path):
+    result = subprocess.run([ffmpeg_path, '-hide_banner', '-i', path], capture_output=True, text=True)
+    match = re.search(r'Duration: (\d+):(\d+):(\d+\.\d+)', result.stderr)
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def test_encode_still_image():
+    print("🧪 Testing still-image encoding...")
+    encoder = get_encoder()
+    assert encoder is not None, "ffmpeg not available"
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        image_path = os.path.join(workdir, 'card.png')
+        audio_path = os.path.join(workdir, 'voice.mp3')
+        video_path = os.path.join(workdir, 'out.mp4')
+        
+        # Odd height on purpose: the encoder must pad to even dimensions
+        Image.new('RGB', (320, 241), (30, 90, 200)).save(image_path)
+        make_test_audio(encoder.capabilities.ffmpeg_path, audio_path, 3)
+        
+        settings = get_memory_safe_settings(2048)
+        assert encoder.encode(image_path, audio_path, video_path, settings)
+        assert os.path.getsize(video_path) > 0
+        
+        duration = media_duration(encoder.capabilities.ffmpeg_path, video_path)
+        assert abs(duration - 3) < 0.6, duration
+        print(f"   ✅ {encoder.name}: {duration:.2f}s video")
+
+def test_encode_piped_frame():
+    print("🧪 Testing a card piped in as a PPM frame...")
+    encoder = get_encoder()
+    settings = get_memory_safe_settings(2048)
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        audio_path = os.path.join(workdir, 'voice.mp3')
+        video_path = os.path.join(workdir, 'out.mp4')
+        make_test_audio(encoder.capabilities.ffmpeg_path, audio_path, 2)
+        
+        buffer = io.BytesIO()
+        Image.new('RGB', (320, 241), (30, 90, 200)).save(buffer, 'PPM')
+        frame = buffer.getvalue()
+        
+        cmd = encoder.build_command(frame, audio_path, video_path, settings, 2.0, 'mp3')
+        assert cmd[cmd.index('-i') + 1] == 'pipe:0'
+        assert encoder.encode(frame, audio_path, video_path, settings, 'mp3')
+        assert sorted(os.listdir(workdir)) == ['out.mp4', 'voice.mp3']
+        duration = media_duration(encoder.capabilities.ffmpeg_path, video_path)
+        assert abs(duration - 2) < 0.6, duration
+        print(f"   ✅ {duration:.2f}s video with no image file")
+
+def test_hung_encode_is_killed():
+    print("🧪 Testing the encode deadline...")
+    encoder = StillImageEncoder(get_encoder().capabilities, timeout_base=1, timeout_per_second=0)
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        image_path = os.path.join(workdir, 'card.png')
+        audio_path = os.path.join(workdir, 'voice.mp3')
+        Image.new('RGB', (320, 240), (30, 90, 200)).save(image_path)
+        make_test_audio(encoder.capabilities.ffmpeg_path, audio_path, 2)
+        
+        # Nothing reads this FIFO, so ffmpeg blocks opening its output
+        video_path = os.path.join(workdir, 'out.mp4')
+        os.mkfifo(video_path)
+        start = time.time()
+        assert not encoder.encode(image_path, audio_path, video_path, get_memory_safe_settings(2048), 'mp3')
+        assert time.time() - start < 10
+        print(f"   ✅ Hung ffmpeg killed after {time.time() - start:.1f}s")
+
+def test_negotiate_audio_format():
+    assert negotiate_audio_format(['aac', 'mp3', 'opus']) == 'aac'
+    assert negotiate_audio_format(['opus', 'mp3']) == 'mp3'
+    assert negotiate_audio_format(['wav']) == 'wav'
+
+def test_audio_is_stream_copied():
+    print("🧪 Testing audio stream copy into MP4...")
+    encoder = get_encoder()
+    settings = get_memory_safe_settings(2048)
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        image_path = os.path.join(workdir, 'card.png')
+        Image.new('RGB', (320, 240), (30, 90, 200)).save(image_path)
+        
+        for audio_format, codec, extension in [('aac', 'aac', 'aac'), ('mp3', 'libmp3lame', 'mp3')]:
+            audio_path = os.path.join(workdir, f'voice.{extension}')
+            video_path = os.path.join(workdir, f'out_{audio_format}.mp4')
+            make_test_audio(encoder.capabilities.ffmpeg_path, audio_path, 2, codec)
+            
+            cmd = encoder.build_command(image_path, audio_path, video_path, settings, 2.0, audio_format)
+            assert cmd[cmd.index('-c:a') + 1] == 'copy'
+            assert encoder.encode(image_path, audio_path, video_path, settings, audio_format)
+            
+            result = subprocess.run([encoder.capabilities.ffmpeg_path, '-hide_banner', '-i', video_path],
+                                    capture_output=True, text=True)
+            audio_stream = next(line for line in result.stderr.splitlines() if 'Audio:' in line)
+            assert f'Audio: {audio_format}' in audio_stream, audio_stream
+            print(f"   ✅ {audio_format} muxed without re-encoding")
+
+def test_adts_duration_is_exact():
+    print("🧪 Testing ADTS duration from frame headers...")
+    encoder = get_encoder()
+    ffmpeg_path = encoder.capabilities.ffmpeg_path
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        aac_path = os.path.join(workdir, 'voice.aac')
+        mp3_path = os.path.join(workdir, 'voice.mp3')
+        make_test_audio(ffmpeg_path, aac_path, 2, 'aac')
+        make_test_audio(ffmpeg_path, mp3_path, 2)
+        
+        # Decoding every frame gives the true length; the input summary only estimates it
+        result = subprocess.run([ffmpeg_path, '-hide_banner', '-i', aac_path, '-f', 'null', '-'],
+                                capture_output=True, text=True)
+        hours, minutes, seconds = re.findall(r'time=(\d+):(\d+):(\d+\.\d+)', result.stderr)[-1]
+        decoded = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        
+        duration = adts_duration(aac_path)
+        assert abs(duration - decoded) < 0.01, (duration, decoded)
+        assert encoder.audio_duration(aac_path) == duration
+        print(f"   ✅ {duration:.3f}s counted from frames")
+        
+        assert adts_duration(mp3_path) is None
+        with open(aac_path, 'ab') as f:
+            f.write(b'not audio')
+        assert adts_duration(aac_path) is None
+        print("   ✅ Non-ADTS files fall back to ffmpeg's probe")
+
+def test_encoding_is_deterministic():
+    print("🧪 Testing deterministic output...")
+    encoder = get_encoder()
+    settings = get_memory_safe_settings(2048)
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        image_path = os.path.join(workdir, 'card.png')
+        audio_path = os.path.join(workdir, 'voice.mp3')
+        Image.new('RGB', (320, 240), (30, 90, 200)).save(image_path)
+        make_test_audio(encoder.capabilities.ffmpeg_path, audio_path, 2)
+        
+        digests = []
+        for i in range(2):
+            video_path = os.path.join(workdir, f'out_{i}.mp4')
+            assert encoder.encode(image_path, audio_path, video_path, settings, 'mp3')
+            with open(video_path, 'rb') as f:
+                digests.append(hashlib.sha256(f.read()).hexdigest())
+            time.sleep(1.1)  # A wall-clock timestamp would differ now
+        assert digests[0] == digests[1]
+        print("   ✅ Identical inputs gave identical files")
+
+if __name__ == '__main__':
+    test_encode_still_image()
+    test_encode_piped_frame()
+    test_hung_encode_is_killed()
+    test_negotiate_audio_format()
+    test_audio_is_stream_copied()
+    test_adts_duration_is_exact()
+    test_encoding_is_deterministic()
+    print("\n✅ Encoder tests passed!")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test background generation jobs
+"""
+
+import os
+import json
+import sys
+import time
+import subprocess
+import tempfile
+import threading
+from jobs import JobStore, JobManager, job_event_stream
+
+def wait_for(store, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = store.get(job_id)
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+def test_jobs_run_in_background():
+    print("🧪 Testing background job pool...")
+    release = threading.Event()
+    
+    def run_job(data, base_filename, report):
+        release.wait(5)
+        if data['text'] == 'fail':
+            return {'success': False, 'error': 'Failed to generate audio'}
+        return {'success': True, 'video_url': f'/static/outputs/{base_filename}.mp4', 'timings': {'total': 1.0}}
+    
+    with tempfile.TemporaryDirectory() as state_dir:
+        store = JobStore(state_dir)
+        manager = JobManager(store, run_job, max_workers=1)
+        
+        # Submission returns immediately while the worker is still busy
+        start = time.time()
+        ok_id = manager.submit({'text': 'ok'}, 'ok_video')
+        fail_id = manager.submit({'text': 'fail'}, 'fail_video')
+        assert time.time() - start < 0.5
+        assert manager.pending == 2
+        assert store.get(fail_id)['status'] == 'queued'
+        
+        release.set()
+        ok_job = wait_for(store, ok_id)
+        fail_job = wait_for(store, fail_id)
+        
+        assert ok_job['status'] == 'succeeded' and ok_job['video_url'] == '/static/outputs/ok_video.mp4'
+        assert ok_job['timings'] == {'total': 1.0}
+        assert fail_job['status'] == 'failed' and fail_job['error'] == 'Failed to generate audio'
+        assert manager.pending == 0
+        print("   ✅ Jobs queued, ran and reported results")
+
+def test_crashing_job_is_reported():
+    def run_job(data, base_filename, report):
+        raise RuntimeError('boom')
+    
+    with tempfile.TemporaryDirectory() as state_dir:
+        store = JobStore(state_dir)
+        job_id = JobManager(store, run_job).submit({}, 'x')
+        assert wait_for(store, job_id)['status'] == 'failed'
+
+def test_job_queued_until_slot():
+    print("🧪 Testing jobs waiting for a run slot...")
+    slot = threading.Event()
+    ran = []
+    
+    def run_job(data, base_filename, report):
+        ran.append(base_filename)
+        return {'success': True, 'video_url': '/static/outputs/x.mp4'}
+    
+    with tempfile.TemporaryDirectory() as state_dir:
+        store = JobStore(state_dir)
+        manager = JobManager(store, run_job, before_run=lambda: slot.wait(5))
+        job_id = manager.submit({}, 'x')
+        time.sleep(0.1)
+        assert store.get(job_id)['status'] == 'queued' and not ran
+        
+        # A failed start update doesn't strand the slot the job now holds
+        original_update = store.update
+        def failing_update(job_id, **fields):
+            if fields.get('status') == 'running':
+                raise OSError('disk full')
+            return original_update(job_id, **fields)
+        store.update = failing_update
+        slot.set()
+        assert wait_for(store, job_id)['status'] == 'succeeded' and ran == ['x']
+        print("   ✅ Job stayed queued until it got a slot")
+
+def test_jobs_of_dead_workers_fail():
+    print("🧪 Testing jobs left behind by a dead worker...")
+    child = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                           capture_output=True, text=True, check=True)
+    with tempfile.TemporaryDirectory() as state_dir:
+        store = JobStore(state_dir)
+        manager = JobManager(store, lambda data, base_filename, report: None)
+        orphan = store.create('a' * 32)['id']
+        store.update(orphan, status='running', owner_pid=int(child.stdout))
+        live = store.create('b' * 32)['id']
+        
+        job = manager.get(orphan)
+        assert job['status'] == 'failed' and job['error'] and store.get(orphan)['status'] == 'failed'
+        assert manager.get(live)['status'] == 'queued'
+        print("   ✅ Orphaned job marked failed; live one untouched")
+
+def test_store_rejects_bad_ids():
+    with tempfile.TemporaryDirectory() as state_dir:
+        store = JobStore(state_dir)
+        assert store.get('../../etc/passwd') is None
+        assert store.get('0' * 32) is None
+
+def test_follower_tracks_claim_owner():
+    print("🧪 Testing jobs that follow another request's work...")
+    from result_cache import ResultCache
+    
+    with tempfile.TemporaryDirectory() as state_dir:
+        store = JobStore(os.path.join(state_dir, 'jobs'))
+        manager = JobManager(store, lambda data, base_filename, report: None)
+        results = ResultCache(os.path.join(state_dir, 'results'), exists=lambda path: True)
+        
+        # A synchronous request holds the claim; the follower never takes it
+        assert results.claim('f' * 64, 'request-1') is None
+        job_id = manager.add_follower(lambda: results.wait('f' * 64, 5, poll_interval=0.02))
+        assert store.get(job_id)['status'] == 'queued' and manager.pending == 0
+        assert results.owner('f' * 64) == 'request-1'
+        results.store('f' * 64, '/x.mp4', '/static/outputs/x.mp4')
+        results.release('f' * 64, 'request-1')
+        job = wait_for(store, job_id)
+        assert job['status'] == 'succeeded' and job['video_url'] == '/static/outputs/x.mp4'
+        
+        # An owner that fails leaves nothing to follow
+        failed_id = manager.add_follower(lambda: None)
+        assert wait_for(store, failed_id)['status'] == 'failed'
+        print("   ✅ Followers reported the owner's result")
+
+def parse_events(chunks):
+    events = []
+    for chunk in chunks:
+        fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], fields.get('id'), json.loads(fields['data'])))
+    return events
+
+def test_progress_event_stream():
+    print("🧪 Testing job progress events...")
+    stage_reached = threading.Event()
+    release = threading.Event()
+    
+    def run_job(data, base_filename, report):
+        report('render', 'running')
+        report('render', 'done')
+        report('encode', 'running', 0.5)
+        stage_reached.set()
+        release.wait(5)
+        return {'success': True, 'video_url': '/static/outputs/x.mp4'}
+    
+    with tempfile.TemporaryDirectory() as state_dir:
+        store = JobStore(state_dir)
+        job_id = JobManager(store, run_job).submit({}, 'x')
+        stage_reached.wait(5)
+        
+        # A stream that times out mid-job ends without a done event
+        events = parse_events(job_event_stream(store, job_id, max_seconds=0.1, poll_interval=0.02))
+        assert [name for name, _, _ in events] == ['progress']
+        _, event_id, snapshot = events[0]
+        assert snapshot['stages'] == {'render': 'done', 'encode': 'running'}
+        assert snapshot['stage'] == 'encode' and snapshot['progress'] == 0.5
+        
+        # Reconnecting with Last-Event-ID skips what the client already has
+        release.set()
+        events = parse_events(job_event_stream(store, job_id, last_event_id=int(event_id),
+                                               max_seconds=5, poll_interval=0.02))
+        assert events[-1][0] == 'done' and events[-1][2]['video_url'] == '/static/outputs/x.mp4'
+        assert all(int(eid) > int(event_id) for _, eid, _ in events)
+        
+        missing = parse_events(job_event_stream(store, '0' * 32, max_seconds=1))
+        assert missing[0][0] == 'error'
+        print("   ✅ Stage transitions streamed and resumed")
+
+if __name__ == '__main__':
+    test_jobs_run_in_background()
+    test_crashing_job_is_reported()
+    test_job_queued_until_slot()
+    test_jobs_of_dead_workers_fail()
+    test_store_rejects_bad_ids()
+    test_follower_tracks_claim_owner()
+    test_progress_event_stream()
+    print("\n✅ Job tests passed!")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test single-leader cleanup across processes and the cleanup CLI
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+from leader_election import FileLeaderLock
+import storage_manager
+
+HOLD_LOCK = """
+import sys, time
+sys.path.insert(0, {root!r})
+from leader_election import FileLeaderLock
+lock = FileLeaderLock({path!r})
+assert lock.try_acquire()
+print('leading', flush=True)
+time.sleep(60)
+"""
+
+def test_one_leader_and_takeover():
+    print("🧪 Testing leader election...")
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'cleanup.lock')
+        leader = subprocess.Popen(
+            [sys.executable, '-c', HOLD_LOCK.format(root=os.path.dirname(os.path.abspath(__file__)), path=path)],
+            stdout=subprocess.PIPE, text=True
+        )
+        try:
+            assert leader.stdout.readline().strip() == 'leading'
+            follower = FileLeaderLock(path)
+            assert not follower.try_acquire()
+            assert follower.holder() == leader.pid
+            assert not follower.acquire(timeout=0.2, poll_interval=0.05)
+
+            # The leader dies without releasing; the kernel drops its lock
+            leader.kill()
+            leader.wait()
+            assert follower.acquire(timeout=2, poll_interval=0.05)
+            assert follower.is_leader and follower.holder() == os.getpid()
+            # Leadership is kept until released, even against other handles in this process
+            assert follower.try_acquire()
+            assert not FileLeaderLock(path).try_acquire()
+            follower.release()
+            assert FileLeaderLock(path).try_acquire()
+        finally:
+            if leader.poll() is None:
+                leader.kill()
+                leader.wait()
+        print("   ✅ One leader at a time; a follower took over after a crash")
+
+def test_cleanup_cli():
+    print("🧪 Testing the cleanup CLI...")
+    with tempfile.TemporaryDirectory() as workdir:
+        outputs = os.path.join(workdir, 'outputs')
+        os.makedirs(outputs)
+        stale = os.path.join(outputs, 'stale.mp4')
+        with open(stale, 'wb') as f:
+            f.write(b'x' * 100)
+        two_days_ago = time.time() - 48 * 3600
+        os.utime(stale, (two_days_ago, two_days_ago))
+
+        lock_path = os.path.join(workdir, 'cleanup.lock')
+        args = ['cleanup', '--folder', outputs, '--catalog', os.path.join(workdir, 'catalog.db'),
+                '--lock-file', lock_path, '--max-age-hours', '24']
+
+        # A web worker leads cleanup: cron's run steps aside
+        web_leader = FileLeaderLock(lock_path)
+        assert web_leader.try_acquire()
+        assert storage_manager.main(args) == 0
+        assert os.path.exists(stale)
+        web_leader.release()
+
+        assert storage_manager.main(args) == 0
+        assert not os.path.exists(stale)
+        assert storage_manager.main(['stats'] + args[1:]) == 0
+        print("   ✅ CLI skipped while a worker led, then cleaned up")
+
+if __name__ == '__main__':
+    test_one_leader_and_takeover()
+    test_cleanup_cli()
+    print("\n✅ Leader election tests passed!")
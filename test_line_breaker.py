@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test the prefix-sum, CJK-aware line breaker
+"""
+
+from line_breaker import break_lines, find_break_opportunities
+
+def unit_width(char):
+    return 1
+
+def test_breaks_on_spaces():
+    lines = break_lines('the quick brown fox jumps', unit_width, 10)
+    assert lines == ['the quick', 'brown fox', 'jumps']
+    assert all(len(line) <= 10 for line in lines)
+
+def test_collapses_whitespace_and_empty_text():
+    assert break_lines('  a\n\nb   c ', unit_width, 80) == ['a b c']
+    assert break_lines('   ', unit_width, 80) == ['']
+
+def test_breaks_long_words():
+    assert break_lines('abcdefghij xy', unit_width, 4) == ['abcd', 'efgh', 'ij', 'xy']
+
+def test_breaks_between_cjk_characters():
+    lines = break_lines('千里之行始于足下', unit_width, 3)
+    assert lines == ['千里之', '行始于', '足下']
+
+def test_cjk_punctuation_rules():
+    print("🧪 Testing CJK punctuation break rules...")
+    breaks = find_break_opportunities('「知人者智，自知者明。」')
+    # No break after an opening bracket or before closing punctuation
+    assert not breaks[1]
+    assert not breaks[5]
+    assert not breaks[10] and not breaks[11]
+    
+    # The comma stays on the line it closes instead of starting the next one
+    lines = break_lines('知人者智，自知者明。', unit_width, 4)
+    assert all(not line.startswith(('，', '。')) for line in lines)
+    assert ''.join(lines) == '知人者智，自知者明。'
+    print(f"   ✅ {lines}")
+
+def test_mixed_scripts_and_hyphens():
+    assert break_lines('Hello世界', unit_width, 6) == ['Hello世', '界']
+    assert break_lines('Hello世界', unit_width, 5) == ['Hello', '世界']
+    assert break_lines('well-known fact', unit_width, 7) == ['well-', 'known', 'fact']
+
+def test_exact_line_width_pulls_back():
+    # Pretend kerning makes any line containing 'AV' one unit wider
+    def kerned(line):
+        return len(line) + (1 if 'AV' in line else 0)
+    lines = break_lines('AV AV AV', unit_width, 5, kerned)
+    assert all(kerned(line) <= 5 for line in lines)
+
+if __name__ == '__main__':
+    test_breaks_on_spaces()
+    test_collapses_whitespace_and_empty_text()
+    test_breaks_long_words()
+    test_breaks_between_cjk_characters()
+    test_cjk_punctuation_rules()
+    test_mixed_scripts_and_hyphens()
+    test_exact_line_width_pulls_back()
+    print("\n✅ Line breaker tests passed!")
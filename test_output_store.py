@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test the content-addressed output layout and the flat-layout migration
+"""
+
+import os
+import json
+import time
+import tempfile
+from output_store import OutputStore, hash_file
+from storage_catalog import StorageCatalog
+from result_cache import ResultCache
+from migrate_outputs import migrate
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def test_publish_and_urls():
+    print("🧪 Testing content-addressed publishing...")
+    with tempfile.TemporaryDirectory() as workdir:
+        store = OutputStore(workdir)
+        # Two jobs with the same title in the same second no longer collide
+        first = write(store.staging_path('Title_20240101_120000.mp4'), b'first video')
+        first_path, is_new = store.publish(first)
+        assert store.staging_path('Title_20240101_120000.mp4') != store.staging_path('Title_20240101_120000.mp4')
+        second = write(store.staging_path('Title_20240101_120000.mp4'), b'second video')
+        second_path, _ = store.publish(second)
+        assert is_new and first_path != second_path
+        digest = hash_file(first_path)
+        assert first_path == os.path.join(workdir, digest[:2], digest[2:4], f'{digest}.mp4')
+
+        # The same bytes again are stored once
+        again = write(store.staging_path('again.mp4'), b'first video')
+        assert store.publish(again) == (first_path, False)
+        assert not os.path.exists(again) and os.listdir(store.staging_dir) == []
+        assert sorted(store.iter_outputs()) == sorted([first_path, second_path])
+
+        # Cleanup evicting the stored copy mid-publish doesn't lose the video
+        original_touch = store.backend.touch
+        def evicted_touch(key):
+            os.remove(store.backend.local_path(key))
+            raise FileNotFoundError(key)
+        store.backend.touch = evicted_touch
+        racing = write(store.staging_path('racing.mp4'), b'first video')
+        assert store.publish(racing) == (first_path, True)
+        store.backend.touch = original_touch
+        assert os.path.exists(first_path) and not os.path.exists(racing)
+
+        # Files left in staging by a dead process are swept; live ones stay
+        live = write(store.staging_path('live.mp4'), b'encoding')
+        write(os.path.join(store.staging_dir, f'dead-{2 ** 22 + 1}-abcd1234.mp4'), b'abandoned')
+        assert store.sweep_staging() == 1 and os.listdir(store.staging_dir) == [os.path.basename(live)]
+        os.remove(live)
+
+        url = store.url_for(first_path)
+        assert url == f'/static/outputs/{digest[:2]}/{digest[2:4]}/{digest}.mp4'
+        assert store.path_from_url(url) == first_path
+        for bad in ('/static/outputs/Title_20240101_120000.mp4', '/static/outputs/../../app.py',
+                    f'/static/outputs/{digest[2:4]}/{digest[:2]}/../{digest}.mp4', '/static/css/style.css'):
+            assert store.path_from_url(bad) is None, bad
+        print("   ✅ Published, deduplicated and mapped to URLs")
+
+def test_migrate_flat_outputs():
+    print("🧪 Testing the flat layout migration...")
+    with tempfile.TemporaryDirectory() as workdir:
+        outputs = os.path.join(workdir, 'outputs')
+        os.makedirs(outputs)
+        old_a = write(os.path.join(outputs, 'a_20240101_120000.mp4'), b'video a')
+        old_b = write(os.path.join(outputs, 'b_20240101_120000.mp4'), b'video b')
+        old_copy = write(os.path.join(outputs, 'a_20240102_120000.mp4'), b'video a')
+        write(os.path.join(outputs, 'notes.txt'), b'not a video')
+
+        catalog = StorageCatalog(os.path.join(workdir, 'catalog.db'))
+        catalog.reconcile(outputs, ('.mp4',))
+        now = time.time()
+        for when in (now, now + 1):
+            catalog.record_access(old_a, when)
+        catalog.record_access(old_copy, now + 2)
+        result_cache = ResultCache(os.path.join(workdir, 'results'))
+        result_cache.store('a' * 64, old_a, '/static/outputs/a_20240101_120000.mp4')
+
+        store = OutputStore(outputs)
+        assert migrate(store, dry_run=True)['moved'] == 3
+        assert os.path.exists(old_a)
+
+        result = migrate(store, catalog, result_cache, link=True)
+        assert (result['moved'], result['deduplicated'], result['cataloged']) == (2, 1, 3)
+        assert not result['errors'] and result['result_entries'] == 1
+
+        new_a = store.path_for(hash_file(old_a))
+        assert sorted(store.iter_outputs()) == sorted([new_a, store.path_for(hash_file(old_b))])
+        # Old URLs keep working through the links, and the catalog doesn't count them twice
+        assert os.path.islink(old_a) and open(old_a, 'rb').read() == b'video a'
+        assert catalog.totals() == (2, len(b'video a') + len(b'video b'))
+        assert catalog.reconcile(outputs, ('.mp4',)) == {'added': 0, 'removed': 0}
+        # Both copies' history follows the merged file
+        entry = catalog.get(new_a)
+        assert entry.hits == 3 and entry.last_access == now + 2
+
+        with open(os.path.join(workdir, 'results', 'a' * 64 + '.json')) as f:
+            entry = json.load(f)
+        assert entry['video_path'] == new_a and entry['video_url'] == store.url_for(new_a)
+        assert result_cache.lookup('a' * 64) == store.url_for(new_a)
+
+        # Running it again finds nothing left to move
+        assert migrate(store, catalog, result_cache)['moved'] == 0
+        catalog.close()
+        print(f"   ✅ Migrated {result['moved']} outputs, merged {result['deduplicated']} duplicate")
+
+if __name__ == '__main__':
+    test_publish_and_urls()
+    test_migrate_flat_outputs()
+    print("\n✅ Output store tests passed!")
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Test the staged generate_video pipeline
+"""
+
+import os
+import time
+import tempfile
+import subprocess
+import video_generator
+from video_generator import VideoGenerator, card_cache_key
+from voice_providers import VoiceProvider
+from encoder import get_encoder
+from test_encoder import media_duration
+
+class SlowToneProvider(VoiceProvider):
+    """Fake TTS: waits like a network call, then writes a short MP3"""
+    AUDIO_FORMATS = {'mp3': 'mp3'}
+    
+    def __init__(self, delay):
+        self.delay = delay
+    
+    def generate_speech(self, text, voice, output_path, **kwargs):
+        time.sleep(self.delay)
+        subprocess.run([
+            get_encoder().capabilities.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', 'sine=frequency=440:duration=2',
+            '-c:a', 'libmp3lame', '-b:a', '64k', output_path
+        ], check=True)
+        return True
+    
+    def is_available(self):
+        return True
+    
+    def get_voice_list(self):
+        return []
+
+class FailingProvider(SlowToneProvider):
+    """Fake TTS that leaves a partial file behind and reports failure"""
+    
+    def __init__(self):
+        super().__init__(delay=0)
+    
+    def generate_speech(self, text, voice, output_path, **kwargs):
+        with open(output_path, 'wb') as f:
+            f.write(b'partial')
+        return False
+
+def make_request(text='Render and speak at the same time.'):
+    return {
+        'text': text,
+        'title': 'Pipeline Test',
+        'color_template': 'forest',
+        'title_font': 'roboto',
+        'body_font': 'roboto',
+        'voice_provider': 'fake',
+        'voice': 'alloy',
+        'voice_speed': 1.0,
+        'voice_stability': 0.5
+    }
+
+def test_card_key_keeps_paragraphs():
+    # The card draws each \n\n paragraph separately; other whitespace is cosmetic
+    assert card_cache_key(make_request('One.\n\nTwo.')) != card_cache_key(make_request('One. Two.'))
+    assert card_cache_key(make_request('One.  \n\nTwo. ')) == card_cache_key(make_request('One.\n\nTwo.'))
+
+def test_render_and_tts_overlap():
+    print("🧪 Testing concurrent render + TTS...")
+    original = video_generator.get_voice_provider
+    video_generator.get_voice_provider = lambda name, config: SlowToneProvider(delay=1.0)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            video_gen = VideoGenerator({'UPLOAD_FOLDER': workdir})
+            events = []
+            reserved = []
+            
+            def report(stage, state, progress=None):
+                events.append((stage, state, progress))
+                if stage == 'tts':
+                    profiles = video_gen.scheduler.get_stats()['profiles']
+                    reserved.append(sum(count for name, count in profiles.items() if name != 'render'))
+            
+            result = video_gen.generate_video(make_request(), 'pipeline_test', report)
+            
+            assert result['success'], result
+            assert os.path.exists(result['video_path'])
+            timings = result['timings']
+            assert {'render', 'tts', 'encode', 'total'} <= set(timings)
+            
+            # Stages overlap: total is well under the sequential sum
+            sequential = timings['render'] + timings['tts'] + timings['encode']
+            assert timings['total'] < sequential, timings
+            assert timings['total'] < max(timings['render'], timings['tts']) + timings['encode'] + 0.5
+            
+            # Every stage starts and finishes, and encoder progress is reported
+            for stage in ('layout', 'render', 'tts', 'encode', 'mux'):
+                assert (stage, 'running') in [event[:2] for event in events], stage
+                assert (stage, 'done') in [event[:2] for event in events], stage
+            encode_progress = [p for stage, state, p in events if stage == 'encode' and p is not None]
+            assert encode_progress == sorted(encode_progress) and encode_progress[-1] == 1.0
+            
+            # The finished encode calibrated the cost model
+            stats = video_gen.scheduler.get_stats()
+            profile = next(name for name, count in stats['profiles'].items() if count and name != 'render')
+            assert stats['model'][profile]['samples'] == 1 and stats['active'] == 0
+            # No encode was reserved while speech was being synthesized; the render had its own
+            assert reserved == [0, 0]
+            assert stats['profiles']['render'] == 1
+            
+            # Intermediate files are removed; the video sits in its hash shard
+            assert list(video_gen.output_store.iter_outputs()) == [result['video_path']]
+            assert os.listdir(video_gen.output_store.staging_dir) == []
+            assert sorted(os.listdir(workdir))[0] == '.staging' and len(os.listdir(workdir)) == 2
+            print(f"   ✅ Timings: {({k: round(v, 2) for k, v in timings.items()})}")
+    finally:
+        video_generator.get_voice_provider = original
+
+def test_voice_change_only_remuxes():
+    print("🧪 Testing card and video track caches...")
+    original = video_generator.get_voice_provider
+    video_generator.get_voice_provider = lambda name, config: SlowToneProvider(delay=0)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            video_gen = VideoGenerator({
+                'UPLOAD_FOLDER': workdir,
+                'CARD_CACHE_DIR': os.path.join(workdir, 'cards'),
+                'CARD_CACHE_MAX_MB': 10,
+                'VIDEO_TRACK_CACHE_DIR': os.path.join(workdir, 'tracks'),
+                'VIDEO_TRACK_CACHE_MAX_MB': 10
+            })
+            first = video_gen.generate_video(make_request(), 'first')
+            assert first['success'], first
+            
+            # Same card, different voice: no render, no video encode
+            data = make_request()
+            data['voice'] = 'nova'
+            second = video_gen.generate_video(data, 'second')
+            assert second['success'], second
+            assert video_gen.card_cache.get_stats()['hits'] == 1
+            assert video_gen.track_cache.get_stats()['hits'] == 1
+            assert second['timings']['encode'] < 1.0, second['timings']
+            
+            # The bucketed track is cut back to the audio's length, give or take a frame
+            ffmpeg_path = get_encoder().capabilities.ffmpeg_path
+            assert media_duration(ffmpeg_path, second['video_path']) <= media_duration(ffmpeg_path, first['video_path']) + 1.0
+            result = subprocess.run([ffmpeg_path, '-hide_banner', '-i', second['video_path']], capture_output=True, text=True)
+            assert 'Video:' in result.stderr and 'Audio:' in result.stderr
+            print(f"   ✅ Re-mux took {second['timings']['encode']:.2f}s (first encode {first['timings']['encode']:.2f}s)")
+    finally:
+        video_generator.get_voice_provider = original
+
+def test_diskless_pipeline():
+    print("🧪 Testing the diskless pipeline...")
+    original = video_generator.get_voice_provider
+    video_generator.get_voice_provider = lambda name, config: SlowToneProvider(delay=0)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            scratch_dir = os.path.join(workdir, 'scratch')
+            os.makedirs(scratch_dir)
+            video_gen = VideoGenerator({
+                'UPLOAD_FOLDER': workdir,
+                'DISKLESS_PIPELINE': True,
+                'PIPELINE_SCRATCH_DIR': scratch_dir,
+                'CARD_CACHE_DIR': os.path.join(workdir, 'cards'),
+                'CARD_CACHE_MAX_MB': 10
+            })
+            results = [video_gen.generate_video(make_request(), name) for name in ('first', 'second')]
+            assert all(result['success'] for result in results), results
+            result = results[-1]
+            
+            # No card PNG anywhere; speech went to a job workspace that was removed
+            assert not [name for name in os.listdir(workdir) if name.endswith(('.png', '.m4a'))]
+            # Both jobs produced the same bytes, so they share one stored file
+            assert results[0]['video_path'] == results[1]['video_path']
+            assert list(video_gen.output_store.iter_outputs()) == [result['video_path']]
+            assert os.listdir(scratch_dir) == []
+            # The frame is cached as a PNG, so the second job skipped rendering
+            assert [name.endswith('.png') for name in os.listdir(os.path.join(workdir, 'cards'))] == [True]
+            assert video_gen.card_cache.get_stats()['hits'] == 1
+            
+            ffmpeg_path = get_encoder().capabilities.ffmpeg_path
+            assert abs(media_duration(ffmpeg_path, result['video_path']) - 2) < 0.6
+            
+            # A failed job cleans up its partial audio too
+            video_generator.get_voice_provider = lambda name, config: FailingProvider()
+            failed = video_gen.generate_video(make_request(), 'failed')
+            assert not failed['success']
+            assert os.listdir(scratch_dir) == []
+            assert video_gen.workspaces.get_stats()['active'] == 0
+            print(f"   ✅ Encoded from memory in {result['timings']['encode']:.2f}s")
+    finally:
+        video_generator.get_voice_provider = original
+
+if __name__ == '__main__':
+    test_card_key_keeps_paragraphs()
+    test_render_and_tts_overlap()
+    test_voice_change_only_remuxes()
+    test_diskless_pipeline()
+    print("\n✅ Pipeline tests passed!")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test the whole-output result cache
+"""
+
+import os
+import time
+import tempfile
+import threading
+from result_cache import ResultCache, request_fingerprint
+
+def make_request(**overrides):
+    data = {
+        'text': 'The only way to do great work is to love what you do.',
+        'title': 'Steve Jobs',
+        'color_template': 'ocean',
+        'title_font': 'roboto',
+        'body_font': 'roboto',
+        'voice_provider': 'openai',
+        'voice': 'alloy',
+        'voice_speed': 1.0,
+        'voice_stability': 0.5
+    }
+    data.update(overrides)
+    return data
+
+def test_fingerprint_normalizes_fields():
+    base = request_fingerprint(make_request())
+    assert request_fingerprint(make_request(text='The only way to do great work  is to love what you do. ')) == base
+    assert request_fingerprint(make_request(voice_speed='1.0')) == base
+    assert request_fingerprint(make_request(voice='nova')) != base
+    assert request_fingerprint(make_request(color_template='sunset')) != base
+    # Paragraph breaks are drawn, so they must not be normalized away
+    assert request_fingerprint(make_request(text='One.\n\nTwo.')) != request_fingerprint(make_request(text='One. Two.'))
+    assert request_fingerprint(make_request(text='One. \n\n Two.')) == request_fingerprint(make_request(text='One.\n\nTwo.'))
+
+def test_lookup_and_missing_output():
+    print("🧪 Testing result cache lookups...")
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = ResultCache(os.path.join(workdir, 'results'))
+        video_path = os.path.join(workdir, 'quote.mp4')
+        open(video_path, 'wb').write(b'video')
+        fingerprint = request_fingerprint(make_request())
+        
+        assert cache.lookup(fingerprint) is None
+        cache.store(fingerprint, video_path, '/static/outputs/quote.mp4')
+        start = time.perf_counter()
+        assert cache.lookup(fingerprint) == '/static/outputs/quote.mp4'
+        print(f"   ✅ Hit in {(time.perf_counter() - start) * 1000:.2f}ms")
+        
+        # Once storage cleanup removes the video, the entry no longer matches
+        os.remove(video_path)
+        assert cache.lookup(fingerprint) is None
+        assert cache.get_stats()['hits'] == 1
+
+def test_concurrent_requests_collapse():
+    print("🧪 Testing in-flight collapse...")
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = ResultCache(os.path.join(workdir, 'results'))
+        fingerprint = request_fingerprint(make_request())
+        generated = []
+        results = []
+        lock = threading.Lock()
+        
+        def handle(owner):
+            video_url = cache.lookup(fingerprint)
+            if not video_url and cache.claim(fingerprint, owner) is not None:
+                video_url = cache.wait(fingerprint, timeout=5, poll_interval=0.01)
+            if not video_url:
+                try:
+                    time.sleep(0.2)  # The one real generation
+                    video_path = os.path.join(workdir, 'quote.mp4')
+                    open(video_path, 'wb').write(b'video')
+                    video_url = '/static/outputs/quote.mp4'
+                    cache.store(fingerprint, video_path, video_url)
+                    with lock:
+                        generated.append(owner)
+                finally:
+                    cache.release(fingerprint, owner)
+            with lock:
+                results.append(video_url)
+        
+        threads = [threading.Thread(target=handle, args=(f'request-{i}',)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(generated) == 1, generated
+        assert results == ['/static/outputs/quote.mp4'] * 8
+        assert cache.owner(fingerprint) is None
+        print("   ✅ 8 identical requests, 1 generation")
+
+def test_stale_claim_is_broken():
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = ResultCache(workdir, claim_timeout=60)
+        assert cache.claim('abc', 'dead-owner') is None
+        assert cache.claim('abc', 'other') == 'dead-owner'
+        
+        past = time.time() - 120
+        os.utime(os.path.join(workdir, 'abc.claim'), (past, past))
+        assert cache.claim('abc', 'other') is None
+        assert cache.owner('abc') == 'other'
+        
+        # A breaker that finds a fresh claim in place puts it back
+        cache._break_stale('abc', 'dead-owner')
+        assert cache.owner('abc') == 'other'
+        assert sorted(os.listdir(workdir)) == ['.claims.lock', 'abc.claim']
+
+def test_racing_breakers_take_over_once():
+    print("🧪 Testing concurrent takeover of a stale claim...")
+    with tempfile.TemporaryDirectory() as workdir:
+        assert ResultCache(workdir).claim('abc', 'dead-owner') is None
+        past = time.time() - 1200
+        os.utime(os.path.join(workdir, 'abc.claim'), (past, past))
+        
+        barrier = threading.Barrier(8)
+        winners = []
+        def take_over(i):
+            cache = ResultCache(workdir)
+            barrier.wait()
+            if cache.claim('abc', f'owner-{i}') is None:
+                winners.append(i)
+        threads = [threading.Thread(target=take_over, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(winners) == 1 and ResultCache(workdir).owner('abc') == f'owner-{winners[0]}'
+        print("   ✅ One of 8 racing requests took the stale claim")
+
+def test_held_claims_stay_fresh():
+    with tempfile.TemporaryDirectory() as workdir:
+        owner = ResultCache(workdir, claim_timeout=0.3)
+        other = ResultCache(workdir, claim_timeout=0.3)
+        assert owner.claim('abc', 'slow-job') is None
+        # Still running well past the timeout, so nobody takes it over
+        time.sleep(0.8)
+        assert other.claim('abc', 'other') == 'slow-job'
+        owner.release('abc', 'slow-job')
+        assert other.claim('abc', 'other') is None
+
+if __name__ == '__main__':
+    test_fingerprint_normalizes_fields()
+    test_lookup_and_missing_output()
+    test_concurrent_requests_collapse()
+    test_stale_claim_is_broken()
+    test_racing_breakers_take_over_once()
+    test_held_claims_stay_fresh()
+    print("\n✅ Result cache tests passed!")
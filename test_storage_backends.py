@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Test output storage backends against an in-memory S3 stand-in
+"""
+
+import os
+import uuid
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from flask import Flask
+import video_generator
+from video_generator import VideoGenerator
+from output_store import OutputStore
+from storage_backends import S3StorageBackend, create_storage_backend
+from storage_manager import StorageManager
+from app import output_download_response
+from encoder import get_encoder
+from test_encoder import media_duration
+from test_pipeline import SlowToneProvider, FailingProvider, make_request
+
+class FakeClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+        self.closed = False
+
+    def iter_chunks(self, chunk_size):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+class FakeS3Client:
+    """The parts of the boto3 S3 client the backend uses, kept in memory like a local MinIO"""
+
+    def __init__(self, page_size=1000):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+        self.page_size = page_size
+
+    def _store(self, key, data):
+        self.objects[key] = (bytes(data), datetime.now(timezone.utc))
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None):
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {'key': Key, 'parts': {}}
+        self.calls.append(('create_multipart_upload', Key))
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId]['parts'][PartNumber] = Body
+        self.calls.append(('upload_part', Key))
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        assert numbers == sorted(upload['parts']), numbers
+        self._store(Key, b''.join(upload['parts'][n] for n in numbers))
+        self.calls.append(('complete_multipart_upload', Key))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.calls.append(('abort_multipart_upload', Key))
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self._store(Key, Body)
+        self.calls.append(('put_object', Key))
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise FakeClientError('404')
+        data, modified = self.objects[Key]
+        return {'ContentLength': len(data), 'LastModified': modified}
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self._store(Key, self.objects[CopySource['Key']][0])
+        self.calls.append(('copy_object', Key))
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+        self.calls.append(('delete_object', Key))
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[Key][0]
+        if Range:
+            start, end = Range[len('bytes='):].split('-')
+            data = data[int(start):int(end) + 1]
+        return {'Body': FakeBody(data), 'ContentLength': len(data)}
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + self.page_size]
+        response = {'Contents': [{'Key': key, 'Size': len(self.objects[key][0]),
+                                  'LastModified': self.objects[key][1]} for key in page],
+                    'IsTruncated': start + self.page_size < len(keys)}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + self.page_size)
+        return response
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.example.com/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+def test_multipart_writer():
+    print("🧪 Testing streaming multipart upload...")
+    client = FakeS3Client()
+    backend = S3StorageBackend(client, 'videos', prefix='outputs', part_size=1000)
+
+    writer = backend.open_writer('ab/cd/big.mp4')
+    writer.write(b'a' * 600)
+    assert not client.calls  # Less than a part is held back
+    writer.write(b'b' * 1500)
+    # Two full parts went out before the end of the stream
+    assert [call[0] for call in client.calls] == ['create_multipart_upload', 'upload_part', 'upload_part']
+    writer.write(b'c' * 10)
+    writer.close()
+    assert client.objects['outputs/ab/cd/big.mp4'][0] == b'a' * 600 + b'b' * 1500 + b'c' * 10
+    assert backend.stat('ab/cd/big.mp4')[0] == 2110 and not client.uploads
+
+    # Small outputs are a single PUT; aborting drops uploaded parts
+    small = backend.open_writer('small.mp4')
+    small.write(b'tiny')
+    small.close()
+    assert client.calls[-1] == ('put_object', 'outputs/small.mp4')
+    aborted = backend.open_writer('aborted.mp4')
+    aborted.write(b'x' * 2500)
+    aborted.abort()
+    assert not client.uploads and not backend.exists('aborted.mp4')
+
+    # Listings page through the bucket and skip uploads still in staging
+    client._store('outputs/.staging/pending.mp4', b'partial')
+    client.page_size = 1
+    assert sorted(key for key, _, _ in backend.iter_objects()) == ['ab/cd/big.mp4', 'small.mp4']
+    print("   ✅ Parts uploaded as data arrived")
+
+def test_pipeline_streams_to_s3():
+    print("🧪 Testing the pipeline with an S3 backend...")
+    original = video_generator.get_voice_provider
+    video_generator.get_voice_provider = lambda name, config: SlowToneProvider(delay=0)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            scratch_dir = os.path.join(workdir, 'scratch')
+            os.makedirs(scratch_dir)
+            video_gen = VideoGenerator({'UPLOAD_FOLDER': workdir, 'PIPELINE_SCRATCH_DIR': scratch_dir})
+            client = FakeS3Client()
+            backend = S3StorageBackend(client, 'videos', prefix='outputs', part_size=16 * 1024)
+            video_gen.output_store = OutputStore(workdir, '/outputs', backend=backend)
+
+            result = video_gen.generate_video(make_request(), 'streamed')
+            assert result['success'], result
+            key = video_gen.output_store.key_for(result['video_path'])
+            assert video_gen.output_store.url_for(result['video_path']) == f'/outputs/{key}'
+
+            # Uploaded in several parts while encoding, then moved to its content address
+            assert sum(call[0] == 'upload_part' for call in client.calls) > 1
+            assert list(client.objects) == [f'outputs/{key}'] and not client.uploads
+            # Nothing was kept on this host
+            assert [name for _, _, files in os.walk(workdir) for name in files] == []
+            assert video_gen.output_store.exists(result['video_path'])
+
+            # The fragmented MP4 plays back with both streams
+            copy_path = os.path.join(workdir, 'copy.mp4')
+            with open(copy_path, 'wb') as f:
+                f.write(client.objects[f'outputs/{key}'][0])
+            ffmpeg_path = get_encoder().capabilities.ffmpeg_path
+            assert abs(media_duration(ffmpeg_path, copy_path) - 2) < 1.1
+            probe = subprocess.run([ffmpeg_path, '-hide_banner', '-i', copy_path], capture_output=True, text=True)
+            assert 'Video:' in probe.stderr and 'Audio:' in probe.stderr
+            os.remove(copy_path)
+
+            # The same video again is stored once
+            again = video_gen.generate_video(make_request(), 'again')
+            assert again['video_path'] == result['video_path'] and len(client.objects) == 1
+            assert result['new_output'] and not again['new_output']
+
+            # A failed move out of staging doesn't leave the upload behind
+            original_copy = client.copy_object
+            def failing_copy(**kwargs):
+                raise FakeClientError('InternalError')
+            client.copy_object = failing_copy
+            assert not video_gen.generate_video(make_request('Never moved.'), 'unmoved')['success']
+            client.copy_object = original_copy
+            assert len(client.objects) == 1
+
+            # A failed encode leaves no upload behind
+            video_generator.get_voice_provider = lambda name, config: FailingProvider()
+            assert not video_gen.generate_video(make_request(), 'failed')['success']
+            original_encode = video_gen._encode
+            video_gen._encode = lambda *args: False
+            video_generator.get_voice_provider = lambda name, config: SlowToneProvider(delay=0)
+            assert not video_gen.generate_video(make_request('Never encoded.'), 'unencoded')['success']
+            video_gen._encode = original_encode
+            assert len(client.objects) == 1 and not client.uploads
+            assert os.listdir(scratch_dir) == []
+            print(f"   ✅ Streamed {len(client.objects[f'outputs/{key}'][0])} bytes to the bucket")
+    finally:
+        video_generator.get_voice_provider = original
+
+def test_storage_manager_and_downloads():
+    print("🧪 Testing S3 eviction and downloads...")
+    with tempfile.TemporaryDirectory() as workdir:
+        client = FakeS3Client()
+        backend = create_storage_backend({
+            'OUTPUT_STORAGE_BACKEND': 's3', 'S3_BUCKET': 'videos', 'S3_PREFIX': 'outputs',
+            'S3_REDIRECT_DOWNLOADS': False
+        }, client=client)
+        outputs = os.path.join(workdir, 'outputs')
+        store = OutputStore(outputs, '/outputs', backend=backend)
+        paths = []
+        for i in range(3):
+            source = store.staging_path('video.mp4')
+            with open(source, 'wb') as f:
+                f.write(bytes([i]) * 1000)
+            paths.append(store.publish(source)[0])
+        assert os.listdir(store.staging_dir) == []
+
+        # A new catalog is built from the bucket listing
+        manager = StorageManager(outputs, catalog_path=os.path.join(workdir, 'catalog.db'), backend=backend)
+        assert manager.catalog.totals() == (3, 3000)
+        manager.record_access(paths[0])
+        manager.record_access(paths[2])
+        result = manager.cleanup_by_size(target_size_gb=2000 / (1024 ** 3))
+        assert result['deleted_count'] == 1 and not store.exists(paths[1])
+        client.delete_object(Bucket='videos', Key=f'outputs/{store.key_for(paths[2])}')
+        assert manager.reconcile() == {'added': 0, 'removed': 1}
+
+        # Proxied downloads honour ranges
+        key = store.key_for(paths[0])
+        with Flask(__name__).test_request_context():
+            response = output_download_response(backend, key, 'bytes=100-199')
+            assert response.status_code == 206
+            assert response.headers['Content-Range'] == 'bytes 100-199/1000'
+            assert b''.join(response.response) == bytes([0]) * 100
+            response = output_download_response(backend, key)
+            assert response.status_code == 200 and response.headers['Content-Length'] == '1000'
+            assert output_download_response(backend, key, 'bytes=5000-').status_code == 416
+            assert output_download_response(backend, 'ab/cd/missing.mp4')[1] == 404
+
+            # Or redirect to the bucket
+            backend.redirect_downloads = True
+            response = output_download_response(backend, key)
+            assert response.status_code == 302
+            assert response.headers['Location'].startswith(f'https://s3.example.com/videos/outputs/{key}')
+        print("   ✅ Evicted from the bucket and served ranges")
+
+if __name__ == '__main__':
+    test_multipart_writer()
+    test_pipeline_streams_to_s3()
+    test_storage_manager_and_downloads()
+    print("\n✅ Storage backend tests passed!")
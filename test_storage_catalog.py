@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Test the persistent storage catalog and catalog-driven cleanup
+"""
+
+import os
+import time
+import tempfile
+from eviction_policies import get_eviction_policy
+from storage_catalog import StorageCatalog
+from storage_manager import StorageManager
+
+def test_running_totals_and_order():
+    print("🧪 Testing catalog totals...")
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'catalog.db')
+        catalog = StorageCatalog(db_path)
+        for i in range(250):
+            catalog.add(f'/outputs/video_{i}.mp4', 1000 + i, mtime=1000.0 + (i * 7) % 250)
+        assert catalog.totals() == (250, sum(1000 + i for i in range(250)))
+
+        # Rewriting an output replaces its size rather than adding to it
+        catalog.add('/outputs/video_0.mp4', 5000, mtime=2000.0)
+        catalog.remove('/outputs/video_1.mp4')
+        catalog.remove('/outputs/missing.mp4')
+        files, total_bytes = catalog.totals()
+        assert files == 249
+        assert total_bytes == sum(1000 + i for i in range(2, 250)) + 5000
+
+        # Batched index walk yields every entry once, oldest first
+        mtimes = [entry.mtime for entry in catalog.eviction_order(batch_size=16)]
+        assert len(mtimes) == 249 and mtimes == sorted(mtimes)
+
+        stats = catalog.stats(now=2000.0 + 3600, old_after_hours=1)
+        assert stats['files'] == 249 and stats['newest_mtime'] == 2000.0
+        assert stats['old_files'] == 248
+        catalog.close()
+
+        # Totals survive a restart
+        reopened = StorageCatalog(db_path)
+        assert reopened.totals() == (249, total_bytes)
+        reopened.close()
+        print("   ✅ Totals kept by triggers and persisted")
+
+def test_cleanup_without_directory_scans():
+    print("🧪 Testing catalog-driven cleanup...")
+    with tempfile.TemporaryDirectory() as workdir:
+        outputs = os.path.join(workdir, 'outputs')
+        os.makedirs(outputs)
+        manager = StorageManager(outputs, max_age_hours=24, max_storage_gb=1.0,
+                                 catalog_path=os.path.join(workdir, 'catalog.db'))
+        now = time.time()
+        for i in range(40):
+            path = os.path.join(outputs, f'video_{i}.mp4')
+            with open(path, 'wb') as f:
+                f.write(b'x' * 1024)
+            os.utime(path, (now - i * 600, now - i * 600))
+            manager.record_output(path)
+
+        original_walk, original_listdir = os.walk, os.listdir
+        def no_scan(*args, **kwargs):
+            raise AssertionError('directory scanned')
+        os.walk = os.listdir = no_scan
+        try:
+            stats = manager.get_storage_stats()
+            assert stats['total_files'] == 40
+            assert abs(stats['oldest_file_hours'] - 39 * 600 / 3600) < 0.1
+
+            # Down to 10KB: the 30 oldest go and the 10 newest stay
+            result = manager.cleanup_by_size(target_size_gb=10 * 1024 / (1024 ** 3))
+            assert result['deleted_count'] == 30
+            assert manager.catalog.totals() == (10, 10 * 1024)
+
+            # A file someone else already removed is just forgotten
+            os.remove(os.path.join(outputs, 'video_9.mp4'))
+            result = manager.cleanup_by_size(target_size_gb=5 * 1024 / (1024 ** 3))
+            assert result['deleted_count'] == 4 and not result['errors']
+            assert manager.catalog.totals()[0] == 5
+            # Under budget, enforcing it is just a look at the running total
+            assert manager.enforce_budget() is None
+        finally:
+            os.walk, os.listdir = original_walk, original_listdir
+
+        assert sorted(os.listdir(outputs)) == [f'video_{i}.mp4' for i in range(5)]
+        # Files copied in by hand show up after a reconcile
+        with open(os.path.join(outputs, 'manual.mp4'), 'wb') as f:
+            f.write(b'x' * 10)
+        assert manager.catalog.reconcile(outputs) == {'added': 1, 'removed': 0}
+        assert manager.catalog.totals() == (6, 5 * 1024 + 10)
+        print("   ✅ Evicted and reported without walking the folder")
+
+def evict_one(catalog):
+    entry = next(catalog.eviction_order())
+    catalog.remove(entry.path, evicted=True)
+    return entry.path
+
+def test_policies_follow_accesses():
+    print("🧪 Testing eviction policies...")
+    with tempfile.TemporaryDirectory() as workdir:
+        mb = 1024 ** 2
+        victims = {}
+        for name in ('lru', 'lfu', 'gdsf'):
+            catalog = StorageCatalog(os.path.join(workdir, f'{name}.db'), get_eviction_policy(name))
+            # 'popular' is the oldest output but gets reshared; 'big' is large and watched twice
+            catalog.add('popular.mp4', 2 * mb, mtime=100.0)
+            catalog.add('big.mp4', 20 * mb, mtime=200.0)
+            catalog.add('fresh.mp4', 2 * mb, mtime=300.0)
+            for when in (400.0, 410.0, 420.0):
+                catalog.record_access('popular.mp4', when)
+            for when in (350.0, 360.0):
+                catalog.record_access('big.mp4', when)
+            victims[name] = [evict_one(catalog), evict_one(catalog)]
+            catalog.close()
+
+        # LRU keeps the recently watched output; LFU keeps the most watched;
+        # GDSF also weighs size, so the large one goes before the fresh small one
+        assert victims['lru'] == ['fresh.mp4', 'big.mp4'], victims
+        assert victims['lfu'] == ['fresh.mp4', 'big.mp4'], victims
+        assert victims['gdsf'] == ['big.mp4', 'fresh.mp4'], victims
+        assert 'popular.mp4' not in sum(victims.values(), [])
+
+        # GDSF ages: evictions raise L to the victim's priority (fresh.mp4 had 1/2MB),
+        # and new outputs start from L, ahead of anything untouched since
+        catalog = StorageCatalog(os.path.join(workdir, 'gdsf.db'), get_eviction_policy('gdsf'))
+        assert catalog.stats()['inflation'] == 0.5
+        catalog.add('newer.mp4', 2 * mb, mtime=500.0)
+        assert catalog.get('newer.mp4').priority == 1.0
+
+        # Switching policy re-ranks what is already cataloged
+        catalog.close()
+        catalog = StorageCatalog(os.path.join(workdir, 'gdsf.db'), get_eviction_policy('lru'))
+        assert [entry.path for entry in catalog.eviction_order()] == ['popular.mp4', 'newer.mp4']
+        assert catalog.stats()['inflation'] == 0
+        catalog.close()
+        print(f"   ✅ Evicted first: {({name: v[0] for name, v in victims.items()})}")
+
+def test_budget_spares_the_new_output():
+    print("🧪 Testing that enforcing the budget keeps the new output...")
+    with tempfile.TemporaryDirectory() as workdir:
+        outputs = os.path.join(workdir, 'outputs')
+        os.makedirs(outputs)
+        manager = StorageManager(outputs, max_storage_gb=2.5 / 1024, catalog_path=os.path.join(workdir, 'catalog.db'),
+                                 eviction_policy='gdsf')
+        paths = []
+        for name in ('a.mp4', 'b.mp4', 'c.mp4'):
+            path = os.path.join(outputs, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 1024 ** 2)
+            manager.record_output(path)
+            paths.append(path)
+            if name != 'c.mp4':
+                manager.record_access(path)
+
+        # c.mp4 has no hits yet, so it is the lowest GDSF priority
+        assert next(manager.catalog.eviction_order()).path == paths[2]
+        result = manager.enforce_budget(keep=[paths[2]])
+        assert result['deleted_count'] == 1
+        assert os.path.exists(paths[2]) and manager.catalog.get(paths[2]) is not None
+        print("   ✅ Evicted an older output instead of the one just made")
+
+def test_unknown_policy_is_rejected():
+    try:
+        get_eviction_policy('fifo')
+    except ValueError as e:
+        assert 'gdsf' in str(e)
+    else:
+        assert False, 'expected ValueError'
+
+if __name__ == '__main__':
+    test_running_totals_and_order()
+    test_cleanup_without_directory_scans()
+    test_policies_follow_accesses()
+    test_budget_spares_the_new_output()
+    test_unknown_policy_is_rejected()
+    print("\n✅ Storage catalog tests passed!")
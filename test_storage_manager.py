@@ -5,6 +5,7 @@ Test the storage manager functionality
 
 import os
 import time
+import tempfile
 from storage_manager import StorageManager
 
 def create_test_files():
@@ -43,11 +44,13 @@ def test_storage_manager():
     print("\n1. Creating test files...")
     create_test_files()
     
-    # Initialize storage manager
+    # Initialize storage manager; a new catalog indexes the existing files
+    catalog_dir = tempfile.mkdtemp()
     storage_manager = StorageManager(
         output_folder='static/outputs',
         max_age_hours=24,
-        max_storage_gb=0.1  # Very small limit for testing
+        max_storage_gb=0.1,  # Very small limit for testing
+        catalog_path=os.path.join(catalog_dir, 'catalog.db')
     )
     
     # Get initial stats
@@ -74,8 +77,9 @@ def test_storage_manager():
     
     # Test smart cleanup
     print("\n5. Testing smart cleanup...")
-    # Create more test files
+    # Create more test files, behind the catalog's back like a manual copy would
     create_test_files()
+    storage_manager.catalog.reconcile('static/outputs')
     
     smart_result = storage_manager.smart_cleanup()
     print(f"   Total deleted: {smart_result['total_deleted']} files")
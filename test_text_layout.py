@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test the font cache and text layout path
+"""
+
+import threading
+from video_generator import VideoGenerator, get_font_metrics
+
+def test_font_cache_reuses_instances():
+    print("🧪 Testing process-wide font cache...")
+    video_gen = VideoGenerator({'UPLOAD_FOLDER': 'static/outputs'})
+    other_gen = VideoGenerator({'UPLOAD_FOLDER': 'static/outputs'})
+    
+    fonts = []
+    def load():
+        fonts.append(video_gen.get_font('roboto', 42))
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert all(font is fonts[0] for font in fonts)
+    assert other_gen.get_font('roboto', 42) is fonts[0]
+    assert video_gen.get_font('roboto', 43) is not fonts[0]
+    print("   ✅ One font instance per (font, size)")
+
+def test_font_metrics_match_getbbox():
+    video_gen = VideoGenerator({'UPLOAD_FOLDER': 'static/outputs'})
+    font = video_gen.get_font('vera', 36)
+    metrics = get_font_metrics(font)
+    
+    assert get_font_metrics(font) is metrics
+    for text in ['Hello', 'Hello world', 'W', '']:
+        bbox = font.getbbox(text)
+        assert metrics.text_width(text) == bbox[2]
+        assert metrics.line_height(text) == bbox[3] - bbox[1]
+
+def linear_font_size(video_gen, text, font_name, max_width, max_height, initial_size):
+    """The previous step-down search, used as the reference"""
+    font_size = initial_size
+    while font_size >= 20:
+        layout = video_gen.layout_text(text, font_name, font_size, max_width)
+        if layout.total_height + 30 <= max_height:
+            return font_size
+        font_size -= 5
+    return 20
+
+def test_binary_search_matches_linear_scan():
+    print("🧪 Testing binary-search font fitting...")
+    video_gen = VideoGenerator({'UPLOAD_FOLDER': 'static/outputs'})
+    
+    for words in [1, 5, 20, 80, 200, 600]:
+        text = ' '.join(['quote'] * words)
+        for max_height, initial in [(200, 120), (590, 60), (60, 60)]:
+            expected = linear_font_size(video_gen, text, 'roboto', 880, max_height, initial)
+            actual = video_gen.get_optimal_font_size(text, 'roboto', 880, max_height, initial)
+            assert actual == expected, (words, max_height, actual, expected)
+    print("   ✅ Same sizes as the step-down search")
+
+def test_layout_is_shared():
+    video_gen = VideoGenerator({'UPLOAD_FOLDER': 'static/outputs'})
+    text = 'First paragraph here.\n\nSecond paragraph here.'
+    
+    layout = video_gen.layout_text(text, 'vera', 40, 880, split_paragraphs=True)
+    assert video_gen.layout_text(text, 'vera', 40, 880, split_paragraphs=True) is layout
+    assert layout.lines == ('First paragraph here.', '', 'Second paragraph here.')
+    assert layout.line_heights[1] == 0
+    
+    # Without paragraph breaks both modes share one cached layout
+    flat = video_gen.layout_text('One line', 'vera', 40, 880)
+    assert video_gen.layout_text('One line', 'vera', 40, 880, split_paragraphs=True) is flat
+
+if __name__ == '__main__':
+    test_font_cache_reuses_instances()
+    test_font_metrics_match_getbbox()
+    test_binary_search_matches_linear_scan()
+    test_layout_is_shared()
+    print("\n✅ Text layout tests passed!")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test the content-addressed TTS audio cache
+"""
+
+import os
+import time
+import tempfile
+from voice_providers import VoiceProvider
+from tts_cache import TTSCache, CachingVoiceProvider
+
+class FakeVoiceProvider(VoiceProvider):
+    """Writes the request into the output file and counts calls"""
+    model = 'fake-1'
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def generate_speech(self, text, voice, output_path, **kwargs):
+        self.calls += 1
+        with open(output_path, 'wb') as f:
+            f.write(f"{voice}:{text}:{kwargs.get('speed')}".encode() * 100)
+        return True
+    
+    def is_available(self):
+        return True
+    
+    def get_voice_list(self):
+        return []
+
+def test_cache_hits_skip_provider():
+    print("🧪 Testing TTS cache hits...")
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = TTSCache(os.path.join(workdir, 'cache'), max_bytes=10 * 1024 * 1024)
+        fake = FakeVoiceProvider()
+        provider = CachingVoiceProvider(fake, cache, 'fake')
+        
+        first = os.path.join(workdir, 'first.mp3')
+        second = os.path.join(workdir, 'second.mp3')
+        assert provider.generate_speech('Hello  world', 'alloy', first, speed=1.0)
+        # Whitespace differences normalize to the same entry
+        assert provider.generate_speech('Hello world ', 'alloy', second, speed=1.0)
+        
+        assert fake.calls == 1
+        with open(first, 'rb') as a, open(second, 'rb') as b:
+            assert a.read() == b.read()
+        
+        # Any change to the voice parameters is a different entry
+        provider.generate_speech('Hello world', 'alloy', second, speed=1.25)
+        provider.generate_speech('Hello world', 'nova', second, speed=1.0)
+        assert fake.calls == 3
+        
+        stats = cache.get_stats()
+        assert stats['hits'] == 1 and stats['misses'] == 3, stats
+        print(f"   ✅ Stats: {stats}")
+
+def test_lru_eviction_respects_budget():
+    with tempfile.TemporaryDirectory() as workdir:
+        cache_dir = os.path.join(workdir, 'cache')
+        cache = TTSCache(cache_dir, max_bytes=3500, rescan_interval=1)
+        source = os.path.join(workdir, 'audio.mp3')
+        with open(source, 'wb') as f:
+            f.write(b'x' * 1000)
+        
+        now = time.time()
+        for i, key in enumerate(['a', 'b', 'c']):
+            cache.store(key, 'mp3', source)
+            os.utime(cache.entry_path(key, 'mp3'), (now - 10 + i, now - 10 + i))
+        
+        # Reading 'a' makes it the most recently used entry
+        assert cache.fetch('a', 'mp3', os.path.join(workdir, 'out.mp3'))
+        cache.store('d', 'mp3', source)
+        
+        remaining = sorted(name.split('.')[0] for name in os.listdir(cache_dir))
+        assert remaining == ['a', 'c', 'd'], remaining
+        assert cache.get_stats()['approx_size_mb'] * 1024 * 1024 <= 3500
+
+if __name__ == '__main__':
+    test_cache_hits_skip_provider()
+    test_lru_eviction_respects_budget()
+    print("\n✅ TTS cache tests passed!")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test voice provider construction and reuse
+"""
+
+import os
+import json
+import base64
+import random
+import tempfile
+from voice_providers import (get_provider_registry, get_voice_provider, GoogleVoiceProvider,
+                             AzureVoiceProvider, StreamingBase64FieldDecoder, MAX_PROVIDER_REGISTRIES)
+
+class FakeStreamedResponse:
+    """Minimal stand-in for a streamed requests.Response"""
+    
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.chunk_sizes = []
+    
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), chunk_size):
+            self.chunk_sizes.append(chunk_size)
+            yield self.body[start:start + chunk_size]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.kwargs = None
+    
+    def post(self, url, **kwargs):
+        self.kwargs = kwargs
+        return self.response
+
+def test_registry_reuses_providers():
+    print("🧪 Testing provider registry...")
+    config = {'ELEVENLABS_API_KEY': 'test-key', 'TTS_HTTP_POOL_SIZE': 4}
+    
+    provider = get_voice_provider('elevenlabs', config)
+    assert get_voice_provider('elevenlabs', dict(config)) is provider
+    assert get_voice_provider('unknown', config) is None
+    
+    # Pooled keep-alive session sized from config
+    adapter = provider.session.get_adapter('https://api.elevenlabs.io')
+    assert adapter._pool_maxsize == 4
+    
+    # A different key builds a separate provider
+    assert get_voice_provider('elevenlabs', {'ELEVENLABS_API_KEY': 'other'}) is not provider
+    
+    # Rotating through keys keeps only the most recent registries
+    for i in range(MAX_PROVIDER_REGISTRIES + 2):
+        get_provider_registry({'ELEVENLABS_API_KEY': f'rotated-{i}'})
+    assert get_voice_provider('elevenlabs', config) is not provider
+    print("   ✅ One provider per configuration")
+
+def test_registry_caches_availability_and_voices():
+    registry = get_provider_registry({'GOOGLE_CLOUD_API_KEY': 'test-key'})
+    assert registry.is_available('google')
+    assert not registry.is_available('azure')
+    assert not registry.is_available('unknown')
+    
+    voices = registry.get_voice_list('google')
+    assert voices and registry.get_voice_list('google') is voices
+    assert registry.get_voice_list('unknown') is None
+
+def test_base64_field_decoder_any_chunking():
+    print("🧪 Testing incremental base64 decoding...")
+    rng = random.Random(7)
+    audio = bytes(rng.randrange(256) for _ in range(5000))
+    body = json.dumps({'audioContent': base64.b64encode(audio).decode(), 'extra': 1}).encode()
+    
+    for chunk_size in [1, 3, 7, 64, 1000, len(body)]:
+        decoder = StreamingBase64FieldDecoder('audioContent')
+        decoded = b''.join(decoder.feed(body[i:i + chunk_size]) for i in range(0, len(body), chunk_size))
+        assert decoder.done and decoded == audio, chunk_size
+    print("   ✅ Identical output for every chunk size")
+
+def test_google_streams_audio_to_disk():
+    audio = os.urandom(300 * 1024)
+    body = json.dumps({'audioContent': base64.b64encode(audio).decode()}).encode()
+    provider = GoogleVoiceProvider({'GOOGLE_CLOUD_API_KEY': 'test-key'})
+    provider.session = FakeSession(FakeStreamedResponse(body))
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        output_path = os.path.join(workdir, 'out.mp3')
+        assert provider.generate_speech('Hello', 'en-US-Standard-A', output_path)
+        with open(output_path, 'rb') as f:
+            assert f.read() == audio
+    assert provider.session.kwargs['stream'] is True
+    
+    # A body without audio leaves no partial file behind
+    provider.session = FakeSession(FakeStreamedResponse(b'{"error": "nope"}'))
+    with tempfile.TemporaryDirectory() as workdir:
+        output_path = os.path.join(workdir, 'out.mp3')
+        assert not provider.generate_speech('Hello', 'en-US-Standard-A', output_path)
+        assert not os.path.exists(output_path)
+
+def test_azure_streams_in_chunks():
+    audio = os.urandom(200 * 1024)
+    response = FakeStreamedResponse(audio)
+    provider = AzureVoiceProvider({'AZURE_SPEECH_KEY': 'test-key'})
+    provider.session = FakeSession(response)
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        output_path = os.path.join(workdir, 'out.mp3')
+        assert provider.generate_speech('Hello', 'en-US-AriaNeural', output_path)
+        with open(output_path, 'rb') as f:
+            assert f.read() == audio
+    assert len(response.chunk_sizes) > 1
+
+if __name__ == '__main__':
+    test_registry_reuses_providers()
+    test_registry_caches_availability_and_voices()
+    test_base64_field_decoder_any_chunking()
+    test_google_streams_audio_to_disk()
+    test_azure_streams_in_chunks()
+    print("\n✅ Voice provider tests passed!")
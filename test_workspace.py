@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test per-job scratch workspaces
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from workspace import WorkspaceManager, JobWorkspace, default_workspace_roots
+
+def test_workspaces_are_isolated_and_removed():
+    print("🧪 Testing workspace isolation and cleanup...")
+    with tempfile.TemporaryDirectory() as root:
+        manager = WorkspaceManager([root])
+        paths = []
+
+        def job(i):
+            workspace = manager.create()
+            try:
+                # Same file name in every job, as create_video's old temp_audio.m4a had
+                with open(workspace.file('audio.m4a'), 'w') as f:
+                    f.write(str(i))
+                with open(workspace.file('audio.m4a')) as f:
+                    assert f.read() == str(i)
+                paths.append(workspace.path)
+            finally:
+                workspace.cleanup()
+
+        threads = [threading.Thread(target=job, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(paths)) == 8
+
+        # A failing job still leaves nothing behind
+        workspace = manager.create()
+        try:
+            open(workspace.file('partial.mp3'), 'w').close()
+            raise RuntimeError('synthesis failed')
+        except RuntimeError:
+            pass
+        finally:
+            workspace.cleanup()
+        assert os.listdir(root) == []
+        assert manager.get_stats()['active'] == 0 and manager.get_stats()['created'] == 9
+        print("   ✅ 8 concurrent jobs kept their own files; all removed")
+
+def test_falls_back_when_tmpfs_is_full():
+    with tempfile.TemporaryDirectory() as shm, tempfile.TemporaryDirectory() as disk:
+        manager = WorkspaceManager([shm, disk], min_free_mb=float('inf'))
+        workspace = manager.create()
+        assert os.path.dirname(workspace.path) == disk
+        workspace.cleanup()
+        assert manager.get_stats()['fallbacks'] == 1
+
+        # A job expected to write more than tmpfs has free goes to disk too
+        roomy = WorkspaceManager([shm, disk], min_free_mb=0)
+        workspace = roomy.create()
+        assert os.path.dirname(workspace.path) == shm
+        workspace.cleanup()
+        workspace = roomy.create(expected_mb=float('inf'))
+        assert os.path.dirname(workspace.path) == disk
+        workspace.cleanup()
+
+def test_default_roots_are_app_directories():
+    # Shared scratch space is never swept directly, only our own directory in it
+    for root in default_workspace_roots():
+        assert os.sep + 'quote-speak' + os.sep in root, root
+    assert default_workspace_roots('/srv/scratch')[0] == '/srv/scratch'
+
+def test_sweeps_workspaces_of_dead_processes():
+    print("🧪 Testing stale workspace sweep...")
+    with tempfile.TemporaryDirectory() as root:
+        child = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                               capture_output=True, text=True, check=True)
+        dead_pid = int(child.stdout)
+        stale = os.path.join(root, f'job-{dead_pid}-abc123')
+        os.makedirs(stale)
+        open(os.path.join(stale, 'voice.mp3'), 'w').close()
+
+        live = JobWorkspace(root)
+        unrelated = os.path.join(root, 'other')
+        os.makedirs(unrelated)
+
+        assert WorkspaceManager([root]).sweep_stale() == 1
+        assert not os.path.exists(stale)
+        assert os.path.isdir(live.path) and os.path.isdir(unrelated)
+        live.cleanup()
+        print("   ✅ Only the dead process's workspace was removed")
+
+if __name__ == '__main__':
+    test_workspaces_are_isolated_and_removed()
+    test_falls_back_when_tmpfs_is_full()
+    test_default_roots_are_app_directories()
+    test_sweeps_workspaces_of_dead_processes()
+    print("\n✅ Workspace tests passed!")
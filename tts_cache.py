@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk cache for synthesized speech
+"""
+
+import json
+import hashlib
+import unicodedata
+from typing import Optional
+from file_cache import FileCache
+from voice_providers import VoiceProvider, AUDIO_EXTENSIONS
+
+def normalize_text(text: str) -> str:
+    """Normalize text so cosmetic differences share one cache entry"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+def normalize_paragraphs(text: str) -> str:
+    """Like normalize_text, but keep the ``\n\n`` breaks the card draws as separate paragraphs"""
+    return '\n\n'.join(normalize_text(paragraph) for paragraph in text.split('\n\n'))
+
+class TTSCache(FileCache):
+    """Audio files keyed by a hash of everything that affects the synthesized speech"""
+
+    @staticmethod
+    def make_key(provider_name: str, voice: str, text: str, audio_format: str,
+                 model: Optional[str] = None, speed: float = 1.0, stability: float = 0.5) -> str:
+        fields = {
+            'provider': provider_name,
+            'voice': voice,
+            'model': model,
+            'format': audio_format,
+            'speed': round(float(speed), 3),
+            'stability': round(float(stability), 3),
+            'text': normalize_text(text)
+        }
+        payload = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def entry_path(self, key: str, audio_format: str) -> str:
+        return super().entry_path(key, AUDIO_EXTENSIONS.get(audio_format, audio_format))
+
+class CachingVoiceProvider(VoiceProvider):
+    """Wrap any VoiceProvider so repeated requests are served from a TTSCache"""
+
+    def __init__(self, provider: VoiceProvider, cache: TTSCache, provider_name: str):
+        self.provider = provider
+        self.cache = cache
+        self.provider_name = provider_name
+        self.model = provider.model
+
+    def generate_speech(self, text: str, voice: str, output_path: str, **kwargs) -> bool:
+        audio_format = kwargs.get('audio_format', 'mp3')
+        key = self.cache.make_key(
+            self.provider_name, voice, text, audio_format,
+            model=self.provider.model,
+            speed=kwargs.get('speed', 1.0),
+            stability=kwargs.get('stability', 0.5)
+        )
+
+        if self.cache.fetch(key, audio_format, output_path):
+            return True
+
+        if not self.provider.generate_speech(text, voice, output_path, **kwargs):
+            return False
+
+        self.cache.store(key, audio_format, output_path)
+        return True
+
+    def supported_formats(self) -> list:
+        return self.provider.supported_formats()
+
+    def is_available(self) -> bool:
+        return self.provider.is_available()
+
+    def get_voice_list(self) -> list:
+        return self.provider.get_voice_list()
@@ -1,13 +1,26 @@
+import io
 import os
 import gc
+import json
+import math
+import time
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
-try:
-    from moviepy.editor import AudioFileClip, ImageClip, CompositeVideoClip
-except ImportError:
-    # Fallback for different moviepy versions
-    from moviepy import AudioFileClip, ImageClip, CompositeVideoClip
-from voice_providers import get_voice_provider
-from memory_monitor import memory_monitor, check_available_memory, get_memory_safe_settings
+from chunked_synthesis import ChunkedVoiceProvider
+from cost_model import CostModel, ResourceScheduler, estimate_workspace_mb
+from encode_workers import EncodeWorkerPool
+from encoder import get_encoder, negotiate_audio_format, MAX_VIDEO_DURATION
+from file_cache import FileCache
+from line_breaker import break_lines
+from tts_cache import TTSCache, CachingVoiceProvider, normalize_text, normalize_paragraphs
+from voice_providers import get_voice_provider, AUDIO_EXTENSIONS
+from workspace import WorkspaceManager, default_workspace_roots
+from output_store import create_output_store
+from memory_monitor import memory_monitor, check_available_memory, get_memory_safe_settings, total_memory_mb
 from typing import NamedTuple, Tuple
 
 class ColorTemplate(NamedTuple):
@@ -25,37 +38,303 @@ COLOR_TEMPLATES = {
     'dark': ColorTemplate('Dark', (28, 28, 28), (64, 64, 64), (255, 255, 255))
 }
 
+class TextLayout(NamedTuple):
+    """Wrapped lines for one (text, font, size, width) with their measured heights.
+
+    Blank entries in ``lines`` are paragraph breaks and have a height of 0.
+    ``total_height`` uses the fitting rule: line heights plus 8px spacing
+    after every non-blank line except the last one.
+    """
+    lines: Tuple[str, ...]
+    line_heights: Tuple[int, ...]
+    total_height: int
+
+class BackgroundCache:
+    """Size-bounded LRU cache of rendered gradient backgrounds.
+
+    Entries are keyed by (template key, width, height bucket). The gradient only
+    varies along the x axis, so a background rendered for the bucket height can
+    be cropped to any height inside that bucket without re-rendering.
+    """
+
+    def __init__(self, max_entries: int = 16, height_bucket: int = 64):
+        self.max_entries = max_entries
+        self.height_bucket = height_bucket
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket_height(self, height: int) -> int:
+        """Round height up to the next bucket boundary"""
+        return -(-height // self.height_bucket) * self.height_bucket
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / max(lookups, 1)
+            }
+
+# Process-wide background cache shared by all generator instances
+background_cache = BackgroundCache()
+
+FONT_FILES = {
+    'msyh': 'MSYH.TTC',
+    'roboto': 'Roboto-Regular.ttf',
+    'vera': 'Vera.ttf',
+    'wqy': 'wqy-zenhei.ttc'
+}
+
+class FontMetrics:
+    """Memoized text measurements for a single font instance.
+
+    Widths match ``font.getbbox(text)[2]`` exactly, so callers get the same
+    layout decisions without repeating the FreeType measurement for strings
+    they have already seen. Per-character advances feed the line breaker.
+    """
+
+    def __init__(self, font, max_entries: int = 8192):
+        self.font = font
+        self.max_entries = max_entries
+        self._bboxes = {}
+        self._advances = {}
+
+    def char_width(self, char):
+        advance = self._advances.get(char)
+        if advance is None:
+            advance = self.font.getlength(char)
+            self._advances[char] = advance
+        return advance
+
+    def bbox(self, text):
+        bbox = self._bboxes.get(text)
+        if bbox is None:
+            if len(self._bboxes) >= self.max_entries:
+                self._bboxes.clear()
+            bbox = self.font.getbbox(text)
+            self._bboxes[text] = bbox
+        return bbox
+
+    def text_width(self, text):
+        return self.bbox(text)[2]
+
+    def line_height(self, text):
+        bbox = self.bbox(text)
+        return bbox[3] - bbox[1]
+
+# Process-wide font cache keyed by (font key, size); shared across threads
+_font_cache = {}
+_font_cache_lock = threading.Lock()
+_font_metrics = weakref.WeakKeyDictionary()
+
+def get_font_metrics(font):
+    """Return the shared FontMetrics table for a font instance"""
+    metrics = _font_metrics.get(font)
+    if metrics is None:
+        with _font_cache_lock:
+            metrics = _font_metrics.get(font)
+            if metrics is None:
+                metrics = FontMetrics(font)
+                _font_metrics[font] = metrics
+    return metrics
+
+# Recently computed layouts, shared by the fitting, sizing and drawing stages
+_layout_cache = OrderedDict()
+_layout_cache_lock = threading.Lock()
+LAYOUT_CACHE_SIZE = 256
+
+def _no_report(stage, state, progress=None):
+    """Default stage reporter for callers that don't track progress"""
+
+# Bump when card rendering changes so cached cards and video tracks stop matching
+CARD_CACHE_VERSION = 2
+
+def _hash_fields(fields):
+    payload = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def frame_to_png(frame):
+    """Compress PPM card bytes as a fast-level PNG"""
+    buffer = io.BytesIO()
+    with Image.open(io.BytesIO(frame)) as image:
+        image.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+def png_to_frame(png):
+    """Decode a cached PNG card back to PPM bytes for the encoder"""
+    buffer = io.BytesIO()
+    with Image.open(io.BytesIO(png)) as image:
+        image.save(buffer, 'PPM')
+    return buffer.getvalue()
+
+def card_cache_key(data):
+    """Key for a rendered card: everything create_text_image draws from"""
+    return _hash_fields({
+        'version': CARD_CACHE_VERSION,
+        'text': normalize_paragraphs(data['text']),
+        'title': normalize_text(data['title']),
+        'color_template': data['color_template'],
+        'title_font': data['title_font'],
+        'body_font': data['body_font']
+    })
+
+def duration_bucket(seconds, bucket_seconds):
+    """Round a duration up so nearby audio lengths share one video track"""
+    return min(math.ceil(seconds / bucket_seconds) * bucket_seconds, MAX_VIDEO_DURATION)
+
+def video_track_key(card_key, encoder_name, fps, settings, duration):
+    """Key for a video-only track of a card at one encode profile and length"""
+    return _hash_fields({
+        'card': card_key,
+        'encoder': encoder_name,
+        'fps': fps,
+        'resolution': list(settings['resolution']),
+        'preset': settings['preset'],
+        'video_bitrate': settings['video_bitrate'],
+        'duration': duration
+    })
+
 class VideoGenerator:
     def __init__(self, config):
         self.config = config
         self.fonts_dir = os.path.join(os.path.dirname(__file__), 'static', 'fonts')
+        # Hand the card to ffmpeg over a pipe instead of through a PNG file
+        self.diskless = config.get('DISKLESS_PIPELINE', False)
+        # Each job's intermediates live in its own scratch directory, on tmpfs when it has room
+        self.workspaces = WorkspaceManager(
+            default_workspace_roots(config.get('PIPELINE_SCRATCH_DIR')),
+            min_free_mb=config.get('WORKSPACE_MIN_FREE_MB', 32)
+        )
+        # Finished videos are stored by content hash in prefix shards under UPLOAD_FOLDER,
+        # or in the bucket of OUTPUT_STORAGE_BACKEND=s3, which the app serves from /outputs
+        # (encode workers only write to paths they are given, and have none)
+        self.output_store = create_output_store(config) if config.get('UPLOAD_FOLDER') else None
+        # Probe ffmpeg once at startup and pick the encoder backend
+        self.encoder = get_encoder(fps=config.get('STILL_IMAGE_FPS', 1))
+        
+        # Card rendering runs here while the calling thread waits on TTS
+        self.render_executor = ThreadPoolExecutor(
+            max_workers=config.get('RENDER_WORKERS', 2), thread_name_prefix='render'
+        )
+        
+        tts_cache_mb = config.get('TTS_CACHE_MAX_MB', 0)
+        self.tts_cache = TTSCache(config['TTS_CACHE_DIR'], tts_cache_mb * 1024 * 1024) if tts_cache_mb > 0 else None
+        
+        # Budgets are fixed at startup; instantaneous free memory swings with other jobs.
+        # Each web worker has its own scheduler, so they split half the container's memory
+        memory_budget_mb = config.get('ENCODE_MEMORY_BUDGET_MB', 0) or (
+            total_memory_mb() / 2 / max(config.get('WEB_WORKERS', 1), 1)
+        )
+        cpu_budget_seconds = (os.cpu_count() or 1) * config.get('ENCODE_CPU_HORIZON_SECONDS', 10)
+        self.scheduler = ResourceScheduler(CostModel(), memory_budget_mb, cpu_budget_seconds)
+        
+        # Rendered cards are looked up here, before any render work is dispatched
+        card_cache_mb = config.get('CARD_CACHE_MAX_MB', 0)
+        self.card_cache = FileCache(config['CARD_CACHE_DIR'], card_cache_mb * 1024 * 1024) if card_cache_mb > 0 else None
+        
+        # Rendering and encoding run in spawned worker processes when configured
+        encode_workers = config.get('ENCODE_WORKERS', 0)
+        track_cache_mb = config.get('VIDEO_TRACK_CACHE_MAX_MB', 0)
+        self.track_bucket_seconds = config.get('TRACK_DURATION_BUCKET_SECONDS', 10)
+        self.track_cache = None
+        self.worker_pool = None
+        if encode_workers <= 0 and track_cache_mb > 0:
+            self.track_cache = FileCache(config['VIDEO_TRACK_CACHE_DIR'], track_cache_mb * 1024 * 1024)
+        if encode_workers > 0:
+            # Workers share the video track cache directory; it is safe across processes
+            worker_config = {
+                'STILL_IMAGE_FPS': config.get('STILL_IMAGE_FPS', 1),
+                'RENDER_WORKERS': 1,
+                'TTS_CACHE_MAX_MB': 0,
+                'VIDEO_TRACK_CACHE_DIR': config.get('VIDEO_TRACK_CACHE_DIR'),
+                'VIDEO_TRACK_CACHE_MAX_MB': track_cache_mb,
+                'TRACK_DURATION_BUCKET_SECONDS': self.track_bucket_seconds
+            }
+            self.worker_pool = EncodeWorkerPool(
+                encode_workers, worker_config,
+                max_jobs=config.get('ENCODE_WORKER_MAX_JOBS', 50),
+                max_rss_mb=config.get('ENCODE_WORKER_MAX_RSS_MB', 400),
+                task_timeout=config.get('ENCODE_WORKER_TIMEOUT', 300)
+            )
     
-    def create_gradient_background(self, width, height, color_template):
-        background = Image.new('RGB', (width, height))
-        draw = ImageDraw.Draw(background)
-        
+    def render_gradient(self, width, height, color_template):
+        """Render a horizontal gradient from a single precomputed row.
+
+        The row is computed once (one color per column, same rounding as the
+        per-pixel version) and stretched vertically by Pillow in C.
+        """
         start_color = color_template.gradient_start
         end_color = color_template.gradient_end
         
+        row = bytearray(width * 3)
         for x in range(width):
             progress = x / width
-            r = int(start_color[0] + (end_color[0] - start_color[0]) * progress)
-            g = int(start_color[1] + (end_color[1] - start_color[1]) * progress)
-            b = int(start_color[2] + (end_color[2] - start_color[2]) * progress)
-            for y in range(height):
-                draw.point((x, y), (r, g, b))
+            row[3 * x] = int(start_color[0] + (end_color[0] - start_color[0]) * progress)
+            row[3 * x + 1] = int(start_color[1] + (end_color[1] - start_color[1]) * progress)
+            row[3 * x + 2] = int(start_color[2] + (end_color[2] - start_color[2]) * progress)
         
-        return background
+        strip = Image.frombytes('RGB', (width, 1), bytes(row))
+        return strip.resize((width, height), Image.NEAREST)
+    
+    def create_gradient_background(self, width, height, color_template, template_key=None):
+        """Return a gradient background, served from the background cache when possible"""
+        if template_key is None:
+            return self.render_gradient(width, height, color_template)
+        
+        bucket_height = background_cache.bucket_height(height)
+        key = (template_key, width, bucket_height)
+        background = background_cache.get(key)
+        if background is None:
+            background = self.render_gradient(width, bucket_height, color_template)
+            background_cache.put(key, background)
+        
+        # Callers draw onto the result, so always hand out a fresh image
+        return background.crop((0, 0, width, height))
     
     def get_font(self, font_name, size):
-        font_paths = {
-            'msyh': os.path.join(self.fonts_dir, 'MSYH.TTC'),
-            'roboto': os.path.join(self.fonts_dir, 'Roboto-Regular.ttf'),
-            'vera': os.path.join(self.fonts_dir, 'Vera.ttf'),
-            'wqy': os.path.join(self.fonts_dir, 'wqy-zenhei.ttc')
-        }
-        
-        font_path = font_paths.get(font_name)
+        key = (font_name, size)
+        font = _font_cache.get(key)
+        if font is not None:
+            return font
+        
+        with _font_cache_lock:
+            font = _font_cache.get(key)
+            if font is None:
+                font = self._load_font(font_name, size)
+                _font_cache[key] = font
+        return font
+    
+    def _load_font(self, font_name, size):
+        font_file = FONT_FILES.get(font_name)
+        font_path = os.path.join(self.fonts_dir, font_file) if font_file else None
         if font_path and os.path.exists(font_path):
             try:
                 return ImageFont.truetype(font_path, size)
@@ -66,85 +345,117 @@ class VideoGenerator:
         return ImageFont.load_default()
     
     def wrap_text(self, text, font, max_width):
-        """Wrap text to fit within max_width with improved handling"""
-        if not text.strip():
-            return ['']
-        
-        words = text.split()
-        lines = []
-        current_line = []
-        
-        for word in words:
-            # Test if adding this word would exceed max width
-            test_line = current_line + [word]
-            test_text = ' '.join(test_line)
-            test_width = font.getbbox(test_text)[2]
-            
-            if test_width <= max_width:
-                current_line.append(word)
+        """Wrap text to fit within max_width, breaking CJK text between characters"""
+        metrics = get_font_metrics(font)
+        return break_lines(text, metrics.char_width, max_width, metrics.text_width)
+    
+    def layout_text(self, text, font_name, size, max_width, split_paragraphs=False):
+        """Wrap and measure text once per (text, font, size, width).
+
+        With ``split_paragraphs`` the text is wrapped per ``\n\n`` paragraph
+        and blank lines are inserted between paragraphs. Text without
+        paragraph breaks wraps identically either way and shares one entry.
+        """
+        split_paragraphs = split_paragraphs and '\n\n' in text
+        key = (text, font_name, size, max_width, split_paragraphs)
+        with _layout_cache_lock:
+            layout = _layout_cache.get(key)
+            if layout is not None:
+                _layout_cache.move_to_end(key)
+                return layout
+        
+        font = self.get_font(font_name, size)
+        metrics = get_font_metrics(font)
+        
+        if split_paragraphs:
+            lines = []
+            paragraphs = text.split('\n\n')
+            for i, paragraph in enumerate(paragraphs):
+                if paragraph.strip():
+                    lines.extend(self.wrap_text(paragraph, font, max_width))
+                    # Add paragraph spacing (except for last paragraph)
+                    if i < len(paragraphs) - 1:
+                        lines.append('')
+        else:
+            lines = self.wrap_text(text, font, max_width)
+        
+        line_heights = []
+        total_height = 0
+        for i, line in enumerate(lines):
+            if line.strip():
+                line_height = metrics.line_height(line)
+                total_height += line_height
+                # Add line spacing (except for last line)
+                if i < len(lines) - 1:
+                    total_height += 8
             else:
-                # If current line has words, save it and start new line
-                if current_line:
-                    lines.append(' '.join(current_line))
-                    current_line = [word]
-                else:
-                    # Single word is too long, break it down
-                    if font.getbbox(word)[2] > max_width:
-                        # Break long word into smaller parts
-                        chars = list(word)
-                        current_chars = []
-                        for char in chars:
-                            test_chars = current_chars + [char]
-                            test_text = ''.join(test_chars)
-                            if font.getbbox(test_text)[2] <= max_width:
-                                current_chars.append(char)
-                            else:
-                                if current_chars:
-                                    lines.append(''.join(current_chars))
-                                current_chars = [char]
-                        if current_chars:
-                            current_line = [''.join(current_chars)]
-                    else:
-                        current_line = [word]
-        
-        if current_line:
-            lines.append(' '.join(current_line))
-        
-        return lines if lines else ['']
+                line_height = 0
+            line_heights.append(line_height)
+        
+        layout = TextLayout(tuple(lines), tuple(line_heights), total_height)
+        with _layout_cache_lock:
+            _layout_cache[key] = layout
+            while len(_layout_cache) > LAYOUT_CACHE_SIZE:
+                _layout_cache.popitem(last=False)
+        return layout
     
     def get_optimal_font_size(self, text, font_name, max_width, max_height, initial_size=60):
-        """Find optimal font size that fits within constraints with bottom buffer"""
-        font_size = initial_size
+        """Find optimal font size that fits within constraints with bottom buffer.
+
+        Candidate sizes are the same 5pt steps down from ``initial_size`` as
+        before, but they are binary searched for the largest size that fits.
+        """
         min_size = 20
         bottom_buffer = 30  # Extra space at bottom to prevent touching border
+        candidates = list(range(initial_size, min_size - 1, -5))
         
-        while font_size >= min_size:
-            font = self.get_font(font_name, font_size)
-            lines = self.wrap_text(text, font, max_width)
-            
-            # Calculate total height with proper line spacing
-            total_height = 0
-            for i, line in enumerate(lines):
-                if line.strip():
-                    line_bbox = font.getbbox(line)
-                    line_height = line_bbox[3] - line_bbox[1]
-                    total_height += line_height
-                    # Add line spacing (except for last line)
-                    if i < len(lines) - 1:
-                        total_height += 8
-            
+        def fits(font_size):
+            layout = self.layout_text(text, font_name, font_size, max_width)
             # Add bottom buffer to ensure space from border
-            total_height += bottom_buffer
-            
-            if total_height <= max_height:
-                return font_size
-            
-            font_size -= 5
+            return layout.total_height + bottom_buffer <= max_height
+        
+        # Candidates run largest to smallest; find the first one that fits
+        lo, hi = 0, len(candidates)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if fits(candidates[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
         
-        return min_size
+        return candidates[lo] if lo < len(candidates) else min_size
 
-    def create_text_image(self, text, title, output_path, color_template_key, title_font_key, body_font_key):
-        color_template = COLOR_TEMPLATES.get(color_template_key, COLOR_TEMPLATES['purple_blue'])
+    def create_text_image(self, text, title, output_path, color_template_key, title_font_key, body_font_key,
+                          report=_no_report):
+        """Render the card and save it as a PNG at output_path"""
+        image = self.render_card(text, title, color_template_key, title_font_key, body_font_key, report)
+        # Fast zlib level: the PNG is an intermediate, and optimize=True costs more than the encode
+        image.save(output_path, 'PNG', compress_level=1)
+        
+        # Clear image from memory immediately
+        del image
+        gc.collect()
+        
+        report('render', 'done')
+        return output_path
+    
+    def create_card_frame(self, text, title, color_template_key, title_font_key, body_font_key,
+                          report=_no_report):
+        """Render the card as PPM bytes (raw RGB behind a short header) for the encoder's stdin"""
+        image = self.render_card(text, title, color_template_key, title_font_key, body_font_key, report)
+        buffer = io.BytesIO()
+        image.save(buffer, 'PPM')
+        del image
+        
+        report('render', 'done')
+        return buffer.getvalue()
+    
+    def render_card(self, text, title, color_template_key, title_font_key, body_font_key, report=_no_report):
+        """Lay out and draw the card; reports 'layout' and starts 'render'"""
+        report('layout', 'running')
+        if color_template_key not in COLOR_TEMPLATES:
+            color_template_key = 'purple_blue'
+        color_template = COLOR_TEMPLATES[color_template_key]
         
         # Image dimensions
         card_width = 1080
@@ -168,36 +479,28 @@ class VideoGenerator:
         title_font = self.get_font(title_font_key, title_size)
         body_font = self.get_font(body_font_key, body_size)
         
+        # Layouts come from the cache filled while fitting the font sizes
+        title_layout = self.layout_text(title, title_font_key, title_size, max_text_width)
+        body_layout = self.layout_text(text, body_font_key, body_size, max_text_width, split_paragraphs=True)
+        report('layout', 'done')
+        report('render', 'running')
+        
         # Calculate content layout
         content_height = card_padding
         
         # Title height calculation
-        title_lines = self.wrap_text(title, title_font, max_text_width)
         title_height = 0
-        for line in title_lines:
+        for line, line_height in zip(title_layout.lines, title_layout.line_heights):
             if line.strip():
-                line_bbox = title_font.getbbox(line)
-                title_height += line_bbox[3] - line_bbox[1] + 5
+                title_height += line_height + 5
         
         content_height += title_height + 40  # Space after title
         
         # Body text height calculation
-        text_lines = []
-        paragraphs = text.split('\n\n') if '\n\n' in text else [text]
-        
-        for i, paragraph in enumerate(paragraphs):
-            if paragraph.strip():
-                para_lines = self.wrap_text(paragraph, body_font, max_text_width)
-                text_lines.extend(para_lines)
-                # Add paragraph spacing (except for last paragraph)
-                if i < len(paragraphs) - 1:
-                    text_lines.append('')
-        
         body_height = 0
-        for line in text_lines:
+        for line, line_height in zip(body_layout.lines, body_layout.line_heights):
             if line.strip():
-                line_bbox = body_font.getbbox(line)
-                body_height += line_bbox[3] - line_bbox[1] + 8
+                body_height += line_height + 8
             else:
                 body_height += 25  # Paragraph spacing
         
@@ -208,7 +511,7 @@ class VideoGenerator:
         image_width = card_width + (2 * card_margin)
         image_height = card_height + (2 * card_margin)
         
-        image = self.create_gradient_background(image_width, image_height, color_template)
+        image = self.create_gradient_background(image_width, image_height, color_template, color_template_key)
         
         # Create card with transparency
         card = Image.new('RGBA', (card_width, card_height), (255, 255, 255, 240))
@@ -222,22 +525,19 @@ class VideoGenerator:
         title_x = card_margin + card_padding
         title_y = card_margin + card_padding
         
-        for i, line in enumerate(title_lines):
+        title_lines = title_layout.lines
+        for i, (line, line_height) in enumerate(zip(title_lines, title_layout.line_heights)):
             if line.strip():
                 draw.text((title_x, title_y), line, font=title_font, fill=text_color)
-                line_bbox = title_font.getbbox(line)
-                line_height = line_bbox[3] - line_bbox[1]
                 title_y += line_height + (8 if i < len(title_lines) - 1 else 0)
         
         # Draw body text with proper spacing from title
         text_x = card_margin + card_padding
         text_y = card_margin + card_padding + title_height + 60  # Consistent gap
         
-        for i, line in enumerate(text_lines):
+        for line, line_height in zip(body_layout.lines, body_layout.line_heights):
             if line.strip():  # Regular text line
                 draw.text((text_x, text_y), line, font=body_font, fill=text_color)
-                line_bbox = body_font.getbbox(line)
-                line_height = line_bbox[3] - line_bbox[1]
                 text_y += line_height + 8  # Consistent line spacing
             else:  # Empty line (paragraph break)
                 text_y += 25  # Paragraph spacing
@@ -248,248 +548,252 @@ class VideoGenerator:
         if bottom_space < 30:
             print(f"Warning: Only {bottom_space}px bottom space remaining")
         
-        # Save with memory optimization
-        image.save(output_path, 'PNG', quality=85, optimize=True)
-        
-        # Clear image from memory immediately
-        del image
-        gc.collect()
-        
-        return output_path
+        return image
     
     @memory_monitor.memory_limit_decorator
-    def create_video(self, image_path, audio_path, output_path):
-        """Create video with optimized memory management"""
+    def create_video(self, image, audio_path, output_path, audio_format=None, report=None,
+                     settings=None, usage=None, card_key=None):
+        """Encode the still card and audio into an MP4 with ffmpeg.
+
+        ``image`` is a card PNG path or the PPM bytes from create_card_frame.
+
+        When ``audio_format`` is one the MP4 muxer can take as-is, the audio
+        track is stream-copied instead of re-encoded. ``report`` and ``usage``
+        are passed through to ``StillImageEncoder.encode``. Without
+        ``settings`` a profile is picked from currently available memory.
+        With a ``card_key`` and a video track cache, the card's video track is
+        encoded once and later requests only mux it with their audio.
+        """
+        if self.encoder is None:
+            print("Video creation error: no ffmpeg encoder available")
+            return False
         
-        # Check available memory before starting
-        if not check_available_memory(300):  # Need at least 300MB
-            print("Warning: Low memory detected, using optimized settings")
+        if settings is None:
+            # Check available memory before starting
+            if not check_available_memory(300):  # Need at least 300MB
+                print("Warning: Low memory detected, using optimized settings")
+            
+            # Get memory-safe settings
+            memory_usage = memory_monitor.get_memory_usage()
+            settings = get_memory_safe_settings(memory_usage['available_mb'])
         
-        # Get memory-safe settings
-        memory_usage = memory_monitor.get_memory_usage()
-        settings = get_memory_safe_settings(memory_usage['available_mb'])
-        audio = None
-        image = None
-        final_video = None
+        if self.track_cache and card_key:
+            return self._encode_with_track_cache(image, audio_path, output_path, audio_format,
+                                                 report, settings, usage, card_key)
+        return self.encoder.encode(image, audio_path, output_path, settings, audio_format, report, usage)
+    
+    def _encode_with_track_cache(self, image, audio_path, output_path, audio_format,
+                                 report, settings, usage, card_key):
+        duration = self.encoder.audio_duration(audio_path)
+        if not duration:
+            return False
         
+        # Tracks are encoded to the end of a duration bucket and cut to length when muxing
+        track_seconds = duration_bucket(duration, self.track_bucket_seconds)
+        key = video_track_key(card_key, self.encoder.name, self.encoder.fps, settings, track_seconds)
+        # The track is an intermediate too; keep it beside the job's audio
+        track_name = f"{os.path.splitext(os.path.basename(output_path))[0]}.track.mp4"
+        track_path = os.path.join(os.path.dirname(audio_path), track_name)
         try:
-            # Load audio first to get duration
-            audio = AudioFileClip(audio_path)
-            audio_duration = audio.duration
-            
-            # Limit audio duration to prevent memory issues
-            max_duration = 300  # 5 minutes max
-            if audio_duration > max_duration:
-                audio = audio.subclipped(0, max_duration)
-                audio_duration = max_duration
-            
-            # Create image clip with duration and memory-safe resolution
-            image = ImageClip(image_path, duration=audio_duration)
-            
-            # Apply memory-safe resolution
-            target_height = settings['resolution'][1]
-            if target_height < 1080:  # Only resize if we need to reduce resolution
-                image = image.resize(height=target_height)
-            
-            # Reduce image quality to save memory
-            image = image.with_fps(settings['fps'])
-            
-            # Create video with memory-optimized settings
-            final_video = CompositeVideoClip([image])
-            final_video = final_video.with_audio(audio)
-            
-            # Write video with memory-efficient settings
-            final_video.write_videofile(
-                output_path,
-                fps=settings['fps'],
-                codec="libx264",
-                audio_codec="aac",
-                bitrate=settings['video_bitrate'],
-                audio_bitrate=settings['audio_bitrate'],
-                temp_audiofile="temp_audio.m4a",
-                remove_temp=True,
-                threads=settings['threads'],
-                preset=settings['preset'],
-                ffmpeg_params=["-movflags", "+faststart"]
-            )
-            
-            return True
-            
-        except MemoryError as e:
-            print(f"Memory error during video creation: {e}")
-            # Try with ultra-low memory settings
-            return self._create_video_low_memory(image_path, audio_path, output_path)
-        except Exception as e:
-            print(f"Video creation error: {e}")
-            # Try with fallback method
-            return self._create_video_fallback(image_path, audio_path, output_path)
+            if self.track_cache.fetch(key, 'mp4', track_path):
+                if report is not None:
+                    report('encode', 'done', 1.0)
+            else:
+                if not self.encoder.encode_video_track(image, track_path, settings, track_seconds,
+                                                       report, usage):
+                    return False
+                self.track_cache.store(key, 'mp4', track_path)
+            return self.encoder.mux(track_path, audio_path, output_path, settings, duration, audio_format, report)
         finally:
-            # Explicit cleanup in reverse order
-            if final_video:
-                try:
-                    final_video.close()
-                    del final_video
-                except:
-                    pass
-            
-            if image:
-                try:
-                    image.close()
-                    del image
-                except:
-                    pass
-            
-            if audio:
-                try:
-                    audio.close()
-                    del audio
-                except:
-                    pass
-            
-            # Force garbage collection
-            gc.collect()
-            
-            # Clean up any temporary files
-            temp_files = ["temp_audio.m4a", "temp_audio.wav"]
-            for temp_file in temp_files:
-                try:
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                except:
-                    pass
+            if os.path.exists(track_path):
+                os.remove(track_path)
     
-    def _create_video_low_memory(self, image_path, audio_path, output_path):
-        """Ultra-low memory fallback method"""
-        print("Attempting low-memory video creation...")
-        
+    def _render_card(self, text, title, image_path, color_template_key, title_font_key, body_font_key,
+                     report, card_key):
+        """Render the card, in a worker process if there is a pool.
+
+        With an ``image_path`` the card is a PNG file there; with None it is
+        kept in memory as PPM bytes. Returns (card, CPU seconds used), where
+        the CPU seconds are None when the card came from the cache. Cached
+        cards are PNGs either way: a raw frame is ~40x larger.
+        """
+        if self.card_cache:
+            if image_path:
+                card = image_path if self.card_cache.fetch(card_key, 'png', image_path) else None
+            else:
+                png = self.card_cache.read(card_key, 'png')
+                card = png_to_frame(png) if png is not None else None
+            if card is not None:
+                report('layout', 'done')
+                report('render', 'done')
+                return card, None
+        
+        # Only an actual render holds budget, and only while it draws
+        reservation = self.scheduler.reserve_render(text, timeout=self.config.get('RESOURCE_WAIT_SECONDS', 60))
+        if reservation is None:
+            raise RuntimeError('Server is busy. Please try again later.')
+        style = (color_template_key, title_font_key, body_font_key)
         try:
-            # Use ffmpeg directly for minimal memory usage
-            import subprocess
-            
-            cmd = [
-                'ffmpeg', '-y',
-                '-loop', '1', '-i', image_path,
-                '-i', audio_path,
-                '-c:v', 'libx264', '-preset', 'ultrafast',
-                '-crf', '28',  # Higher compression
-                '-c:a', 'aac', '-b:a', '64k',
-                '-shortest', '-pix_fmt', 'yuv420p',
-                '-vf', 'scale=854:480',  # Force 480p
-                output_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if result.returncode == 0 and os.path.exists(output_path):
-                print("Low-memory video creation successful")
-                return True
+            if self.worker_pool:
+                if image_path:
+                    result = self.worker_pool.run('render', (text, title, image_path) + style, report)
+                else:
+                    result = self.worker_pool.run('frame', (text, title) + style, report)
+                card, cpu_seconds = result['value'], result['cpu_seconds']
             else:
-                print(f"FFmpeg error: {result.stderr}")
-                return False
-                
-        except Exception as e:
-            print(f"Low-memory fallback failed: {e}")
-            return False
-    
-    def _create_video_fallback(self, image_path, audio_path, output_path):
-        """Simple fallback method using basic MoviePy"""
-        print("Attempting fallback video creation...")
-        
-        audio = None
-        image = None
-        video = None
+                cpu_start = time.thread_time()
+                if image_path:
+                    card = self.create_text_image(text, title, image_path, *style, report)
+                else:
+                    card = self.create_card_frame(text, title, *style, report)
+                cpu_seconds = time.thread_time() - cpu_start
+        finally:
+            self.scheduler.release(reservation)
         
-        try:
-            # Load with minimal settings
-            audio = AudioFileClip(audio_path)
-            
-            # Limit duration
-            if audio.duration > 60:  # Max 1 minute for fallback
-                audio = audio.subclipped(0, 60)
-            
-            # Create simple image clip
-            image = ImageClip(image_path, duration=audio.duration)
-            image = image.resize(height=480)  # Force low resolution
-            
-            # Create video
-            video = image.with_audio(audio)
-            
-            # Write with minimal settings
-            video.write_videofile(
-                output_path,
-                fps=20,
-                codec="libx264",
-                audio_codec="aac",
-                bitrate="300k",
-                audio_bitrate="64k",
-                preset="ultrafast",
-                threads=1
+        if self.card_cache:
+            if image_path:
+                self.card_cache.store(card_key, 'png', image_path)
+            else:
+                self.card_cache.store_bytes(card_key, 'png', frame_to_png(card))
+        return card, cpu_seconds
+    
+    def _encode(self, image, audio_path, video_path, audio_format, report, settings, usage, card_key):
+        """Encode in a worker process if there is a pool, filling usage like create_video"""
+        if self.worker_pool:
+            result = self.worker_pool.run(
+                'encode', (image, audio_path, video_path, audio_format, settings, card_key), report
             )
-            
-            return True
-            
-        except Exception as e:
-            print(f"Fallback method failed: {e}")
-            return False
+            usage.update(result['usage'])
+            return result['value']
+        return self.create_video(image, audio_path, video_path, audio_format, report, settings, usage, card_key)
+    
+    def _timed_stage(self, timings, stage, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
         finally:
-            # Cleanup
-            for obj in [video, image, audio]:
-                if obj:
-                    try:
-                        obj.close()
-                        del obj
-                    except:
-                        pass
-            gc.collect()
+            timings[stage] = time.perf_counter() - start
     
     @memory_monitor.memory_limit_decorator
-    def generate_video(self, data, base_filename):
+    def generate_video(self, data, base_filename, report=None):
+        """Render the card and synthesize speech concurrently, then encode.
+
+        The result includes per-stage ``timings`` in seconds, so end-to-end
+        latency is max(render, tts) + encode rather than their sum.
+        ``report(stage, state, progress=None)`` is called as the layout,
+        render, tts, encode and mux stages start and finish.
+        """
+        report = report or _no_report
+        timings = {}
+        reservation = None
+        workspace = None
+        render_future = None
+        staging_path = None
+        upload = None
+        start = time.perf_counter()
         try:
-            # Check memory before starting
-            if not check_available_memory(400):
-                return {'success': False, 'error': 'Insufficient memory for video generation. Please try again later.'}
-            # File paths
-            image_path = os.path.join(self.config['UPLOAD_FOLDER'], f"{base_filename}.png")
-            audio_path = os.path.join(self.config['UPLOAD_FOLDER'], f"{base_filename}.mp3")
-            video_path = os.path.join(self.config['UPLOAD_FOLDER'], f"{base_filename}.mp4")
-            
-            # Generate image
-            self.create_text_image(
-                data['text'], data['title'], image_path,
-                data['color_template'], data['title_font'], data['body_font']
-            )
-            
-            # Generate audio
             provider = get_voice_provider(data['voice_provider'], self.config)
             if not provider or not provider.is_available():
                 return {'success': False, 'error': f'Voice provider {data["voice_provider"]} not available'}
             
+            provider = ChunkedVoiceProvider(
+                provider,
+                chunk_chars=self.config.get('TTS_CHUNK_CHARS', 400),
+                max_workers=self.config.get('TTS_MAX_PARALLEL', 4)
+            )
+            if self.tts_cache:
+                provider = CachingVoiceProvider(provider, self.tts_cache, data['voice_provider'])
+            
+            # Ask the provider for audio the MP4 muxer can stream-copy
+            audio_format = negotiate_audio_format(provider.supported_formats())
+            
+            # Intermediates go in this job's workspace; diskless mode keeps the card in memory
+            workspace = self.workspaces.create(
+                estimate_workspace_mb(data['text'], data['voice_speed'], card_file=not self.diskless)
+            )
+            image_path = None if self.diskless else workspace.file(f"{base_filename}.png")
+            audio_path = workspace.file(f"{base_filename}.{AUDIO_EXTENSIONS[audio_format]}")
+            card_key = card_cache_key(data)
+            
+            # Generate image in the background
+            render_future = self.render_executor.submit(
+                self._timed_stage, timings, 'render', self._render_card,
+                data['text'], data['title'], image_path,
+                data['color_template'], data['title_font'], data['body_font'], report, card_key
+            )
+            
+            # Generate audio meanwhile
             voice_params = {
                 'speed': data['voice_speed'],
-                'stability': data['voice_stability']
+                'stability': data['voice_stability'],
+                'audio_format': audio_format
             }
             
+            report('tts', 'running')
+            tts_start = time.perf_counter()
             audio_success = provider.generate_speech(
                 data['text'], data['voice'], audio_path, **voice_params
             )
+            timings['tts'] = time.perf_counter() - tts_start
+            report('tts', 'done' if audio_success else 'failed')
+            
+            # The encoder needs both stages; this re-raises any render error
+            card, render_cpu_seconds = render_future.result()
             
             if not audio_success:
-                return {'success': False, 'error': 'Failed to generate audio'}
+                return {'success': False, 'error': 'Failed to generate audio', 'timings': timings}
             
-            # Create video
-            video_success = self.create_video(image_path, audio_path, video_path)
+            # Hold the encode's predicted peak memory and CPU only from here on:
+            # speech synthesis waits on the network, not on this host, and the
+            # render held its own reservation while it ran
+            reservation = self.scheduler.reserve(
+                data['text'], data['voice_speed'], timeout=self.config.get('RESOURCE_WAIT_SECONDS', 60)
+            )
+            if reservation is None:
+                return {'success': False, 'error': 'Server is busy. Please try again later.', 'timings': timings}
+            
+            # Create video: a streaming backend uploads it as ffmpeg writes it into a pipe;
+            # otherwise it is encoded into staging. Either way it is stored under its content hash
+            if self.output_store.backend.streams:
+                upload = self.output_store.start_upload(workspace.file(f"{base_filename}.mp4"))
+                output_path = upload.path
+            else:
+                staging_path = self.output_store.staging_path(f"{base_filename}.mp4")
+                output_path = staging_path
+            encode_usage = {}
+            video_success = self._timed_stage(
+                timings, 'encode', self._encode,
+                card, audio_path, output_path, audio_format, report,
+                reservation.settings, encode_usage, card_key
+            )
             
             if video_success:
-                # Cleanup intermediate files
-                try:
-                    os.remove(image_path)
-                    os.remove(audio_path)
-                except:
-                    pass
-                
-                return {'success': True, 'video_path': video_path}
+                if upload is not None:
+                    video_path, new_output = upload.finish()
+                else:
+                    video_path, new_output = self.output_store.publish(staging_path)
+                timings['total'] = time.perf_counter() - start
+                self.scheduler.observe(reservation, encode_usage, render_cpu_seconds)
+                return {'success': True, 'video_path': video_path, 'new_output': new_output, 'timings': timings}
             else:
-                return {'success': False, 'error': 'Failed to create video'}
+                timings['total'] = time.perf_counter() - start
+                return {'success': False, 'error': 'Failed to create video', 'timings': timings}
                 
         except Exception as e:
-            return {'success': False, 'error': str(e)}
\ No newline at end of file
+            return {'success': False, 'error': str(e), 'timings': timings}
+        finally:
+            if reservation is not None:
+                self.scheduler.release(reservation)
+            # Intermediates go whether the job succeeded, failed or was interrupted,
+            # but not from under a render that is still writing into the workspace
+            if render_future is not None:
+                render_future.exception()
+            if upload is not None:
+                try:
+                    upload.abort()
+                except Exception as e:
+                    print(f"Output upload abort error: {e}")
+            if workspace is not None:
+                workspace.cleanup()
+            if staging_path and os.path.exists(staging_path):
+                os.remove(staging_path)
\ No newline at end of file
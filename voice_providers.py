@@ -1,14 +1,123 @@
 import os
 import requests
 import base64
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
 from openai import OpenAI
 
+# File extension for each generic audio format name
+AUDIO_EXTENSIONS = {
+    'aac': 'aac',
+    'mp3': 'mp3',
+    'opus': 'ogg',
+    'flac': 'flac',
+    'wav': 'wav'
+}
+
+def build_http_session(pool_size: int = 10) -> requests.Session:
+    """Create a keep-alive session with a connection pool of pool_size per host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Bytes read from the network and written to disk at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def remove_partial_file(path: str):
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
+
+def stream_response_to_file(response, output_path: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Write a streamed requests response to disk chunk by chunk"""
+    try:
+        with open(output_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+    except Exception:
+        remove_partial_file(output_path)
+        raise
+
+class StreamingBase64FieldDecoder:
+    """Incrementally extract and base64-decode one string field of a JSON body.
+
+    Only the undecoded tail (fewer than 4 base64 characters) and a few bytes
+    of look-behind for the field name are held between chunks, so memory is
+    bounded by the chunk size rather than the response size.
+    """
+    
+    def __init__(self, field: str):
+        self.marker = f'"{field}"'.encode('ascii')
+        self.done = False
+        self._state = 'search'
+        self._carry = b''
+        self._pending = b''
+    
+    def feed(self, chunk: bytes) -> bytes:
+        if self.done:
+            return b''
+        data = self._carry + chunk
+        self._carry = b''
+        
+        if self._state == 'search':
+            index = data.find(self.marker)
+            if index < 0:
+                # Keep enough bytes to match a marker split across chunks
+                self._carry = data[-(len(self.marker) - 1):]
+                return b''
+            data = data[index + len(self.marker):]
+            self._state = 'open'
+        
+        if self._state == 'open':
+            # Skip the colon and whitespace up to the opening quote
+            index = data.find(b'"')
+            if index < 0:
+                return b''
+            data = data[index + 1:]
+            self._state = 'value'
+        
+        end = data.find(b'"')
+        if end >= 0:
+            data = data[:end]
+            self.done = True
+        
+        # Base64 never contains a backslash; drop JSON escapes such as \/
+        encoded = self._pending + data.replace(b'\\', b'')
+        usable = len(encoded) if self.done else len(encoded) // 4 * 4
+        self._pending = encoded[usable:]
+        return base64.b64decode(encoded[:usable]) if usable else b''
+
 class VoiceProvider(ABC):
+    # Generic audio format name -> provider-specific request value
+    AUDIO_FORMATS = {'mp3': 'mp3'}
+    
+    # Synthesis model, for providers that select one per request
+    model = None
+    
+    # Longest text accepted in a single synthesis request
+    MAX_REQUEST_CHARS = 4096
+    
     @abstractmethod
     def generate_speech(self, text: str, voice: str, output_path: str, **kwargs) -> bool:
+        """Synthesize text into output_path.
+
+        Accepts ``audio_format`` (one of ``supported_formats()``, default
+        ``'mp3'``) plus provider-specific options such as ``speed``.
+        """
         pass
     
+    def supported_formats(self) -> list:
+        """Audio formats this provider can return, in its order of preference"""
+        return list(self.AUDIO_FORMATS)
+    
     @abstractmethod
     def is_available(self) -> bool:
         pass
@@ -18,8 +127,17 @@ class VoiceProvider(ABC):
         pass
 
 class OpenAIVoiceProvider(VoiceProvider):
+    AUDIO_FORMATS = {
+        'aac': 'aac',
+        'mp3': 'mp3',
+        'opus': 'opus',
+        'flac': 'flac',
+        'wav': 'wav'
+    }
+    
     def __init__(self, config):
         self.api_key = config.get('OPENAI_API_KEY')
+        self.model = "tts-1"
         try:
             self.client = OpenAI(api_key=self.api_key) if self.api_key else None
         except Exception as e:
@@ -32,16 +150,19 @@ class OpenAIVoiceProvider(VoiceProvider):
         
         try:
             speed = kwargs.get('speed', 1.0)
-            response = self.client.audio.speech.create(
-                model="tts-1",
+            audio_format = kwargs.get('audio_format', 'mp3')
+            with self.client.audio.speech.with_streaming_response.create(
+                model=self.model,
                 voice=voice,
                 input=text,
-                speed=float(speed)
-            )
-            response.stream_to_file(output_path)
+                speed=float(speed),
+                response_format=self.AUDIO_FORMATS[audio_format]
+            ) as response:
+                response.stream_to_file(output_path, chunk_size=STREAM_CHUNK_SIZE)
             return True
         except Exception as e:
             print(f"OpenAI TTS error: {e}")
+            remove_partial_file(output_path)
             return False
     
     def is_available(self) -> bool:
@@ -58,8 +179,20 @@ class OpenAIVoiceProvider(VoiceProvider):
         ]
 
 class ElevenLabsVoiceProvider(VoiceProvider):
+    AUDIO_FORMATS = {
+        'mp3': 'mp3_44100_128',
+        'opus': 'opus_48000_128'
+    }
+    MAX_REQUEST_CHARS = 2500
+    ACCEPT_TYPES = {
+        'mp3': 'audio/mpeg',
+        'opus': 'audio/ogg'
+    }
+    
     def __init__(self, config):
         self.api_key = config.get('ELEVENLABS_API_KEY')
+        self.session = build_http_session(config.get('TTS_HTTP_POOL_SIZE', 10))
+        self.model = "eleven_monolingual_v1"
         self.base_url = "https://api.elevenlabs.io/v1"
         
         # ElevenLabs voice IDs (you may need to update these)
@@ -78,30 +211,29 @@ class ElevenLabsVoiceProvider(VoiceProvider):
         
         try:
             stability = kwargs.get('stability', 0.5)
+            audio_format = kwargs.get('audio_format', 'mp3')
             voice_id = self.voice_ids.get(voice, self.voice_ids['rachel'])
             
-            url = f"{self.base_url}/text-to-speech/{voice_id}"
+            url = f"{self.base_url}/text-to-speech/{voice_id}?output_format={self.AUDIO_FORMATS[audio_format]}"
             headers = {
-                "Accept": "audio/mpeg",
+                "Accept": self.ACCEPT_TYPES[audio_format],
                 "Content-Type": "application/json",
                 "xi-api-key": self.api_key
             }
             
             data = {
                 "text": text,
-                "model_id": "eleven_monolingual_v1",
+                "model_id": self.model,
                 "voice_settings": {
                     "stability": float(stability),
                     "similarity_boost": 0.5
                 }
             }
             
-            response = requests.post(url, json=data, headers=headers, timeout=30)
-            
-            if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
-                return True
+            with self.session.post(url, json=data, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code == 200:
+                    stream_response_to_file(response, output_path)
+                    return True
             return False
             
         except Exception as e:
@@ -122,8 +254,17 @@ class ElevenLabsVoiceProvider(VoiceProvider):
         ]
 
 class GoogleVoiceProvider(VoiceProvider):
+    AUDIO_FORMATS = {
+        'mp3': 'MP3',
+        'opus': 'OGG_OPUS',
+        'wav': 'LINEAR16'
+    }
+    # The API limit is 5000 bytes; CJK text takes three bytes per character
+    MAX_REQUEST_CHARS = 1500
+    
     def __init__(self, config):
         self.api_key = config.get('GOOGLE_CLOUD_API_KEY')
+        self.session = build_http_session(config.get('TTS_HTTP_POOL_SIZE', 10))
         self.base_url = "https://texttospeech.googleapis.com/v1/text:synthesize"
     
     def generate_speech(self, text: str, voice: str, output_path: str, **kwargs) -> bool:
@@ -132,6 +273,7 @@ class GoogleVoiceProvider(VoiceProvider):
         
         try:
             speed = kwargs.get('speed', 1.0)
+            audio_format = kwargs.get('audio_format', 'mp3')
             
             # Parse voice name to get language and name
             if voice.startswith('zh-CN'):
@@ -148,24 +290,35 @@ class GoogleVoiceProvider(VoiceProvider):
                     "name": voice
                 },
                 "audioConfig": {
-                    "audioEncoding": "MP3",
+                    "audioEncoding": self.AUDIO_FORMATS[audio_format],
                     "speakingRate": float(speed)
                 }
             }
             
             url = f"{self.base_url}?key={self.api_key}"
-            response = requests.post(url, json=data, headers=headers, timeout=30)
-            
-            if response.status_code == 200:
-                audio_content = response.json()["audioContent"]
-                audio_data = base64.b64decode(audio_content)
+            with self.session.post(url, json=data, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code != 200:
+                    return False
+                
+                # Decode audioContent as it arrives instead of parsing the whole body
+                decoder = StreamingBase64FieldDecoder('audioContent')
                 with open(output_path, 'wb') as f:
-                    f.write(audio_data)
-                return True
-            return False
+                    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        audio_data = decoder.feed(chunk)
+                        if audio_data:
+                            f.write(audio_data)
+                        if decoder.done:
+                            break
+            
+            if not decoder.done:
+                print("Google TTS error: response had no complete audioContent")
+                remove_partial_file(output_path)
+                return False
+            return True
             
         except Exception as e:
             print(f"Google TTS error: {e}")
+            remove_partial_file(output_path)
             return False
     
     def is_available(self) -> bool:
@@ -182,8 +335,16 @@ class GoogleVoiceProvider(VoiceProvider):
         ]
 
 class AzureVoiceProvider(VoiceProvider):
+    AUDIO_FORMATS = {
+        'mp3': 'audio-16khz-128kbitrate-mono-mp3',
+        'opus': 'ogg-24khz-16bit-mono-opus',
+        'wav': 'riff-24khz-16bit-mono-pcm'
+    }
+    MAX_REQUEST_CHARS = 3000
+    
     def __init__(self, config):
         self.api_key = config.get('AZURE_SPEECH_KEY')
+        self.session = build_http_session(config.get('TTS_HTTP_POOL_SIZE', 10))
         self.region = config.get('AZURE_SPEECH_REGION', 'eastus')
         self.base_url = f"https://{self.region}.tts.speech.microsoft.com/cognitiveservices/v1"
     
@@ -194,11 +355,12 @@ class AzureVoiceProvider(VoiceProvider):
         try:
             speed = kwargs.get('speed', 1.0)
             speed_percent = f"{int((speed - 1) * 100):+d}%"
+            audio_format = kwargs.get('audio_format', 'mp3')
             
             headers = {
                 "Ocp-Apim-Subscription-Key": self.api_key,
                 "Content-Type": "application/ssml+xml",
-                "X-Microsoft-OutputFormat": "audio-16khz-128kbitrate-mono-mp3"
+                "X-Microsoft-OutputFormat": self.AUDIO_FORMATS[audio_format]
             }
             
             ssml = f"""
@@ -211,12 +373,10 @@ class AzureVoiceProvider(VoiceProvider):
             </speak>
             """
             
-            response = requests.post(self.base_url, data=ssml, headers=headers, timeout=30)
-            
-            if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
-                return True
+            with self.session.post(self.base_url, data=ssml, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code == 200:
+                    stream_response_to_file(response, output_path)
+                    return True
             return False
             
         except Exception as e:
@@ -236,13 +396,100 @@ class AzureVoiceProvider(VoiceProvider):
             {'value': 'en-US-JennyNeural', 'name': 'Jenny (US Female)'}
         ]
 
-def get_voice_provider(provider_name: str, config) -> VoiceProvider:
-    providers = {
-        'openai': OpenAIVoiceProvider,
-        'elevenlabs': ElevenLabsVoiceProvider,
-        'google': GoogleVoiceProvider,
-        'azure': AzureVoiceProvider
-    }
+PROVIDER_CLASSES = {
+    'openai': OpenAIVoiceProvider,
+    'elevenlabs': ElevenLabsVoiceProvider,
+    'google': GoogleVoiceProvider,
+    'azure': AzureVoiceProvider
+}
+
+# Config values that change how providers are built
+PROVIDER_CONFIG_KEYS = (
+    'OPENAI_API_KEY', 'ELEVENLABS_API_KEY', 'GOOGLE_CLOUD_API_KEY',
+    'AZURE_SPEECH_KEY', 'AZURE_SPEECH_REGION', 'TTS_HTTP_POOL_SIZE'
+)
+
+class ProviderRegistry:
+    """Builds each voice provider once and keeps it, with its HTTP pool, for reuse.
+
+    Availability and voice lists are cached as well, since they only depend
+    on configuration.
+    """
+    
+    def __init__(self, config):
+        self.config = config
+        self._providers: Dict[str, VoiceProvider] = {}
+        self._available: Dict[str, bool] = {}
+        self._voice_lists: Dict[str, list] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, provider_name: str) -> Optional[VoiceProvider]:
+        provider_class = PROVIDER_CLASSES.get(provider_name)
+        if not provider_class:
+            return None
+        
+        provider = self._providers.get(provider_name)
+        if provider is None:
+            with self._lock:
+                provider = self._providers.get(provider_name)
+                if provider is None:
+                    provider = provider_class(self.config)
+                    self._providers[provider_name] = provider
+        return provider
+    
+    def is_available(self, provider_name: str) -> bool:
+        available = self._available.get(provider_name)
+        if available is None:
+            provider = self.get(provider_name)
+            available = provider.is_available() if provider else False
+            self._available[provider_name] = available
+        return available
+    
+    def get_voice_list(self, provider_name: str) -> Optional[list]:
+        voices = self._voice_lists.get(provider_name)
+        if voices is None:
+            provider = self.get(provider_name)
+            if not provider:
+                return None
+            voices = provider.get_voice_list()
+            self._voice_lists[provider_name] = voices
+        return voices
     
-    provider_class = providers.get(provider_name)
-    return provider_class(config) if provider_class else None
\ No newline at end of file
+    def close(self):
+        """Release pooled connections"""
+        with self._lock:
+            for provider in self._providers.values():
+                session = getattr(provider, 'session', None)
+                if session:
+                    session.close()
+            self._providers.clear()
+
+# The app uses one configuration; a few more covers tests and key rotation
+MAX_PROVIDER_REGISTRIES = 4
+
+_registries: 'OrderedDict[tuple, ProviderRegistry]' = OrderedDict()
+_registries_lock = threading.Lock()
+
+def get_provider_registry(config) -> ProviderRegistry:
+    """Return the process-wide registry for this provider configuration.
+
+    Only the most recently used few are kept; older ones have their
+    sessions closed, so rotated keys don't pin connection pools forever.
+    """
+    key = tuple(config.get(name) for name in PROVIDER_CONFIG_KEYS)
+    evicted = []
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = ProviderRegistry(config)
+            _registries[key] = registry
+            while len(_registries) > MAX_PROVIDER_REGISTRIES:
+                evicted.append(_registries.popitem(last=False)[1])
+        else:
+            _registries.move_to_end(key)
+    for old in evicted:
+        old.close()
+    return registry
+
+def get_voice_provider(provider_name: str, config) -> VoiceProvider:
+    return get_provider_registry(config).get(provider_name)
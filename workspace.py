@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Per-job scratch workspaces for intermediate files
+"""
+
+import os
+import shutil
+import socket
+import logging
+import tempfile
+import threading
+from typing import Dict, List, Optional
+import psutil
+
+WORKSPACE_PREFIX = 'job-'
+
+# Our own directory under shared scratch roots, so sweeping never touches
+# other programs' files
+APP_SCRATCH_DIR = 'quote-speak'
+
+logger = logging.getLogger(__name__)
+
+class JobWorkspace:
+    """A private scratch directory for one job, removed when the job ends.
+
+    ``cleanup`` removes the directory; callers run it in a ``finally`` so
+    it goes away on success, on failure and on any exception that unwinds
+    the job (including worker shutdown). Its name carries the owning pid,
+    so directories left behind by a killed process can be swept later.
+    """
+
+    def __init__(self, root: str, on_close=None):
+        self.root = root
+        self.path = tempfile.mkdtemp(prefix=f"{WORKSPACE_PREFIX}{os.getpid()}-", dir=root)
+        self._on_close = on_close
+        self._closed = False
+
+    def file(self, filename: str) -> str:
+        return os.path.join(self.path, filename)
+
+    def cleanup(self):
+        if self._closed:
+            return
+        self._closed = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        if self._on_close is not None:
+            self._on_close(self)
+
+class WorkspaceManager:
+    """Hand out job workspaces from the first root with enough free space.
+
+    Roots are tried in order, normally shared memory (/dev/shm) and then
+    the system temp directory, so intermediates stay in RAM unless tmpfs is
+    nearly full (Docker's default /dev/shm is only 64MB).
+    """
+
+    def __init__(self, roots: List[str], min_free_mb: float = 32):
+        self.roots = [root for root in roots if root]
+        self.min_free_mb = min_free_mb
+        self._lock = threading.Lock()
+        self._active = 0
+        self.created = 0
+        self.fallbacks = 0
+        self.counts = {root: 0 for root in self.roots}
+
+    def _free_mb(self, root: str) -> Optional[float]:
+        try:
+            os.makedirs(root, exist_ok=True)
+            if not os.access(root, os.W_OK):
+                return None
+            return shutil.disk_usage(root).free / (1024 ** 2)
+        except OSError:
+            return None
+
+    def choose_root(self, expected_mb: float = 0) -> str:
+        for root in self.roots:
+            free_mb = self._free_mb(root)
+            if free_mb is not None and free_mb >= self.min_free_mb + expected_mb:
+                return root
+        # Everything is tight; the last root (on disk) is the least bad place
+        return self.roots[-1] if self.roots else tempfile.gettempdir()
+
+    def create(self, expected_mb: float = 0) -> JobWorkspace:
+        """New workspace for a job expected to write about expected_mb of intermediates"""
+        root = self.choose_root(expected_mb)
+        workspace = JobWorkspace(root, on_close=self._closed)
+        with self._lock:
+            self._active += 1
+            self.created += 1
+            self.counts[root] = self.counts.get(root, 0) + 1
+            if self.roots and root != self.roots[0]:
+                self.fallbacks += 1
+        return workspace
+
+    def _closed(self, workspace: JobWorkspace):
+        with self._lock:
+            self._active -= 1
+
+    def sweep_stale(self) -> int:
+        """Remove workspaces whose owning process no longer exists"""
+        removed = 0
+        for root in self.roots:
+            try:
+                names = os.listdir(root)
+            except OSError:
+                continue
+            for name in names:
+                if not name.startswith(WORKSPACE_PREFIX):
+                    continue
+                pid = name[len(WORKSPACE_PREFIX):].split('-', 1)[0]
+                if not pid.isdigit() or psutil.pid_exists(int(pid)):
+                    continue
+                path = os.path.join(root, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+        if removed:
+            logger.info(f"Removed {removed} stale job workspaces")
+        return removed
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'active': self._active,
+                'created': self.created,
+                'fallbacks': self.fallbacks,
+                'by_root': dict(self.counts)
+            }
+
+def default_workspace_roots(preferred: Optional[str] = None) -> List[str]:
+    """Shared memory when the host has it, then the system temp directory.
+
+    Each is narrowed to an app directory per host name: pids only mean
+    something within one container, and /tmp may be shared between them.
+    """
+    shared = [] if preferred else [path for path in ('/dev/shm',) if os.path.isdir(path)]
+    shared.append(tempfile.gettempdir())
+    roots = [preferred] if preferred else []
+    roots += [os.path.join(path, APP_SCRATCH_DIR, socket.gethostname()) for path in shared]
+    return roots
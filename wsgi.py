@@ -3,11 +3,9 @@
 WSGI entry point for production deployment
 """
 
-import os
-from app import create_app
-
-# Create the application instance
-application = create_app(os.environ.get('FLASK_ENV', 'production'))
+# app.py already builds the application at import; building a second one
+# would double the generator, worker pool and cleanup scheduler per process
+from app import app as application
 
 if __name__ == "__main__":
     application.run()
\ No newline at end of file